@@ -9,7 +9,23 @@ from app.schemas.storage import (
     DriveListResponse, StorageOverviewResponse, UserMigrationRequest
 )
 from app.services.storage import storage_service, drive_management_service
-from app.auth.auth import verify_password, get_password_hash
+from app.services.usage import usage_service
+from app.services.fs_ops import fs_ops
+from app.services.blobs import blob_store
+from app.services.integrity import integrity_service
+from app.services.trash_cleanup import trash_cleanup_service
+from app.services.catalog_sync import catalog_sync_service
+from app.services.drive_watcher import drive_watcher_service
+from app.services.events import event_bus
+from app.services.file_delivery import get_delivery_stats
+from app.auth.auth import (
+    verify_password,
+    get_password_hash,
+    verify_password_async,
+    get_password_hash_async,
+    password_hashing_pool
+)
+from app.auth.cache import auth_cache
 from typing import List, Union
 from datetime import datetime
 from pydantic import BaseModel
@@ -40,12 +56,12 @@ def get_admin_credentials(session: Session):
     
     return admin_creds.username, admin_creds.password_hash
 
-def save_admin_credentials(session: Session, username: str, password: str):
+async def save_admin_credentials(session: Session, username: str, password: str):
     """Save admin credentials to database"""
     statement = select(AdminCredentials).where(AdminCredentials.username == username)
     admin_creds = session.exec(statement).first()
     
-    password_hash = get_password_hash(password)
+    password_hash = await get_password_hash_async(password)
     
     if admin_creds:
         admin_creds.password_hash = password_hash
@@ -69,6 +85,8 @@ def verify_admin_credentials(credentials: HTTPBasicCredentials = Depends(securit
         if (credentials.username == stored_username and 
             verify_password(credentials.password, stored_password_hash)):
             return f"admin:{credentials.username}"
+    except HTTPException:
+        raise
     except Exception:
         pass
     
@@ -84,6 +102,8 @@ def verify_admin_credentials(credentials: HTTPBasicCredentials = Depends(securit
         
         if user and verify_password(credentials.password, user.password_hash):
             return f"user:{user.email}"
+    except HTTPException:
+        raise
     except Exception:
         pass
     
@@ -106,7 +126,9 @@ async def get_all_users(
     user_responses = []
     for user in users:
         storage_quota_gb = user.storage_quota_gb or 20.0
-        storage_used_bytes = storage_service.get_user_storage_size(
+        storage_used_bytes = await fs_ops.run(
+            "metadata",
+            usage_service.get_user_usage,
             user.storage_id,
             drive_id=user.storage_drive_id
         )
@@ -219,6 +241,7 @@ async def approve_or_reject_user(
     try:
         session.commit()
         session.refresh(user)
+        auth_cache.invalidate_user(user.email)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -254,6 +277,7 @@ async def toggle_user_admin_role(
     try:
         session.commit()
         session.refresh(user)
+        auth_cache.invalidate_user(user.email)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -289,7 +313,7 @@ async def change_admin_password(
         username, current_password_hash = get_admin_credentials(session)
         
         # Verify current password
-        if not verify_password(password_data.current_password, current_password_hash):
+        if not await verify_password_async(password_data.current_password, current_password_hash):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Current password is incorrect"
@@ -297,7 +321,7 @@ async def change_admin_password(
         
         # Save new password
         try:
-            save_admin_credentials(session, username, password_data.new_password)
+            await save_admin_credentials(session, username, password_data.new_password)
             return {"message": "Admin password changed successfully"}
         except Exception as e:
             raise HTTPException(
@@ -317,7 +341,7 @@ async def change_admin_password(
             )
         
         # Verify current password
-        if not verify_password(password_data.current_password, user.password_hash):
+        if not await verify_password_async(password_data.current_password, user.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Current password is incorrect"
@@ -325,7 +349,7 @@ async def change_admin_password(
         
         # Save new password
         try:
-            user.password_hash = get_password_hash(password_data.new_password)
+            user.password_hash = await get_password_hash_async(password_data.new_password)
             session.commit()
             return {"message": "Password changed successfully"}
         except Exception as e:
@@ -353,7 +377,7 @@ async def change_user_password(
     
     # Hash new password and save
     try:
-        user.password_hash = get_password_hash(password_data.new_password)
+        user.password_hash = await get_password_hash_async(password_data.new_password)
         session.commit()
         session.refresh(user)
         
@@ -393,7 +417,9 @@ async def update_user_storage_quota(
         )
 
     # Prevent lowering quota below current usage
-    current_usage_bytes = storage_service.get_user_storage_size(
+    current_usage_bytes = await fs_ops.run(
+        "metadata",
+        usage_service.get_user_usage,
         user.storage_id,
         drive_id=user.storage_drive_id
     )
@@ -411,6 +437,7 @@ async def update_user_storage_quota(
         session.add(user)
         session.commit()
         session.refresh(user)
+        auth_cache.invalidate_user(user.email)
 
         return {
             "message": "Storage quota updated successfully",
@@ -423,6 +450,42 @@ async def update_user_storage_quota(
             detail=f"Failed to update storage quota: {str(e)}"
         )
 
+@router.post("/users/{user_id}/storage-usage/recompute")
+async def recompute_user_storage_usage(
+    user_id: int,
+    admin_user: str = Depends(verify_admin_credentials),
+    session: Session = Depends(get_session)
+):
+    """Rebuild a user's storage usage ledger from disk"""
+    statement = select(User).where(User.id == user_id)
+    user = session.exec(statement).first()
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    try:
+        usage = await fs_ops.run(
+            "scan",
+            usage_service.recompute_user_usage,
+            user.storage_id,
+            drive_id=user.storage_drive_id
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to recompute storage usage: {str(e)}"
+        )
+
+    return {
+        "message": "Storage usage recomputed successfully",
+        "user_id": user.id,
+        "storage_used_bytes": sum(usage.values()),
+        "usage_breakdown": usage
+    }
+
 # Storage Management Endpoints
 
 @router.get("/storage/overview", response_model=StorageOverviewResponse)
@@ -521,6 +584,7 @@ async def update_drive(
             description=drive_data.description,
             status=drive_data.status
         )
+        auth_cache.invalidate_storage_paths()
         if not updated_drive:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -544,6 +608,7 @@ async def set_default_drive(
     """Set a drive as the default drive for new users"""
     try:
         success = drive_management_service.set_default_drive(drive_id)
+        auth_cache.invalidate_storage_paths()
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -568,6 +633,7 @@ async def remove_drive(
     """Remove a storage drive (use force=true if drive has users)"""
     try:
         success = drive_management_service.remove_drive(drive_id, force=force)
+        auth_cache.invalidate_storage_paths()
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -582,6 +648,19 @@ async def remove_drive(
             detail=f"Failed to remove drive: {str(e)}"
         )
 
+@router.get("/storage/dedup")
+async def get_dedup_report(
+    refresh: bool = False,
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Space saved per drive by the deduplicating blob store"""
+    if refresh:
+        await fs_ops.run("scan", blob_store.collect_garbage)
+    return {
+        "enabled": blob_store.enabled,
+        "drives": await fs_ops.run("metadata", blob_store.dedup_report)
+    }
+
 @router.get("/storage/drives/{drive_id}/usage", response_model=DriveUsageResponse)
 async def get_drive_usage(
     drive_id: int,
@@ -604,3 +683,77 @@ async def get_drive_usage(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to get drive usage: {str(e)}"
         )
+
+@router.get("/metrics/auth-cache")
+async def get_auth_cache_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Hit/miss counters for the authenticated user lookup cache"""
+    return auth_cache.get_stats()
+
+@router.get("/metrics/password-hashing")
+async def get_password_hashing_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Concurrency and queueing counters for the bcrypt worker pool"""
+    return password_hashing_pool.get_stats()
+
+@router.get("/metrics/fs-ops")
+async def get_fs_ops_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Per-kind concurrency counters for the filesystem operations pool"""
+    return fs_ops.get_stats()
+
+@router.get("/metrics/trash-purge")
+async def get_trash_purge_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Progress counters for the expiry-driven trash purge"""
+    return trash_cleanup_service.get_stats()
+
+@router.get("/metrics/catalog-sync")
+async def get_catalog_sync_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Counters for the file catalog reconciliation worker"""
+    return catalog_sync_service.get_stats()
+
+@router.get("/metrics/drive-watcher")
+async def get_drive_watcher_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Watch and event counters for the external change watcher"""
+    return drive_watcher_service.get_stats()
+
+@router.get("/metrics/event-streams")
+async def get_event_stream_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Open event stream subscriptions"""
+    return event_bus.get_stats()
+
+@router.get("/metrics/file-delivery")
+async def get_file_delivery_metrics(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Download delivery mode and which path sent large bodies"""
+    return get_delivery_stats()
+
+@router.get("/integrity/status")
+async def get_integrity_status(
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Progress of the checksum scrubber on each drive"""
+    return integrity_service.get_stats()
+
+@router.get("/integrity/mismatches")
+async def get_integrity_mismatches(
+    limit: int = 100,
+    offset: int = 0,
+    admin_user: str = Depends(verify_admin_credentials)
+):
+    """Files whose content no longer matches the checksum recorded for them"""
+    return {
+        "mismatches": await fs_ops.run("metadata", integrity_service.list_mismatches, min(max(limit, 1), 1000), max(offset, 0))
+    }
@@ -5,8 +5,8 @@ from app.schemas.auth import (
     UserCreate, UserLogin, UserResponse, Token
 )
 from app.auth.auth import (
-    verify_password, 
-    get_password_hash, 
+    verify_password_async, 
+    get_password_hash_async, 
     create_access_token, 
     create_refresh_token
 )
@@ -45,7 +45,7 @@ async def register(user: UserCreate, session: Session = Depends(get_session)):
     storage_drive_id = default_drive.id if default_drive else None
     
     # Create new user with pending status (will be approved by admin)
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(
         email=user.email,
         password_hash=hashed_password,
@@ -91,7 +91,7 @@ async def login(user: UserLogin, session: Session = Depends(get_session)):
     statement = select(User).where(User.email == user.email)
     db_user = session.exec(statement).first()
     
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+    if not db_user or not await verify_password_async(user.password, db_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
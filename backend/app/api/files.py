@@ -1,82 +1,72 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, Response, Header
 from sqlmodel import Session
-from app.models.database import get_session, User
+from sqlalchemy.exc import IntegrityError
+from app.models.database import get_session, User, TrashItem
 from app.auth.dependencies import get_current_user, get_current_user_storage
 from app.services.storage import storage_service
+from app.services.usage import usage_service
+from app.services.file_delivery import build_file_response, file_version, content_disposition
+from app.services.archives import stream_zip, collect_archive_entries, ARCHIVE_COMPRESSION_MODES
+from app.services.photo_index import photo_index_service, is_image_file
+from app.services.search_index import search_index_service
+from app.services.fs_ops import fs_ops
+from app.services.blobs import new_content_hasher
+from app.services.integrity import integrity_service, digest_header_value, CHECKSUM_ALGORITHM
+from app.services.trash import trash_catalog_service, trash_dir_for, TRASH_RETENTION_DAYS
+from app.services.deletion_jobs import deletion_job_service, DeletionJobNotFoundError
+from app.services.change_journal import change_journal_service, encode_change_cursor, decode_change_cursor
+from app.services.events import (
+    event_bus,
+    format_sse,
+    TooManySubscribersError,
+    EVENT_STREAM_HEARTBEAT_SECONDS,
+    EVENT_STREAM_MAX_PER_USER
+)
+from app.services.thumbnails import thumbnail_service, THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+from app.services.uploads import (
+    upload_service,
+    QuotaExceededError,
+    UploadSessionNotFoundError,
+    UploadOffsetMismatchError,
+    UploadIncompleteError
+)
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import os
-import shutil
 from pathlib import Path
 import mimetypes
-from datetime import datetime, timedelta
+from functools import partial
+import shutil
+from datetime import datetime
+from typing import List, Optional
 import json
-from PIL import Image, ExifTags
-from PIL.ExifTags import TAGS
+import base64
 
 router = APIRouter(prefix="/files", tags=["files"])
 
-def extract_photo_metadata(file_path):
-    """Extract metadata from photo files including EXIF data"""
-    try:
-        # Default metadata
-        metadata = {
-            "date_taken": None,
-            "camera_make": None,
-            "camera_model": None,
-            "location": None
-        }
-        
-        # Check if it's an image file
-        try:
-            with Image.open(file_path) as image:
-                # Extract EXIF data
-                exif_data = image.getexif()
-                
-                if exif_data:
-                    # Get date taken
-                    for tag_id, value in exif_data.items():
-                        tag = TAGS.get(tag_id, tag_id)
-                        
-                        if tag == "DateTime":
-                            try:
-                                # Parse EXIF date format: "YYYY:MM:DD HH:MM:SS"
-                                date_taken = datetime.strptime(str(value), "%Y:%m:%d %H:%M:%S")
-                                metadata["date_taken"] = date_taken.isoformat()
-                            except (ValueError, TypeError):
-                                pass
-                        elif tag == "Make":
-                            metadata["camera_make"] = str(value).strip()
-                        elif tag == "Model":
-                            metadata["camera_model"] = str(value).strip()
-                        elif tag == "GPSInfo":
-                            # GPS data extraction could be added here
-                            pass
-                            
-        except Exception:
-            # Not an image file or can't read EXIF data
-            pass
-            
-        return metadata
-    except Exception:
-        return {
-            "date_taken": None,
-            "camera_make": None,
-            "camera_model": None,
-            "location": None
-        }
-
 @router.get("/storage-info")
 async def get_storage_info(
+    refresh: bool = Query(False, description="Recompute usage from disk instead of reading the ledger"),
     current_user: User = Depends(get_current_user),
     storage_paths: dict = Depends(get_current_user_storage)
 ):
     """Get current user's storage information"""
     user_quota_gb = current_user.storage_quota_gb or 20.0
-    storage_size = storage_service.get_user_storage_size(
-        current_user.storage_id, 
-        drive_id=current_user.storage_drive_id
-    )
+    if refresh:
+        usage_breakdown = await fs_ops.run(
+            "scan",
+            usage_service.recompute_user_usage,
+            current_user.storage_id,
+            drive_id=current_user.storage_drive_id
+        )
+    else:
+        usage_breakdown = await fs_ops.run(
+            "metadata",
+            usage_service.get_usage_breakdown,
+            current_user.storage_id,
+            drive_id=current_user.storage_drive_id
+        )
+    storage_size = sum(usage_breakdown.values())
     
     # Get drive information
     drive_info = None
@@ -96,15 +86,56 @@ async def get_storage_info(
         "storage_paths": storage_paths,
         "storage_size_bytes": storage_size,
         "storage_size_mb": round(storage_size / (1024 * 1024), 2),
+        "storage_usage_breakdown": usage_breakdown,
         "storage_quota_gb": user_quota_gb,
         "storage_quota_bytes": int(user_quota_gb * 1024 * 1024 * 1024),
         "drive_info": drive_info
     }
 
+LIST_SORT_FIELDS = ("name", "size", "mtime", "date_taken")
+
+def _encode_list_cursor(sort, order, key):
+    payload = json.dumps({"sort": sort, "order": order, "key": list(key)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_list_cursor(cursor, sort, order):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if payload["sort"] != sort or payload["order"] != order:
+            raise ValueError("cursor was issued for a different sort")
+        is_file, primary, name_lower, name = payload["key"]
+        return (bool(is_file), primary, name_lower, name)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def _scan_directory(target_dir):
+    """One pass over a directory; DirEntry caches the type, one stat per entry"""
+    entries = []
+    with os.scandir(target_dir) as scanner:
+        for entry in scanner:
+            # Skip hidden files and system files
+            if entry.name.startswith('.'):
+                continue
+            try:
+                is_directory = entry.is_dir()
+                stat_result = entry.stat()
+            except OSError:
+                continue
+            entries.append((entry.name, is_directory, stat_result))
+    return entries
+
 @router.get("/list")
 async def list_files(
     path: str = "",  # Relative path within user's storage area
     context: str = "drive",  # "drive" or "photos" - determines which storage area to use
+    sort: str = Query("name", description="Sort by: name, size, mtime or date_taken (folders always come first)"),
+    order: str = Query("asc", description="Sort order: 'asc' or 'desc'"),
+    limit: Optional[int] = Query(None, ge=1, le=5000, description="Page size; omit to return the whole directory"),
+    cursor: Optional[str] = Query(None, description="Continuation token from a previous page's next_cursor"),
     current_user: User = Depends(get_current_user),
     storage_paths: dict = Depends(get_current_user_storage)
 ):
@@ -117,6 +148,20 @@ async def list_files(
             detail="Context must be either 'drive' or 'photos'"
         )
     
+    if sort not in LIST_SORT_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Sort must be one of: {', '.join(LIST_SORT_FIELDS)}"
+        )
+    
+    if order not in ["asc", "desc"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Order must be either 'asc' or 'desc'"
+        )
+    
+    after_key = _decode_list_cursor(cursor, sort, order) if cursor else None
+    
     # Construct full path based on context
     base_path = storage_paths[f"{context}_path"]
     if path:
@@ -134,55 +179,108 @@ async def list_files(
         )
     
     try:
+        entries = await fs_ops.run("metadata", _scan_directory, target_dir)
+        
+        def rel_path_of(name):
+            return os.path.relpath(os.path.join(target_dir, name), base_path).replace(os.sep, '/')
+        
+        def is_photo(name, is_directory):
+            return context == "photos" and not is_directory and is_image_file(name)
+        
+        # date_taken sorting needs indexed metadata for every photo in the folder
+        date_taken_by_name = {}
+        if sort == "date_taken":
+            photo_names = [name for name, is_directory, _ in entries if is_photo(name, is_directory)]
+            if photo_names:
+                photo_index_service.ensure_user_scanned(current_user.storage_id, base_path)
+                rows = await fs_ops.run(
+                    "metadata",
+                    photo_index_service.lookup,
+                    current_user.storage_id, [rel_path_of(name) for name in photo_names]
+                )
+                for name in photo_names:
+                    row = rows.get(rel_path_of(name))
+                    if row is not None and row.date_taken:
+                        date_taken_by_name[name] = row.date_taken
+        
+        def sort_key(item):
+            name, is_directory, stat_result = item
+            if sort == "size":
+                primary = 0 if is_directory else stat_result.st_size
+            elif sort == "mtime":
+                primary = stat_result.st_mtime
+            elif sort == "date_taken":
+                primary = date_taken_by_name.get(name) or datetime.fromtimestamp(stat_result.st_mtime).isoformat()
+            else:
+                primary = name.lower()
+            # Name tie-breakers keep the order total, so cursors stay stable
+            return (not is_directory, primary, name.lower(), name)
+        
+        # Folders first, then files; each group in the requested order
+        descending = order == "desc"
+        keyed = [(sort_key(item), item) for item in entries]
+        folders = sorted((k for k in keyed if not k[0][0]), key=lambda k: k[0], reverse=descending)
+        files = sorted((k for k in keyed if k[0][0]), key=lambda k: k[0], reverse=descending)
+        ordered = folders + files
+        
+        if after_key is not None:
+            def comes_after(key):
+                if key[0] != after_key[0]:
+                    return key[0] > after_key[0]
+                return key[1:] < after_key[1:] if descending else key[1:] > after_key[1:]
+            ordered = [k for k in ordered if comes_after(k[0])]
+        
+        page = ordered[:limit] if limit else ordered
+        has_more = len(page) < len(ordered)
+        
         items = []
-        for item_name in os.listdir(target_dir):
-            item_path = os.path.join(target_dir, item_name)
-            
-            # Skip hidden files and system files
-            if item_name.startswith('.'):
-                continue
-            
+        photo_items = []
+        for _, (item_name, is_directory, stat_result) in page:
             item_info = {
                 "name": item_name,
                 "path": os.path.join(path, item_name) if path else item_name,
-                "type": "folder" if os.path.isdir(item_path) else "file",
-                "is_directory": os.path.isdir(item_path),
-                "modified": datetime.fromtimestamp(os.path.getmtime(item_path)).isoformat(),
+                "type": "folder" if is_directory else "file",
+                "is_directory": is_directory,
+                "modified": datetime.fromtimestamp(stat_result.st_mtime).isoformat(),
             }
             
-            if not item_info["is_directory"]:
+            if not is_directory:
                 # File-specific info
                 item_info.update({
-                    "size": os.path.getsize(item_path),
-                    "mimeType": mimetypes.guess_type(item_path)[0] or "application/octet-stream"
+                    "size": stat_result.st_size,
+                    "mimeType": mimetypes.guess_type(item_name)[0] or "application/octet-stream",
+                    "version": file_version(stat_result)
                 })
                 
-                # For photos context, extract additional metadata from image files
-                if context == "photos":
-                    mime_type = item_info["mimeType"]
-                    if mime_type and mime_type.startswith('image/'):
-                        photo_metadata = extract_photo_metadata(item_path)
-                        item_info.update(photo_metadata)
-                        
-                        # Use date_taken as the primary date if available, otherwise use modified date
-                        if photo_metadata["date_taken"]:
-                            item_info["date_taken"] = photo_metadata["date_taken"]
-                        else:
-                            item_info["date_taken"] = item_info["modified"]
+                # For photos context, image metadata is resolved from the index below
+                if is_photo(item_name, is_directory):
+                    photo_items.append((item_info, rel_path_of(item_name), stat_result))
             
             items.append(item_info)
         
-        # Sort: directories first, then files, both alphabetically
-        items.sort(key=lambda x: (not x["is_directory"], x["name"].lower()))
+        if photo_items:
+            await fs_ops.run("metadata", _apply_photo_metadata, current_user.storage_id, base_path, photo_items)
         
-        return {
+        folder_count = sum(1 for _, is_directory, _ in entries if is_directory)
+        response = {
             "path": path,
             "items": items,
-            "total_count": len(items),
-            "folder_count": sum(1 for item in items if item["is_directory"]),
-            "file_count": sum(1 for item in items if not item["is_directory"])
+            "total_count": len(entries),
+            "folder_count": folder_count,
+            "file_count": len(entries) - folder_count
         }
         
+        if limit:
+            response.update({
+                "sort": sort,
+                "order": order,
+                "limit": limit,
+                "has_more": has_more,
+                "next_cursor": _encode_list_cursor(sort, order, page[-1][0]) if has_more else None
+            })
+        
+        return response
+        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -226,20 +324,21 @@ async def upload_file(
     except Exception:
         upload_size_bytes = 0
 
-    current_usage_bytes = storage_service.get_user_storage_size(
-        current_user.storage_id,
-        drive_id=current_user.storage_drive_id
-    )
     user_quota_gb = current_user.storage_quota_gb or 20.0
     quota_bytes = int(user_quota_gb * 1024 * 1024 * 1024)
 
-    if upload_size_bytes > 0 and (current_usage_bytes + upload_size_bytes) > quota_bytes:
-        available_bytes = max(0, quota_bytes - current_usage_bytes)
+    # Hold the quota while the file is written, so concurrent uploads cannot share the headroom
+    if not await fs_ops.run(
+        "metadata", upload_service.reserve_request,
+        current_user.storage_id, upload_size_bytes, quota_bytes, current_user.storage_drive_id
+    ):
+        available_bytes, user_quota_gb = await _upload_quota_status(current_user)
         available_mb = round(available_bytes / (1024 * 1024), 2)
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"Storage quota exceeded. Available: {available_mb} MB of {user_quota_gb} GB"
         )
+    reserved_bytes = upload_size_bytes
     
     # Sanitize filename
     safe_filename = storage_service.sanitize_filename(file.filename)
@@ -253,29 +352,42 @@ async def upload_file(
     else:
         target_dir = base_path
     
-    # Ensure target directory exists
-    os.makedirs(target_dir, exist_ok=True)
-    
-    target_file_path = os.path.join(target_dir, safe_filename)
-    
-    # Check if file already exists
-    if os.path.exists(target_file_path):
-        # Create a unique filename
-        name, ext = os.path.splitext(safe_filename)
-        counter = 1
-        while os.path.exists(os.path.join(target_dir, f"{name}({counter}){ext}")):
-            counter += 1
-        safe_filename = f"{name}({counter}){ext}"
-        target_file_path = os.path.join(target_dir, safe_filename)
+    # Write to a hidden temp file first, so nothing sees (or counts) a partial upload
+    temp_path = upload_service.temp_file_path(target_dir)
     
     try:
+        # Ensure target directory exists
+        await fs_ops.makedirs(target_dir)
+        
         # Save file
-        with open(target_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        hasher = new_content_hasher()
+        await fs_ops.copy_fileobj(file.file, temp_path, hasher)
+        
+        # The size could not be read up front: reserve what was actually written
+        file_size = await fs_ops.run("metadata", os.path.getsize, temp_path)
+        if file_size > reserved_bytes:
+            if not await fs_ops.run(
+                "metadata", upload_service.reserve_request,
+                current_user.storage_id, file_size - reserved_bytes, quota_bytes, current_user.storage_drive_id
+            ):
+                raise QuotaExceededError()
+            reserved_bytes = file_size
         
-        # Get file info
-        file_size = os.path.getsize(target_file_path)
+        # Rename into place under a non-clashing name, swapping the reservation for its bytes in one step
+        target_file_path, safe_filename = await fs_ops.run(
+            "write", upload_service.commit_file,
+            temp_path, target_dir, safe_filename, current_user.storage_id, context,
+            partial(_catalog_added, storage_paths['user_path'], context, base_path),
+            reserved_bytes
+        )
+        reserved_bytes = 0
+        digest = hasher.hexdigest()
+        await fs_ops.run("write", upload_service.store_content, target_file_path, digest, file_size)
         file_type = mimetypes.guess_type(target_file_path)[0] or "application/octet-stream"
+        await fs_ops.run(
+            "metadata", _index_uploaded_file,
+            storage_paths, current_user.storage_id, context, base_path, target_file_path
+        )
         
         return {
             "message": "File uploaded successfully",
@@ -283,17 +395,379 @@ async def upload_file(
             "original_filename": file.filename,
             "size": file_size,
             "type": file_type,
-            "path": os.path.join(path, safe_filename) if path else safe_filename
+            "path": os.path.join(path, safe_filename) if path else safe_filename,
+            "checksum": {"algorithm": CHECKSUM_ALGORITHM, "digest": digest}
         }
         
+    except QuotaExceededError:
+        await fs_ops.run("delete", _remove_if_exists, temp_path)
+        await fs_ops.run("metadata", upload_service.release_request, current_user.storage_id, reserved_bytes)
+        available_bytes, user_quota_gb = await _upload_quota_status(current_user)
+        available_mb = round(available_bytes / (1024 * 1024), 2)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Storage quota exceeded. Available: {available_mb} MB of {user_quota_gb} GB"
+        )
     except Exception as e:
         # Clean up on error
-        if os.path.exists(target_file_path):
-            os.remove(target_file_path)
+        await fs_ops.run("delete", _remove_if_exists, temp_path)
+        await fs_ops.run("metadata", upload_service.release_request, current_user.storage_id, reserved_bytes)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {str(e)}"
+        )
+
+@router.post("/upload/stream")
+async def upload_file_stream(
+    request: Request,
+    filename: str = Query(..., description="Name of the uploaded file"),
+    path: str = Query("", description="Relative path within user's storage area"),
+    context: str = Query("drive", description="Storage context: 'drive' or 'photos'"),
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """
+    Upload a file sent as the raw request body (no multipart spooling).
+    Quota for the Content-Length is reserved before reading, and any bytes
+    beyond it are reserved as the body streams into the destination directory.
+    """
+    
+    # Validate context
+    if context not in ["drive", "photos"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Context must be either 'drive' or 'photos'"
+        )
+    
+    # Validate file
+    if not filename.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No file provided"
+        )
+    
+    user_quota_gb = current_user.storage_quota_gb or 20.0
+    quota_bytes = int(user_quota_gb * 1024 * 1024 * 1024)
+    
+    # Reserved before the body is read, so an upload that does not fit is rejected up front
+    declared_size = 0
+    content_length = request.headers.get("content-length")
+    if content_length:
+        try:
+            declared_size = int(content_length)
+        except ValueError:
+            declared_size = -1
+        if declared_size < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid Content-Length header"
+            )
+    
+    # Sanitize filename
+    safe_filename = storage_service.sanitize_filename(filename)
+    
+    # Construct full path based on context
+    base_path = storage_paths[f"{context}_path"]
+    if path:
+        # Ensure path is safe and within user's storage
+        safe_path = storage_service.sanitize_path(path)
+        target_dir = os.path.join(base_path, safe_path)
+    else:
+        target_dir = base_path
+    
+    try:
+        target_file_path, safe_filename, file_size, digest = await upload_service.write_stream(
+            request.stream(),
+            target_dir,
+            safe_filename,
+            storage_id=current_user.storage_id,
+            context=context,
+            quota_bytes=quota_bytes,
+            drive_id=current_user.storage_drive_id,
+            expected_size=declared_size,
+            on_commit=partial(_catalog_added, storage_paths['user_path'], context, base_path)
+        )
+    except QuotaExceededError:
+        available_bytes, user_quota_gb = await _upload_quota_status(current_user)
+        available_mb = round(available_bytes / (1024 * 1024), 2)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Storage quota exceeded. Available: {available_mb} MB of {user_quota_gb} GB"
+        )
+    except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload file: {str(e)}"
         )
+    
+    await fs_ops.run(
+        "metadata", _index_uploaded_file,
+        storage_paths, current_user.storage_id, context, base_path, target_file_path
+    )
+    file_type = mimetypes.guess_type(target_file_path)[0] or "application/octet-stream"
+    
+    return {
+        "message": "File uploaded successfully",
+        "filename": safe_filename,
+        "original_filename": filename,
+        "size": file_size,
+        "type": file_type,
+        "path": os.path.join(path, safe_filename) if path else safe_filename,
+        "checksum": {"algorithm": CHECKSUM_ALGORITHM, "digest": digest}
+    }
+
+class CreateUploadSessionRequest(BaseModel):
+    filename: str
+    size: int  # Total number of bytes the client will send
+    path: str = ""  # Relative path within user's storage area
+    context: str = "drive"  # "drive" or "photos" - determines which storage area to use
+
+async def _upload_quota_status(current_user: User):
+    """Return (available bytes, quota GB) for the current user from the usage ledger"""
+    current_usage_bytes = await fs_ops.run(
+        "metadata",
+        usage_service.get_user_usage,
+        current_user.storage_id,
+        drive_id=current_user.storage_drive_id
+    )
+    user_quota_gb = current_user.storage_quota_gb or 20.0
+    quota_bytes = int(user_quota_gb * 1024 * 1024 * 1024)
+    return max(0, quota_bytes - current_usage_bytes), user_quota_gb
+
+@router.post("/uploads", status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_request: CreateUploadSessionRequest,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """Start a resumable upload; chunks are then sent with PATCH /uploads/{upload_id}"""
+    
+    # Validate context
+    if session_request.context not in ["drive", "photos"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Context must be either 'drive' or 'photos'"
+        )
+    
+    if not session_request.filename.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No file provided"
+        )
+    
+    if session_request.size < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload size cannot be negative"
+        )
+    
+    available_bytes, user_quota_gb = await _upload_quota_status(current_user)
+    if session_request.size > available_bytes:
+        available_mb = round(available_bytes / (1024 * 1024), 2)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Storage quota exceeded. Available: {available_mb} MB of {user_quota_gb} GB"
+        )
+    
+    try:
+        upload_session = await fs_ops.run(
+            "metadata",
+            upload_service.create_session,
+            storage_paths['user_path'],
+            current_user.storage_id,
+            context=session_request.context,
+            path=storage_service.sanitize_path(session_request.path) if session_request.path else "",
+            filename=storage_service.sanitize_filename(session_request.filename),
+            size=session_request.size,
+            quota_bytes=int(user_quota_gb * 1024 * 1024 * 1024),
+            drive_id=current_user.storage_drive_id
+        )
+    except QuotaExceededError:
+        # Other sessions or uploads took the headroom since the check above
+        available_bytes, user_quota_gb = await _upload_quota_status(current_user)
+        available_mb = round(available_bytes / (1024 * 1024), 2)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Storage quota exceeded. Available: {available_mb} MB of {user_quota_gb} GB"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create upload session: {str(e)}"
+        )
+    
+    response.headers["Location"] = f"{request.url.path.rstrip('/')}/{upload_session['upload_id']}"
+    response.headers["Upload-Offset"] = str(upload_session["offset"])
+    response.headers["Upload-Length"] = str(upload_session["size"])
+    return upload_session
+
+@router.head("/uploads/{upload_id}")
+async def get_upload_offset(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """Report how many bytes of a resumable upload the server already has"""
+    try:
+        upload_session = await fs_ops.run("metadata", upload_service.get_session, storage_paths['user_path'], upload_id)
+    except UploadSessionNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    
+    return Response(
+        status_code=status.HTTP_200_OK,
+        headers={
+            "Upload-Offset": str(upload_session["offset"]),
+            "Upload-Length": str(upload_session["size"]),
+            "Upload-Expires": upload_session["expires_at"],
+            "Cache-Control": "no-store"
+        }
+    )
+
+@router.patch("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """Append the request body to a resumable upload at the given offset"""
+    try:
+        new_offset = await upload_service.append_chunk(
+            storage_paths['user_path'],
+            upload_id,
+            upload_offset,
+            request.stream()
+        )
+    except UploadSessionNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    except UploadOffsetMismatchError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload offset mismatch, server has {e.expected_offset} bytes",
+            headers={"Upload-Offset": str(e.expected_offset)}
+        )
+    except QuotaExceededError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Chunk extends past the declared upload size"
+        )
+    
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={"Upload-Offset": str(new_offset)}
+    )
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """Move a fully received resumable upload into the user's storage area"""
+    try:
+        upload_session = await fs_ops.run("metadata", upload_service.get_session, storage_paths['user_path'], upload_id)
+    except UploadSessionNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    
+    # Sessions from before quota reservations: quota may have been used up since they started
+    available_bytes, user_quota_gb = await _upload_quota_status(current_user)
+    if not upload_session.get("reserved") and upload_session["size"] > available_bytes:
+        available_mb = round(available_bytes / (1024 * 1024), 2)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Storage quota exceeded. Available: {available_mb} MB of {user_quota_gb} GB"
+        )
+    
+    context = upload_session["context"]
+    path = upload_session["path"]
+    base_path = storage_paths[f"{context}_path"]
+    target_dir = os.path.join(base_path, path) if path else base_path
+    
+    # Hashing a large upload takes a while; stream clients can follow along
+    event_key = f"upload:{upload_id}"
+    def publish_upload(stage: str, final: bool = False, **data):
+        event_bus.publish_progress(
+            current_user.storage_id, "upload", event_key,
+            dict(upload_id=upload_id, stage=stage, size=upload_session["size"], **data),
+            final=final
+        )
+    
+    publish_upload("finalizing")
+    try:
+        target_file_path, safe_filename, file_size, digest = await upload_service.finalize_session(
+            storage_paths['user_path'],
+            current_user.storage_id,
+            upload_id,
+            target_dir,
+            on_hash_progress=lambda hashed: publish_upload("hashing", bytes_hashed=hashed),
+            on_commit=partial(_catalog_added, storage_paths['user_path'], context, base_path)
+        )
+    except UploadSessionNotFoundError:
+        publish_upload("failed", final=True)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    except UploadIncompleteError:
+        publish_upload("failed", final=True)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is not complete",
+            headers={"Upload-Offset": str(upload_session["offset"])}
+        )
+    except Exception as e:
+        publish_upload("failed", final=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to finalize upload: {str(e)}"
+        )
+    
+    await fs_ops.run(
+        "metadata", _index_uploaded_file,
+        storage_paths, current_user.storage_id, context, base_path, target_file_path
+    )
+    file_type = mimetypes.guess_type(target_file_path)[0] or "application/octet-stream"
+    relative_path = os.path.join(path, safe_filename) if path else safe_filename
+    publish_upload("completed", final=True, bytes_hashed=file_size, context=context, path=relative_path)
+    
+    return {
+        "message": "File uploaded successfully",
+        "filename": safe_filename,
+        "original_filename": upload_session["filename"],
+        "size": file_size,
+        "type": file_type,
+        "path": relative_path,
+        "checksum": {"algorithm": CHECKSUM_ALGORITHM, "digest": digest}
+    }
+
+@router.delete("/uploads/{upload_id}")
+async def cancel_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """Cancel a resumable upload and discard the received bytes"""
+    try:
+        await fs_ops.run("delete", upload_service.delete_session, storage_paths['user_path'], upload_id)
+    except UploadSessionNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    
+    return {"message": "Upload cancelled", "upload_id": upload_id}
 
 @router.post("/create-folder")
 async def create_folder(
@@ -340,7 +814,18 @@ async def create_folder(
     
     try:
         # Create folder
-        os.makedirs(folder_path, exist_ok=True)
+        await fs_ops.makedirs(folder_path)
+        await fs_ops.run(
+            "metadata",
+            search_index_service.add_path,
+            storage_paths['user_path'], folder_request.context, base_path, os.path.relpath(folder_path, base_path)
+        )
+        await fs_ops.run(
+            "metadata",
+            change_journal_service.record,
+            current_user.storage_id, folder_request.context, "create", os.path.relpath(folder_path, base_path),
+            is_directory=True
+        )
         
         return {
             "message": "Folder created successfully",
@@ -354,9 +839,18 @@ async def create_folder(
             detail=f"Failed to create folder: {str(e)}"
         )
 
+async def _digest_headers(full_file_path):
+    """Digest header carrying the file's recorded checksum, when it is still current"""
+    try:
+        digest = await fs_ops.run("metadata", integrity_service.get_digest, full_file_path)
+    except Exception:
+        digest = None
+    return {"Digest": digest_header_value(digest)} if digest else {}
+
 @router.get("/download/{file_path:path}")
 async def download_file(
     file_path: str,
+    request: Request,
     context: str = Query("drive", description="Storage context: 'drive' or 'photos'"),
     current_user: User = Depends(get_current_user),
     storage_paths: dict = Depends(get_current_user_storage)
@@ -407,15 +901,82 @@ async def download_file(
     # Get the filename for the response
     filename = os.path.basename(full_file_path)
     
-    return FileResponse(
-        path=full_file_path,
+    return await fs_ops.run(
+        "metadata",
+        build_file_response,
+        request,
+        full_file_path,
+        media_type='application/octet-stream',
+        disposition="attachment",
         filename=filename,
-        media_type='application/octet-stream'
+        headers=await _digest_headers(full_file_path)
+    )
+
+@router.get("/archive")
+async def download_archive(
+    paths: List[str] = Query(..., description="Files or folders to include, relative to the context root"),
+    context: str = Query("drive", description="Storage context: 'drive' or 'photos'"),
+    compression: str = Query("auto", description="'auto' (store media, deflate the rest), 'store' or 'deflate'"),
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """Download files and folders as one ZIP, streamed as it is built"""
+    
+    # Validate context
+    if context not in ["drive", "photos"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Context must be either 'drive' or 'photos'"
+        )
+    
+    if compression not in ARCHIVE_COMPRESSION_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Compression must be one of: {', '.join(ARCHIVE_COMPRESSION_MODES)}"
+        )
+    
+    base_path = storage_paths[f"{context}_path"]
+    base_path_normalized = os.path.normpath(base_path).lower()
+    
+    safe_paths = []
+    for file_path in paths:
+        safe_path = storage_service.sanitize_path(file_path)
+        full_path = os.path.normpath(os.path.join(base_path, safe_path))
+        
+        # Ensure every requested path is within the user's storage directory
+        if not full_path.lower().startswith(base_path_normalized + os.sep) and full_path.lower() != base_path_normalized:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        
+        if not os.path.exists(full_path):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"File or folder not found: {file_path}"
+            )
+        safe_paths.append(safe_path)
+    
+    # Name the archive after a single folder, otherwise after the context
+    if len(safe_paths) == 1 and safe_paths[0]:
+        archive_name = f"{os.path.basename(os.path.normpath(safe_paths[0]))}.zip"
+    else:
+        archive_name = f"{context}-{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    
+    # A sync generator, so Starlette reads files and compresses on its threadpool
+    return StreamingResponse(
+        stream_zip(collect_archive_entries(base_path, safe_paths), compression),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": content_disposition("attachment", archive_name),
+            "Cache-Control": "no-store"
+        }
     )
 
 @router.get("/view/{file_path:path}")
 async def view_file(
     file_path: str,
+    request: Request,
     context: str = Query("drive", description="Storage context: 'drive' or 'photos'"),
     current_user: User = Depends(get_current_user),
     storage_paths: dict = Depends(get_current_user_storage)
@@ -468,14 +1029,102 @@ async def view_file(
     if not mime_type:
         mime_type = 'application/octet-stream'
     
-    return FileResponse(
-        path=full_file_path,
+    return await fs_ops.run(
+        "metadata",
+        build_file_response,
+        request,
+        full_file_path,
         media_type=mime_type,
-        headers={
-            "Content-Disposition": "inline",
-            "Cache-Control": "no-cache",
-            "X-Content-Type-Options": "nosniff"
-        }
+        disposition="inline",
+        headers={"X-Content-Type-Options": "nosniff", **await _digest_headers(full_file_path)}
+    )
+
+@router.get("/thumbnail/{file_path:path}")
+async def get_thumbnail(
+    file_path: str,
+    request: Request,
+    context: str = Query("photos", description="Storage context: 'drive' or 'photos'"),
+    size: str = Query("small", description="Thumbnail size: small, medium or large"),
+    image_format: str = Query("webp", alias="format", description="Output format: webp or jpeg"),
+    current_user: User = Depends(get_current_user),
+    storage_paths: dict = Depends(get_current_user_storage)
+):
+    """Serve a cached, downscaled preview of an image"""
+    
+    # Validate context
+    if context not in ["drive", "photos"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Context must be either 'drive' or 'photos'"
+        )
+    
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Size must be one of: {', '.join(THUMBNAIL_SIZES)}"
+        )
+    
+    if image_format not in THUMBNAIL_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Format must be one of: {', '.join(THUMBNAIL_FORMATS)}"
+        )
+    
+    # Sanitize the file path
+    safe_path = storage_service.sanitize_path(file_path)
+    
+    # Construct full path based on context
+    base_path = storage_paths[f"{context}_path"]
+    full_file_path = os.path.join(base_path, safe_path)
+    
+    # Check if file exists and is within user's storage
+    if not os.path.exists(full_file_path) or not os.path.isfile(full_file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    # Ensure the file is within the user's storage directory
+    base_path_normalized = os.path.normpath(base_path).lower()
+    file_path_normalized = os.path.normpath(full_file_path).lower()
+    if not file_path_normalized.startswith(base_path_normalized + os.sep):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    if not is_image_file(full_file_path):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Thumbnails are only available for images"
+        )
+    
+    rel_path = safe_path.replace(os.sep, '/')
+    try:
+        thumbnail_path = await thumbnail_service.get_thumbnail(
+            storage_paths['user_path'],
+            context,
+            rel_path,
+            full_file_path,
+            size,
+            image_format
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Failed to generate thumbnail: {str(e)}"
+        )
+    
+    # The URL is content-addressed by the source image's version
+    return await fs_ops.run(
+        "metadata",
+        build_file_response,
+        request,
+        thumbnail_path,
+        media_type=THUMBNAIL_FORMATS[image_format][1],
+        disposition="inline",
+        headers={"X-Content-Type-Options": "nosniff"},
+        cache_version=file_version(await fs_ops.run("metadata", os.stat, full_file_path))
     )
 
 @router.delete("/delete/{file_path:path}")
@@ -530,36 +1179,76 @@ async def move_to_trash(
     
     try:
         # Create trash directory if it doesn't exist
-        trash_dir = os.path.join(storage_paths['user_path'], '.trash')
-        os.makedirs(trash_dir, exist_ok=True)
+        trash_dir = trash_dir_for(storage_paths['user_path'])
+        await fs_ops.makedirs(trash_dir)
+        await fs_ops.run("metadata", trash_catalog_service.ensure_user_imported, current_user.storage_id, storage_paths['user_path'])
         
-        # Generate unique filename for trash
         original_name = os.path.basename(full_file_path)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        is_directory = os.path.isdir(full_file_path)
+        size = await fs_ops.run("scan", _get_size, full_file_path) if os.path.exists(full_file_path) else 0
+        
+        # Claim a unique trash name with a pending catalog row before moving anything,
+        # so bytes never sit in .trash without a row that lists, restores and purges them
         trash_filename = f"{timestamp}_{original_name}"
+        counter = 1
+        while True:
+            if not os.path.lexists(os.path.join(trash_dir, trash_filename)):
+                try:
+                    await fs_ops.run(
+                        "metadata",
+                        trash_catalog_service.add_item,
+                        current_user.storage_id,
+                        trash_filename,
+                        context=context,
+                        original_path=file_path,
+                        original_name=original_name,
+                        is_directory=is_directory,
+                        size=size,
+                        pending=True
+                    )
+                    break
+                except IntegrityError:
+                    # A concurrent delete claimed the same name
+                    pass
+            counter += 1
+            trash_filename = f"{timestamp}_{counter}_{original_name}"
         trash_file_path = os.path.join(trash_dir, trash_filename)
         
-        # Create metadata for the trashed item
-        metadata = {
-            "original_path": file_path,
-            "original_name": original_name,
-            "context": context,
-            "deleted_at": datetime.now().isoformat(),
-            "is_directory": os.path.isdir(full_file_path),
-            "size": _get_size(full_file_path) if os.path.exists(full_file_path) else 0
-        }
-        
         # Move file/folder to trash
-        shutil.move(full_file_path, trash_file_path)
+        try:
+            await fs_ops.run(
+                "write", _move_between_contexts,
+                current_user.storage_id, full_file_path, trash_file_path, context, "trash", size,
+                partial(search_index_service.remove_path, storage_paths['user_path'], context, safe_path)
+            )
+        except BaseException:
+            await fs_ops.run("metadata", trash_catalog_service.remove_item, current_user.storage_id, trash_filename)
+            raise
+        await fs_ops.run("metadata", trash_catalog_service.confirm_item, current_user.storage_id, trash_filename)
+        if is_directory:
+            await fs_ops.run(
+                "delete",
+                thumbnail_service.remove_folder_thumbnails,
+                storage_paths['user_path'], context, safe_path.replace(os.sep, '/'), trash_file_path
+            )
+        else:
+            await fs_ops.run(
+                "delete",
+                thumbnail_service.remove_thumbnails,
+                storage_paths['user_path'], context, safe_path.replace(os.sep, '/')
+            )
         
-        # Save metadata
-        metadata_file = f"{trash_file_path}.meta"
-        with open(metadata_file, 'w') as f:
-            json.dump(metadata, f)
+        await fs_ops.run(
+            "metadata",
+            change_journal_service.record,
+            current_user.storage_id, context, "trash", safe_path,
+            is_directory=is_directory, size=size, trash_id=trash_filename
+        )
         
         return {
-            "message": f"{'Folder' if metadata['is_directory'] else 'File'} moved to trash successfully",
-            "type": "folder" if metadata['is_directory'] else "file",
+            "message": f"{'Folder' if is_directory else 'File'} moved to trash successfully",
+            "type": "folder" if is_directory else "file",
             "trash_id": trash_filename
         }
         
@@ -592,53 +1281,39 @@ async def get_recent_files(
     
     base_path = storage_paths[f"{context}_path"]
     recent_files = []
+    photo_items = []
     
     try:
-        # Walk through all files in user's storage
-        for root, dirs, files in os.walk(base_path):
-            for file_name in files:
-                # Skip hidden files
-                if file_name.startswith('.'):
-                    continue
-                    
-                file_path = os.path.join(root, file_name)
-                
-                # Get relative path from base_path
-                relative_path = os.path.relpath(file_path, base_path)
-                
-                file_info = {
-                    "name": file_name,
-                    "path": relative_path.replace(os.sep, '/'),  # Normalize path separators
-                    "type": "file",
-                    "is_directory": False,  # Recent files are always files, not directories
-                    "size": os.path.getsize(file_path),
-                    "mimeType": mimetypes.guess_type(file_path)[0] or "application/octet-stream",
-                    "modified": datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat(),
-                    "modified_timestamp": os.path.getmtime(file_path)
-                }
-                
-                # For photos context, extract additional metadata from image files
-                if context == "photos":
-                    mime_type = file_info["mimeType"]
-                    if mime_type and mime_type.startswith('image/'):
-                        photo_metadata = extract_photo_metadata(file_path)
-                        file_info.update(photo_metadata)
-                        
-                        # Use date_taken as the primary date if available, otherwise use modified date
-                        if photo_metadata["date_taken"]:
-                            file_info["date_taken"] = photo_metadata["date_taken"]
-                        else:
-                            file_info["date_taken"] = file_info["modified"]
-                
-                recent_files.append(file_info)
-        
-        # Sort by modification time (most recent first) and limit results
-        recent_files.sort(key=lambda x: x["modified_timestamp"], reverse=True)
-        recent_files = recent_files[:limit]
+        # Top-K by modification time, from the index when available; without one it is a tree walk
+        indexed = await fs_ops.run("metadata", search_index_service.is_built, storage_paths['user_path'], context)
+        recent_entries = await fs_ops.run(
+            "metadata" if indexed else "scan",
+            search_index_service.recent_files,
+            storage_paths['user_path'], context, base_path, limit
+        )
+        for relative_path, stat_result in recent_entries:
+            file_name = relative_path.rsplit('/', 1)[-1]
+            file_info = {
+                "name": file_name,
+                "path": relative_path,
+                "type": "file",
+                "is_directory": False,  # Recent files are always files, not directories
+                "size": stat_result.st_size,
+                "mimeType": mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+                "modified": datetime.fromtimestamp(stat_result.st_mtime).isoformat(),
+                "version": file_version(stat_result)
+            }
+            
+            # For photos context, image metadata is resolved from the index below
+            if context == "photos":
+                mime_type = file_info["mimeType"]
+                if mime_type and mime_type.startswith('image/'):
+                    photo_items.append((file_info, relative_path, stat_result))
+            
+            recent_files.append(file_info)
         
-        # Remove the timestamp field as it's only needed for sorting
-        for file_info in recent_files:
-            del file_info["modified_timestamp"]
+        if photo_items:
+            await fs_ops.run("metadata", _apply_photo_metadata, current_user.storage_id, base_path, photo_items)
         
         return {
             "files": recent_files,
@@ -656,6 +1331,9 @@ async def search_files(
     query: str = Query(..., description="Search query"),
     context: str = Query("drive", description="Storage context: 'drive' or 'photos'"),
     file_type: str = Query(None, description="Filter by file type: image, video, audio, document, archive, etc."),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of results to return"),
+    offset: int = Query(0, ge=0, description="Number of results to skip"),
+    refresh: bool = Query(False, description="Rebuild the search index from disk before searching"),
     current_user: User = Depends(get_current_user),
     storage_paths: dict = Depends(get_current_user_storage)
 ):
@@ -676,84 +1354,39 @@ async def search_files(
         )
     
     base_path = storage_paths[f"{context}_path"]
-    search_results = []
-    query_lower = query.strip().lower()
     
     try:
-        # Walk through all files and folders in user's storage
-        for root, dirs, files in os.walk(base_path):
-            # Filter directories to skip hidden ones
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            # Get relative path from base_path
-            relative_root = os.path.relpath(root, base_path)
-            if relative_root == '.':
-                relative_root = ''
-            
-            # Search in directory names
-            for dir_name in dirs:
-                if query_lower in dir_name.lower():
-                    dir_path = os.path.join(root, dir_name)
-                    relative_path = os.path.join(relative_root, dir_name) if relative_root else dir_name
-                    
-                    search_results.append({
-                        "name": dir_name,
-                        "path": relative_path.replace(os.sep, '/'),
-                        "type": "folder",
-                        "is_directory": True,
-                        "size": 0,
-                        "modified": datetime.fromtimestamp(os.path.getmtime(dir_path)).isoformat(),
-                        "match_type": "name"
-                    })
-            
-            # Search in file names
-            for file_name in files:
-                # Skip hidden files
-                if file_name.startswith('.'):
-                    continue
-                
-                file_path = os.path.join(root, file_name)
-                relative_path = os.path.join(relative_root, file_name) if relative_root else file_name
-                
-                # Check if file name matches query
-                if query_lower in file_name.lower():
-                    file_size = os.path.getsize(file_path)
-                    mime_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
-                    
-                    # Determine file type category
-                    file_category = _get_file_category(mime_type, file_name)
-                    
-                    # Apply file type filter if specified
-                    if file_type and file_category != file_type.lower():
-                        continue
-                    
-                    search_results.append({
-                        "name": file_name,
-                        "path": relative_path.replace(os.sep, '/'),
-                        "type": "file",
-                        "is_directory": False,
-                        "size": file_size,
-                        "mimeType": mime_type,
-                        "category": file_category,
-                        "modified": datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat(),
-                        "match_type": "name"
-                    })
+        # Builds walk the whole tree; keep them in the scan queue so lookups never wait behind them
+        if refresh:
+            await fs_ops.run("scan", search_index_service.rebuild, storage_paths['user_path'], context, base_path)
+        elif not await fs_ops.run("metadata", search_index_service.is_built, storage_paths['user_path'], context):
+            await fs_ops.run("scan", search_index_service.ensure_built, storage_paths['user_path'], context, base_path)
         
-        # Sort results: directories first, then files, both by relevance and name
-        search_results.sort(key=lambda x: (
-            not x["is_directory"],  # Directories first
-            not x["name"].lower().startswith(query_lower),  # Exact prefix matches first
-            x["name"].lower()  # Then alphabetically
-        ))
+        # Ranked lookup against the per-user name index
+        search_results, counts = await fs_ops.run(
+            "metadata",
+            search_index_service.search,
+            storage_paths['user_path'],
+            context,
+            base_path,
+            query,
+            file_type=file_type,
+            limit=limit,
+            offset=offset
+        )
+        
+        for item in search_results:
+            item["modified"] = datetime.fromtimestamp(item.pop("modified_timestamp")).isoformat()
         
         return {
             "query": query,
             "context": context,
             "file_type_filter": file_type,
             "results": search_results,
-            "total_count": len(search_results),
-            "folder_count": sum(1 for item in search_results if item["is_directory"]),
-            "file_count": sum(1 for item in search_results if not item["is_directory"])
+            "limit": limit,
+            "offset": offset,
+            "has_more": offset + len(search_results) < counts["total_count"],
+            **counts
         }
         
     except Exception as e:
@@ -762,46 +1395,141 @@ async def search_files(
             detail=f"Failed to search files: {str(e)}"
         )
 
-def _get_file_category(mime_type, filename):
-    """Helper function to categorize files by type"""
-    if not mime_type and not filename:
-        return 'other'
-    
-    extension = filename.split('.').pop().lower() if filename and '.' in filename else ''
-    
-    # Images
-    if mime_type and mime_type.startswith('image/'):
-        return 'image'
-    
-    # Videos
-    if (mime_type and mime_type.startswith('video/')) or extension in ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'mkv']:
-        return 'video'
-    
-    # Audio
-    if (mime_type and mime_type.startswith('audio/')) or extension in ['mp3', 'wav', 'flac', 'aac', 'ogg', 'wma']:
-        return 'audio'
-    
-    # PDFs
-    if mime_type == 'application/pdf' or extension == 'pdf':
-        return 'pdf'
-    
-    # Office Documents
-    if extension in ['doc', 'docx'] or (mime_type and 'wordprocessingml' in mime_type):
-        return 'document'
-    if extension in ['xls', 'xlsx'] or (mime_type and 'spreadsheetml' in mime_type):
-        return 'spreadsheet'
-    if extension in ['ppt', 'pptx'] or (mime_type and 'presentationml' in mime_type):
-        return 'presentation'
-    
-    # Text files
-    if (mime_type and mime_type.startswith('text/')) or extension in ['txt', 'md', 'json', 'xml', 'csv']:
-        return 'text'
-    
-    # Archives
-    if extension in ['zip', 'rar', '7z', 'tar', 'gz']:
-        return 'archive'
-    
-    return 'other'
+@router.get("/changes")
+async def list_changes(
+    cursor: Optional[str] = Query(None, description="Cursor from a previous call; omit it to get the current position"),
+    limit: int = Query(500, ge=1, le=1000, description="Maximum number of changes to return"),
+    wait: int = Query(0, ge=0, le=60, description="Seconds to hold the request open until a change arrives"),
+    current_user: User = Depends(get_current_user)
+):
+    """Changes to the user's files since a cursor, oldest first, for delta sync"""
+    
+    storage_id = current_user.storage_id
+    if cursor is None:
+        latest = await fs_ops.run("metadata", change_journal_service.latest_seq, storage_id)
+        return {"changes": [], "cursor": encode_change_cursor(latest), "has_more": False, "reset": False}
+    
+    try:
+        after_seq, issued_at = decode_change_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    if change_journal_service.is_expired(issued_at):
+        # Changes since then may have been pruned; the client has to list everything again
+        latest = await fs_ops.run("metadata", change_journal_service.latest_seq, storage_id)
+        return {"changes": [], "cursor": encode_change_cursor(latest), "has_more": False, "reset": True}
+    
+    # Subscribe before reading so a change landing in between still wakes us
+    with event_bus.subscribe(storage_id) as subscription:
+        changes, has_more = await fs_ops.run(
+            "metadata", change_journal_service.list_changes, storage_id, after_seq, limit
+        )
+        if not changes and wait and await subscription.wait_for("changes", wait):
+            changes, has_more = await fs_ops.run(
+                "metadata", change_journal_service.list_changes, storage_id, after_seq, limit
+            )
+    
+    return {
+        "changes": [change_journal_service.to_response(change) for change in changes],
+        "cursor": encode_change_cursor(changes[-1].seq if changes else after_seq),
+        "has_more": has_more,
+        "reset": False
+    }
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-sent event stream of the user's job progress and file changes.
+    Browsers' EventSource cannot set headers, so ?token= is accepted too.
+    """
+    
+    storage_id = current_user.storage_id
+    if event_bus.subscriber_count(storage_id) >= EVENT_STREAM_MAX_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many open event streams"
+        )
+    
+    async def event_stream():
+        try:
+            with event_bus.subscribe(storage_id, limit=EVENT_STREAM_MAX_PER_USER) as subscription:
+                yield f"retry: 5000\n{format_sse({'type': 'ready', 'data': {}})}"
+                while True:
+                    event = await subscription.next(EVENT_STREAM_HEARTBEAT_SECONDS)
+                    if event is None:
+                        if await request.is_disconnected():
+                            break
+                        # A comment line: ignored by clients, keeps proxies from timing out
+                        yield ": ping\n\n"
+                        continue
+                    yield format_sse(event)
+        except TooManySubscribersError:
+            # Lost a race with another stream opening; end quietly
+            return
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+def _apply_photo_metadata(storage_id, photos_path, photo_items):
+    """Fill listing entries from the photo metadata index (no image I/O)"""
+    photo_index_service.ensure_user_scanned(storage_id, photos_path)
+    metadata_by_path = photo_index_service.get_listing_metadata(
+        storage_id,
+        photos_path,
+        [(rel_path, stat_result.st_size, stat_result.st_mtime) for _, rel_path, stat_result in photo_items]
+    )
+    
+    for item_info, rel_path, _ in photo_items:
+        photo_metadata = metadata_by_path[rel_path]
+        item_info.update(photo_metadata)
+        
+        # Use date_taken as the primary date if available, otherwise use modified date
+        if not photo_metadata["date_taken"]:
+            item_info["date_taken"] = item_info["modified"]
+
+def _catalog_added(user_path, context, base_path, target_path):
+    """Add a file or folder that was just put in place to the search index"""
+    search_index_service.add_path(user_path, context, base_path, os.path.relpath(target_path, base_path))
+
+def _index_uploaded_file(storage_paths, storage_id, context, base_path, target_file_path):
+    """Add a freshly uploaded file to the change journal; queue EXIF and thumbnails for images"""
+    rel_path = os.path.relpath(target_file_path, base_path).replace(os.sep, '/')
+    change_journal_service.record(storage_id, context, "create", rel_path, size=os.path.getsize(target_file_path))
+    
+    if not is_image_file(target_file_path):
+        return
+    
+    if context == "photos":
+        photo_index_service.enqueue_file(storage_id, base_path, rel_path)
+    thumbnail_service.pregenerate(storage_paths['user_path'], context, rel_path, target_file_path)
+
+def _move_between_contexts(storage_id, source, destination, from_context, to_context, size, update_catalog):
+    """Move an item (e.g. into the trash), shift its bytes in the usage ledger and update the catalog as one step"""
+    with usage_service.changing(storage_id):
+        shutil.move(source, destination)
+        usage_service.record_transfer(storage_id, from_context, to_context, size)
+        try:
+            update_catalog()
+        except Exception:
+            # The move already happened; the next catalog sync picks the change up
+            pass
+
+def _remove_if_exists(path):
+    if os.path.exists(path):
+        os.remove(path)
 
 def _get_size(path):
     """Helper function to get size of file or directory"""
@@ -834,54 +1562,13 @@ async def list_trash(
             detail="Context must be either 'drive' or 'photos'"
         )
     
-    trash_dir = os.path.join(storage_paths['user_path'], '.trash')
-    
-    if not os.path.exists(trash_dir):
-        return {
-            "items": [],
-            "total_count": 0
-        }
-    
-    trash_items = []
-    
     try:
-        for item in os.listdir(trash_dir):
-            if item.endswith('.meta'):
-                continue
-                
-            item_path = os.path.join(trash_dir, item)
-            metadata_file = f"{item_path}.meta"
-            
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-                    
-                    # Skip items that don't match the requested context
-                    if metadata.get('context') != context:
-                        continue
-                    
-                    # Calculate days in trash
-                    deleted_at = datetime.fromisoformat(metadata['deleted_at'])
-                    days_in_trash = (datetime.now() - deleted_at).days
-                    
-                    trash_items.append({
-                        "trash_id": item,
-                        "original_name": metadata['original_name'],
-                        "original_path": metadata['original_path'],
-                        "context": metadata['context'],
-                        "is_directory": metadata['is_directory'],
-                        "size": metadata.get('size', 0),
-                        "deleted_at": metadata['deleted_at'],
-                        "days_in_trash": days_in_trash,
-                        "expires_in_days": max(0, 30 - days_in_trash)
-                    })
-                except (json.JSONDecodeError, KeyError):
-                    # Skip items with invalid metadata
-                    continue
+        await fs_ops.run("metadata", trash_catalog_service.ensure_user_imported, current_user.storage_id, storage_paths['user_path'])
         
-        # Sort by deletion date (most recent first)
-        trash_items.sort(key=lambda x: x['deleted_at'], reverse=True)
+        # Indexed query, most recently deleted first
+        items = await fs_ops.run("metadata", trash_catalog_service.list_items, current_user.storage_id, context)
+        now = datetime.now()
+        trash_items = [trash_catalog_service.to_response(item, now) for item in items]
         
         return {
             "items": trash_items,
@@ -894,6 +1581,16 @@ async def list_trash(
             detail=f"Failed to list trash items: {str(e)}"
         )
 
+def _trash_item_path(storage_paths, trash_id):
+    """Resolve a trash id to its path, refusing anything outside the trash folder"""
+    trash_dir = trash_dir_for(storage_paths['user_path'])
+    if not trash_id or os.sep in trash_id or '/' in trash_id or trash_id.startswith('.'):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trash item not found"
+        )
+    return os.path.join(trash_dir, trash_id)
+
 @router.post("/trash/{trash_id}/restore")
 async def restore_from_trash(
     trash_id: str,
@@ -902,34 +1599,29 @@ async def restore_from_trash(
 ):
     """Restore an item from trash to its original location"""
     
-    trash_dir = os.path.join(storage_paths['user_path'], '.trash')
-    trash_item_path = os.path.join(trash_dir, trash_id)
-    metadata_file = f"{trash_item_path}.meta"
+    trash_item_path = _trash_item_path(storage_paths, trash_id)
+    await fs_ops.run("metadata", trash_catalog_service.ensure_user_imported, current_user.storage_id, storage_paths['user_path'])
+    item = await fs_ops.run("metadata", trash_catalog_service.get_item, current_user.storage_id, trash_id)
     
-    if not os.path.exists(trash_item_path) or not os.path.exists(metadata_file):
+    if item is None or not os.path.lexists(trash_item_path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Trash item not found"
         )
     
     try:
-        # Load metadata
-        with open(metadata_file, 'r') as f:
-            metadata = json.load(f)
-        
         # Construct original path
-        context = metadata['context']
-        original_path = metadata['original_path']
+        context = item.context
         base_path = storage_paths[f"{context}_path"]
-        restore_path = os.path.join(base_path, original_path)
+        restore_path = os.path.join(base_path, item.original_path)
         
         # Check if original location is available
         if os.path.exists(restore_path):
             # Generate a new name if conflict exists
-            name, ext = os.path.splitext(metadata['original_name'])
+            name, ext = os.path.splitext(item.original_name)
             counter = 1
             
-            if metadata['is_directory']:
+            if item.is_directory:
                 new_name = f"{name} (restored {counter})"
                 while os.path.exists(os.path.join(os.path.dirname(restore_path), new_name)):
                     counter += 1
@@ -943,17 +1635,27 @@ async def restore_from_trash(
                 restore_path = os.path.join(os.path.dirname(restore_path), new_name)
         
         # Ensure target directory exists
-        os.makedirs(os.path.dirname(restore_path), exist_ok=True)
+        await fs_ops.makedirs(os.path.dirname(restore_path))
         
         # Move back from trash
-        shutil.move(trash_item_path, restore_path)
+        await fs_ops.run(
+            "write", _move_between_contexts,
+            current_user.storage_id, trash_item_path, restore_path, "trash", context, item.size,
+            partial(_catalog_added, storage_paths['user_path'], context, base_path, restore_path)
+        )
         
-        # Remove metadata file
-        os.remove(metadata_file)
+        # Drop the catalog entry
+        await fs_ops.run("metadata", trash_catalog_service.remove_item, current_user.storage_id, trash_id)
+        await fs_ops.run(
+            "metadata",
+            change_journal_service.record,
+            current_user.storage_id, context, "restore", os.path.relpath(restore_path, base_path),
+            is_directory=item.is_directory, size=item.size, trash_id=trash_id
+        )
         
         return {
-            "message": f"{'Folder' if metadata['is_directory'] else 'File'} restored successfully",
-            "original_name": metadata['original_name'],
+            "message": f"{'Folder' if item.is_directory else 'File'} restored successfully",
+            "original_name": item.original_name,
             "restored_path": os.path.relpath(restore_path, base_path).replace(os.sep, '/'),
             "context": context
         }
@@ -964,7 +1666,7 @@ async def restore_from_trash(
             detail=f"Failed to restore item: {str(e)}"
         )
 
-@router.delete("/trash/{trash_id}/permanent")
+@router.delete("/trash/{trash_id}/permanent", status_code=status.HTTP_202_ACCEPTED)
 async def permanently_delete(
     trash_id: str,
     current_user: User = Depends(get_current_user),
@@ -972,36 +1674,41 @@ async def permanently_delete(
 ):
     """Permanently delete an item from trash"""
     
-    trash_dir = os.path.join(storage_paths['user_path'], '.trash')
-    trash_item_path = os.path.join(trash_dir, trash_id)
-    metadata_file = f"{trash_item_path}.meta"
+    trash_item_path = _trash_item_path(storage_paths, trash_id)
+    await fs_ops.run("metadata", trash_catalog_service.ensure_user_imported, current_user.storage_id, storage_paths['user_path'])
+    item = await fs_ops.run("metadata", trash_catalog_service.get_item, current_user.storage_id, trash_id)
     
-    if not os.path.exists(trash_item_path):
+    if item is None and not os.path.lexists(trash_item_path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Trash item not found"
         )
     
     try:
-        # Load metadata for response
-        metadata = {}
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
-        
-        # Permanently delete the item
-        if os.path.isfile(trash_item_path):
-            os.remove(trash_item_path)
-        elif os.path.isdir(trash_item_path):
-            shutil.rmtree(trash_item_path)
+        if item is None:
+            # Orphaned bytes with no catalog entry; nothing to credit
+            item = TrashItem(
+                storage_id=current_user.storage_id,
+                trash_id=trash_id,
+                context="",
+                original_path="",
+                original_name="Unknown",
+                size=0,
+                expires_at=datetime.now()
+            )
         
-        # Remove metadata file
-        if os.path.exists(metadata_file):
-            os.remove(metadata_file)
+        # Detach the item and credit the quota now; the bytes are removed in the background
+        job = await fs_ops.run(
+            "write",
+            deletion_job_service.submit,
+            current_user.storage_id, storage_paths['user_path'], [item]
+        )
         
         return {
-            "message": f"{'Folder' if metadata.get('is_directory', False) else 'File'} permanently deleted",
-            "original_name": metadata.get('original_name', 'Unknown')
+            "message": f"{'Folder' if item.is_directory else 'File'} queued for permanent deletion",
+            "original_name": item.original_name,
+            "job_id": job["job_id"],
+            "job": job
         }
         
     except Exception as e:
@@ -1012,6 +1719,7 @@ async def permanently_delete(
 
 @router.delete("/trash/empty")
 async def empty_trash(
+    response: Response,
     context: str = Query("drive", description="Storage context: 'drive' or 'photos'"),
     current_user: User = Depends(get_current_user),
     storage_paths: dict = Depends(get_current_user_storage)
@@ -1025,49 +1733,29 @@ async def empty_trash(
             detail="Context must be either 'drive' or 'photos'"
         )
     
-    trash_dir = os.path.join(storage_paths['user_path'], '.trash')
-    
-    if not os.path.exists(trash_dir):
-        return {
-            "message": "Trash is already empty",
-            "deleted_count": 0
-        }
-    
-    deleted_count = 0
-    
     try:
-        for item in os.listdir(trash_dir):
-            if item.endswith('.meta'):
-                continue
-                
-            item_path = os.path.join(trash_dir, item)
-            metadata_file = f"{item_path}.meta"
-            
-            # Check if this item belongs to the specified context
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-                    
-                    # Only delete items from the specified context
-                    if metadata.get('context') == context:
-                        # Delete the actual file/folder
-                        if os.path.isfile(item_path):
-                            os.remove(item_path)
-                        elif os.path.isdir(item_path):
-                            shutil.rmtree(item_path)
-                        
-                        # Delete the metadata file
-                        os.remove(metadata_file)
-                        deleted_count += 1
-                        
-                except (json.JSONDecodeError, KeyError):
-                    # Skip items with invalid metadata
-                    continue
+        await fs_ops.run("metadata", trash_catalog_service.ensure_user_imported, current_user.storage_id, storage_paths['user_path'])
+        items = await fs_ops.run("metadata", trash_catalog_service.list_items, current_user.storage_id, context)
+        
+        if not items:
+            return {
+                "message": "Trash is already empty",
+                "deleted_count": 0
+            }
+        
+        job = await fs_ops.run(
+            "write",
+            deletion_job_service.submit,
+            current_user.storage_id, storage_paths['user_path'], items
+        )
+        deleted_count = job["item_count"]
         
+        response.status_code = status.HTTP_202_ACCEPTED
         return {
-            "message": f"Trash emptied successfully for {context}. {deleted_count} items permanently deleted.",
-            "deleted_count": deleted_count
+            "message": f"Trash emptied for {context}. {deleted_count} items queued for permanent deletion.",
+            "deleted_count": deleted_count,
+            "job_id": job["job_id"],
+            "job": job
         }
         
     except Exception as e:
@@ -1078,54 +1766,35 @@ async def empty_trash(
 
 @router.post("/trash/cleanup")
 async def cleanup_old_trash(
+    response: Response,
     current_user: User = Depends(get_current_user),
     storage_paths: dict = Depends(get_current_user_storage)
 ):
-    """Clean up trash items older than 30 days"""
-    
-    trash_dir = os.path.join(storage_paths['user_path'], '.trash')
-    
-    if not os.path.exists(trash_dir):
-        return {
-            "message": "No trash to clean up",
-            "deleted_count": 0
-        }
-    
-    deleted_count = 0
-    cutoff_date = datetime.now() - timedelta(days=30)
+    """Clean up trash items older than the retention period"""
     
     try:
-        for item in os.listdir(trash_dir):
-            if item.endswith('.meta'):
-                continue
-                
-            item_path = os.path.join(trash_dir, item)
-            metadata_file = f"{item_path}.meta"
-            
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, 'r') as f:
-                        metadata = json.load(f)
-                    
-                    deleted_at = datetime.fromisoformat(metadata['deleted_at'])
-                    
-                    if deleted_at < cutoff_date:
-                        # Delete the item and its metadata
-                        if os.path.isfile(item_path):
-                            os.remove(item_path)
-                        elif os.path.isdir(item_path):
-                            shutil.rmtree(item_path)
-                        
-                        os.remove(metadata_file)
-                        deleted_count += 1
-                        
-                except (json.JSONDecodeError, KeyError, ValueError):
-                    # Skip items with invalid metadata
-                    continue
+        await fs_ops.run("metadata", trash_catalog_service.ensure_user_imported, current_user.storage_id, storage_paths['user_path'])
+        items = await fs_ops.run("metadata", trash_catalog_service.expired_items, current_user.storage_id)
+        
+        if not items:
+            return {
+                "message": "No trash to clean up",
+                "deleted_count": 0
+            }
         
+        job = await fs_ops.run(
+            "write",
+            deletion_job_service.submit,
+            current_user.storage_id, storage_paths['user_path'], items
+        )
+        deleted_count = job["item_count"]
+        
+        response.status_code = status.HTTP_202_ACCEPTED
         return {
-            "message": f"Cleaned up {deleted_count} items older than 30 days",
-            "deleted_count": deleted_count
+            "message": f"{deleted_count} items older than {TRASH_RETENTION_DAYS} days queued for permanent deletion",
+            "deleted_count": deleted_count,
+            "job_id": job["job_id"],
+            "job": job
         }
         
     except Exception as e:
@@ -1133,3 +1802,24 @@ async def cleanup_old_trash(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to cleanup trash: {str(e)}"
         )
+
+@router.get("/trash/jobs")
+async def list_deletion_jobs(
+    current_user: User = Depends(get_current_user)
+):
+    """List the user's recent background deletion jobs"""
+    return {"jobs": deletion_job_service.list_jobs(current_user.storage_id)}
+
+@router.get("/trash/jobs/{job_id}")
+async def get_deletion_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Progress of a background deletion job"""
+    try:
+        return deletion_job_service.get_job(current_user.storage_id, job_id)
+    except DeletionJobNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Deletion job not found"
+        )
@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+from jose import jwt
+from dotenv import load_dotenv
+from app.models.database import User
+
+load_dotenv()
+
+# How long a decoded token or user/storage bundle is reused; 0 disables the cache
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "30"))
+
+class AuthCache:
+    """
+    Short-lived in-process cache for authenticated request lookups:
+    token -> email, email -> user, and (storage_id, drive_id) -> storage paths.
+
+    Admin routes invalidate the affected entries; in multi-worker deployments
+    other workers converge within the TTL.
+    """
+
+    def __init__(self, ttl_seconds: float = AUTH_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._principals: Dict[str, Tuple[float, str]] = {}
+        self._users: Dict[str, Tuple[float, User]] = {}
+        self._storage_paths: Dict[Tuple[str, Optional[int]], Tuple[float, dict]] = {}
+        self._stats = {
+            name: {"hits": 0, "misses": 0}
+            for name in ("principals", "users", "storage_paths")
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _get(self, name: str, entries: dict, key):
+        with self._lock:
+            entry = entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._stats[name]["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del entries[key]
+            self._stats[name]["misses"] += 1
+            return None
+
+    def _put(self, entries: dict, key, value, ttl_seconds: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            entries[key] = (expires_at, value)
+
+    def get_principal(self, token: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return self._get("principals", self._principals, token)
+
+    def put_principal(self, token: str, email: str):
+        """Cache a verified token, never past its own expiry"""
+        if not self.enabled:
+            return
+        ttl_seconds = self.ttl_seconds
+        exp = jwt.get_unverified_claims(token).get("exp")
+        if exp is not None:
+            ttl_seconds = min(ttl_seconds, exp - time.time())
+        if ttl_seconds > 0:
+            self._put(self._principals, token, email, ttl_seconds)
+
+    def get_user(self, email: str) -> Optional[User]:
+        if not self.enabled:
+            return None
+        return self._get("users", self._users, email)
+
+    def put_user(self, user: User):
+        if self.enabled:
+            self._put(self._users, user.email, user)
+
+    def get_storage_paths(self, storage_id: str, drive_id: Optional[int]) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        paths = self._get("storage_paths", self._storage_paths, (storage_id, drive_id))
+        return dict(paths) if paths is not None else None
+
+    def put_storage_paths(self, storage_id: str, drive_id: Optional[int], paths: dict):
+        if self.enabled:
+            self._put(self._storage_paths, (storage_id, drive_id), dict(paths))
+
+    def invalidate_user(self, email: str):
+        """Drop a user's cached record and storage paths after an admin change"""
+        with self._lock:
+            entry = self._users.pop(email, None)
+            if entry is not None:
+                storage_id = entry[1].storage_id
+                for key in [key for key in self._storage_paths if key[0] == storage_id]:
+                    del self._storage_paths[key]
+
+    def invalidate_storage_paths(self):
+        """Drop every cached storage path bundle (drive configuration changed)"""
+        with self._lock:
+            self._storage_paths.clear()
+
+    def clear(self):
+        with self._lock:
+            self._principals.clear()
+            self._users.clear()
+            self._storage_paths.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {}
+            for name, counters in self._stats.items():
+                lookups = counters["hits"] + counters["misses"]
+                stats[name] = {
+                    **counters,
+                    "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+                    "size": len(getattr(self, f"_{name}"))
+                }
+            return {
+                "enabled": self.enabled,
+                "ttl_seconds": self.ttl_seconds,
+                **stats
+            }
+
+# Global instance
+auth_cache = AuthCache()
@@ -1,8 +1,9 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlmodel import Session, select
-from app.models.database import get_session, User, UserRole, UserStatus
+from app.models.database import User, UserRole, UserStatus, engine
 from app.auth.auth import verify_token
+from app.auth.cache import auth_cache
 from app.services.storage import storage_service
 from typing import Optional
 
@@ -30,8 +31,7 @@ async def get_token(
     )
 
 async def get_current_user(
-    token: str = Depends(get_token),
-    session: Session = Depends(get_session)
+    token: str = Depends(get_token)
 ) -> User:
     """Get current authenticated user"""
     credentials_exception = HTTPException(
@@ -41,12 +41,20 @@ async def get_current_user(
     )
     
     try:
-        email = verify_token(token, credentials_exception)
-        statement = select(User).where(User.email == email)
-        user = session.exec(statement).first()
+        email = auth_cache.get_principal(token)
+        if email is None:
+            email = verify_token(token, credentials_exception)
+            auth_cache.put_principal(token, email)
         
+        user = auth_cache.get_user(email)
         if user is None:
-            raise credentials_exception
+            with Session(engine) as session:
+                statement = select(User).where(User.email == email)
+                user = session.exec(statement).first()
+            
+            if user is None:
+                raise credentials_exception
+            auth_cache.put_user(user)
             
         # Check if user is approved
         if user.status != UserStatus.APPROVED:
@@ -74,7 +82,10 @@ async def get_current_admin_user(
 
 def get_user_storage_paths(user: User) -> dict:
     """Get storage paths for a user"""
-    paths = storage_service.get_user_paths(user.storage_id, drive_id=user.storage_drive_id)
+    paths = auth_cache.get_storage_paths(user.storage_id, user.storage_drive_id)
+    if paths is None:
+        paths = storage_service.get_user_paths(user.storage_id, drive_id=user.storage_drive_id)
+        auth_cache.put_storage_paths(user.storage_id, user.storage_drive_id, paths)
     return paths
 
 async def get_current_user_storage(
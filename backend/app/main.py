@@ -8,6 +8,13 @@ from app.api.files import router as files_router
 from app.api.admin import router as admin_router
 from app.models.database import create_db_and_tables
 from app.services.trash_cleanup import trash_cleanup_service
+from app.services.photo_index import photo_index_service
+from app.services.thumbnails import thumbnail_service
+from app.services.fs_ops import fs_ops
+from app.services.deletion_jobs import deletion_job_service
+from app.services.integrity import integrity_service
+from app.services.catalog_sync import catalog_sync_service
+from app.services.drive_watcher import drive_watcher_service
 import os
 from dotenv import load_dotenv
 
@@ -19,8 +26,20 @@ async def lifespan(app: FastAPI):
     # Startup
     create_db_and_tables()
     trash_cleanup_service.start_background_cleanup()
+    photo_index_service.start_background_indexer()
+    integrity_service.start_background_scrubber()
+    catalog_sync_service.start_background_sync()
+    drive_watcher_service.start_background_watcher()
+    deletion_job_service.sweep_stale_jobs()
     yield
     # Shutdown
+    drive_watcher_service.stop_background_watcher()
+    catalog_sync_service.stop_background_sync()
+    integrity_service.stop_background_scrubber()
+    photo_index_service.stop_background_indexer()
+    thumbnail_service.shutdown()
+    fs_ops.shutdown()
+    deletion_job_service.shutdown()
     trash_cleanup_service.stop_background_cleanup()
 
 
@@ -1,4 +1,6 @@
 from sqlmodel import SQLModel, Field, create_engine, Session
+from sqlalchemy import Index, UniqueConstraint, event
+from sqlalchemy.pool import QueuePool, StaticPool
 from datetime import datetime
 from typing import Optional
 from enum import Enum
@@ -64,17 +66,208 @@ class AdminCredentials(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = Field(default=None)
 
+class StorageUsage(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("storage_id", "context"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    storage_id: str = Field(index=True)  # User's storage folder identifier
+    context: str  # "drive", "photos" or "trash"
+    used_bytes: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class PhotoMetadata(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("storage_id", "path"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    storage_id: str = Field(index=True)  # User's storage folder identifier
+    path: str  # Relative to the user's photos folder, "/" separated
+    size: int  # File size when the metadata was extracted
+    mtime: float  # File mtime when the metadata was extracted
+    date_taken: Optional[str] = Field(default=None)
+    camera_make: Optional[str] = Field(default=None)
+    camera_model: Optional[str] = Field(default=None)
+    location: Optional[str] = Field(default=None)
+    indexed_at: datetime = Field(default_factory=datetime.utcnow)
+
+class TrashItem(SQLModel, table=True):
+    __table_args__ = (
+        UniqueConstraint("storage_id", "trash_id"),
+        Index("ix_trashitem_storage_context_deleted", "storage_id", "context", "deleted_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    storage_id: str  # User's storage folder identifier
+    trash_id: str  # Name of the item inside the user's .trash folder
+    context: str  # "drive" or "photos", where the item was deleted from
+    original_path: str  # Relative to the context folder
+    original_name: str
+    is_directory: bool = Field(default=False)
+    size: int = Field(default=0)
+    deleted_at: datetime = Field(default_factory=datetime.now)
+    expires_at: datetime = Field(index=True)  # When the purge may delete it
+    pending: bool = Field(default=False)  # Written before the move into .trash, cleared once it is there
+    purge_attempts: int = Field(default=0)  # Failed purges so far
+    next_attempt_at: Optional[datetime] = Field(default=None, index=True)  # Purge backs off until then after a failure
+
+class ContentBlob(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("drive_id", "digest"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    drive_id: int = Field(index=True, foreign_key="storagedrive.id")
+    digest: str  # Hex content hash, also the blob's file name
+    size: int
+    ref_count: int = Field(default=0)  # User files hardlinked to the blob
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class FileChecksum(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("drive_id", "inode"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    drive_id: int = Field(index=True, foreign_key="storagedrive.id")
+    inode: int  # Follows the file across renames, moves and the trash
+    path: str  # Last seen location, relative to the drive root
+    size: int  # File size when the digest was taken
+    mtime: float  # File mtime when the digest was taken
+    digest: str  # Hex BLAKE2b-256 of the content
+    status: str = Field(default="ok", index=True)  # "ok" or "mismatch"
+    observed_digest: Optional[str] = Field(default=None)  # What the scrubber read on a mismatch
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    verified_at: datetime = Field(default_factory=datetime.utcnow)
+
+class FileChange(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_filechange_storage_id_id", "storage_id", "id"),
+        Index("ix_filechange_storage_id_seq", "storage_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    seq: Optional[int] = Field(default=None)  # Per-user sequence number of the change; the sync cursor
+    storage_id: str  # User's storage folder identifier
+    context: str  # "drive" or "photos"
+    action: str  # "create", "modify", "delete", "trash" or "restore"
+    path: str  # Relative to the context folder
+    is_directory: bool = Field(default=False)
+    size: Optional[int] = Field(default=None)
+    trash_id: Optional[str] = Field(default=None)  # Trash entry for trash, restore and delete
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class ChangeSequence(SQLModel, table=True):
+    storage_id: str = Field(primary_key=True)  # User's storage folder identifier
+    last_seq: int = Field(default=0)  # Highest sequence number handed out to this user
+
 # Database connection
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nas_cloud.db")
 
+# SQLite tuning: WAL lets readers proceed while a writer commits, and
+# synchronous=NORMAL is durable across application crashes in WAL mode
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE_BYTES = int(os.getenv("SQLITE_MMAP_SIZE_BYTES", str(256 * 1024 * 1024)))
+
+# Connection pool sizing; the defaults cover FastAPI's 40-thread sync pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_BYTES}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+def build_engine(url: str):
+    """Create an engine tuned for the database behind url"""
+    if url.startswith("sqlite"):
+        connect_args = {
+            "check_same_thread": False,
+            # Let SQLite's busy handler wait on locks (seconds)
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+        if _is_sqlite_memory(url):
+            # Every connection to :memory: is a separate database; share one
+            return create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+
+        sqlite_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            poolclass=QueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+        event.listen(sqlite_engine, "connect", _apply_sqlite_pragmas)
+        return sqlite_engine
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
 # Configure engine based on database type
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(DATABASE_URL)
+engine = build_engine(DATABASE_URL)
+
+# Columns added to existing tables after they first shipped: (table, column, SQLite type, Postgres type)
+_ADDED_COLUMNS = [
+    ("trashitem", "pending", "BOOLEAN NOT NULL DEFAULT 0", "BOOLEAN NOT NULL DEFAULT FALSE"),
+    ("trashitem", "purge_attempts", "INTEGER NOT NULL DEFAULT 0", "INTEGER NOT NULL DEFAULT 0"),
+    ("trashitem", "next_attempt_at", "DATETIME", "TIMESTAMP WITHOUT TIME ZONE"),
+    ("filechange", "seq", "INTEGER", "INTEGER"),
+]
+
+# Fill an added column for the rows that predate it; runs once, right after the column is added
+_BACKFILLS = {
+    # Cursors issued before per-user sequences were journal ids, so existing changes keep them
+    ("filechange", "seq"): "UPDATE filechange SET seq = id",
+}
+
+# Indexes on added columns; create_all only creates them for new tables
+_ADDED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_trashitem_next_attempt_at ON trashitem (next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS ix_filechange_storage_id_seq ON filechange (storage_id, seq)",
+]
+
+def _table_columns(conn, table: str) -> set:
+    if engine.dialect.name == "sqlite":
+        return {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table}")').fetchall()}
+    return {
+        row[0] for row in conn.exec_driver_sql(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = %(table)s", {"table": table}
+        ).fetchall()
+    }
+
+def _add_missing_columns():
+    with engine.begin() as conn:
+        for table, column, sqlite_type, postgres_type in _ADDED_COLUMNS:
+            if column in _table_columns(conn, table):
+                continue
+            column_type = sqlite_type if engine.dialect.name == "sqlite" else postgres_type
+            conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN {column} {column_type}')
+            if (table, column) in _BACKFILLS:
+                conn.exec_driver_sql(_BACKFILLS[(table, column)])
+        for statement in _ADDED_INDEXES:
+            conn.exec_driver_sql(statement)
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
 
     # Lightweight migration for older databases that predate storage_quota_gb
     try:
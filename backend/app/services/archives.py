@@ -0,0 +1,124 @@
+import os
+import time
+import zipfile
+import mimetypes
+from typing import Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Bytes read from a source file per write into the archive
+ARCHIVE_READ_BYTES = int(os.getenv("ARCHIVE_READ_BYTES", str(1024 * 1024)))
+
+# Compression choices for /files/archive
+ARCHIVE_COMPRESSION_MODES = ("auto", "store", "deflate")
+
+# Formats that are already compressed; deflating them only burns CPU
+_COMPRESSED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".heif", ".avif",
+    ".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v", ".3gp",
+    ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".flac",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".epub",
+}
+
+# (name inside the archive, path on disk or None for an empty directory)
+ArchiveEntry = Tuple[str, Optional[str]]
+
+class _StreamBuffer:
+    """Write-only, unseekable file object that hands written bytes to the generator"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _compression_for(path: str, mode: str) -> int:
+    if mode == "store":
+        return zipfile.ZIP_STORED
+    if mode == "deflate":
+        return zipfile.ZIP_DEFLATED
+    extension = os.path.splitext(path)[1].lower()
+    media_type = mimetypes.guess_type(path)[0] or ""
+    if extension in _COMPRESSED_EXTENSIONS or media_type.startswith(("image/", "video/", "audio/")):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def collect_archive_entries(base_path: str, rel_paths: Iterable[str]) -> Iterator[ArchiveEntry]:
+    """Yield entries for files and folders (walked lazily), skipping hidden names"""
+    for rel_path in rel_paths:
+        full_path = os.path.join(base_path, rel_path)
+        top_name = os.path.basename(os.path.normpath(full_path))
+        if os.path.isfile(full_path):
+            yield top_name, full_path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(full_path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            arc_dir = os.path.join(top_name, os.path.relpath(dirpath, full_path)).replace(os.sep, '/')
+            arc_dir = arc_dir[:-2] if arc_dir.endswith('/.') else arc_dir
+            visible = sorted(f for f in filenames if not f.startswith('.'))
+            if not visible and not dirnames:
+                yield f"{arc_dir}/", None
+            for filename in visible:
+                yield f"{arc_dir}/{filename}", os.path.join(dirpath, filename)
+
+def stream_zip(entries: Iterable[ArchiveEntry], compression: str = "auto") -> Iterator[bytes]:
+    """
+    Generate a ZIP archive chunk by chunk.
+
+    Nothing is written to disk and memory stays around ARCHIVE_READ_BYTES:
+    because the output is unseekable, zipfile writes sizes and CRCs in data
+    descriptors after each member. Members of 2 GiB and more are written as
+    ZIP64 so multi-GB videos survive.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", allowZip64=True) as archive:
+        for arcname, path in entries:
+            if path is None:
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                info.external_attr = 0o40755 << 16
+                archive.writestr(info, b"")
+                yield buffer.drain()
+                continue
+
+            try:
+                stat_result = os.stat(path)
+                source = open(path, "rb")
+            except OSError:
+                # Vanished or unreadable since the walk; leave it out
+                continue
+
+            with source:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = _compression_for(path, compression)
+                with archive.open(info, mode="w", force_zip64=stat_result.st_size >= zipfile.ZIP64_LIMIT) as member:
+                    for block in iter(lambda: source.read(ARCHIVE_READ_BYTES), b""):
+                        member.write(block)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Central directory
+    data = buffer.drain()
+    if data:
+        yield data
@@ -0,0 +1,193 @@
+import os
+import uuid
+import hashlib
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from sqlmodel import Session, select, delete
+from app.models.database import ContentBlob, engine
+from app.services.storage import storage_service
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Keep one copy of identical uploads per drive (off by default)
+STORAGE_DEDUP_ENABLED = os.getenv("STORAGE_DEDUP_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Blob directory under each drive root
+BLOB_DIR_NAME = ".blobs"
+
+_HASH_READ_BYTES = 1024 * 1024
+
+def new_content_hasher():
+    """Hasher used for content addresses"""
+    return hashlib.blake2b(digest_size=32)
+
+def hash_file(path: str, on_progress: Optional[Callable[[int], None]] = None) -> str:
+    """Hex content address of a file; on_progress gets the bytes hashed so far"""
+    hasher = new_content_hasher()
+    hashed = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_READ_BYTES), b""):
+            hasher.update(block)
+            if on_progress is not None:
+                hashed += len(block)
+                on_progress(hashed)
+    return hasher.hexdigest()
+
+class BlobStore:
+    """
+    Content-addressed, per-drive store for uploaded files.
+
+    Every blob lives at <drive>/.blobs/<aa>/<bb>/<digest> and user files are
+    hardlinks to it, so the user tree, downloads, moves and the trash keep
+    working on ordinary paths. The filesystem's link count is the reference
+    count: deleting a user file drops it, and blobs left with a single link
+    are removed by collect_garbage. Quota usage is still the full size of
+    every user file, so accounting stays per user. Drives that cannot
+    hardlink (e.g. exFAT) simply keep plain copies.
+
+    Linked files are one inode, so they share mtime, permissions and
+    ownership across users: a deduplicated upload keeps the timestamp of the
+    first copy, and a chmod/chown on any copy applies to all of them.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+
+    def _blob_root(self, drive_path: str) -> str:
+        return os.path.join(drive_path, BLOB_DIR_NAME)
+
+    def _blob_path(self, drive_path: str, digest: str) -> str:
+        return os.path.join(self._blob_root(drive_path), digest[:2], digest[2:4], digest)
+
+    def adopt(self, file_path: str, digest: str, size: int) -> bool:
+        """
+        Put a freshly written user file under content addressing.
+
+        If the drive already holds this content, the file is atomically
+        replaced by a hardlink to the existing blob; otherwise the file itself
+        becomes the blob. Returns True when an existing copy was reused.
+        """
+        if not self.enabled or not digest:
+            return False
+        drive = storage_service.get_drive_for_path(file_path)
+        if drive is None:
+            return False
+
+        blob_path = self._blob_path(drive.path, digest)
+        try:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                # New content: the uploaded inode becomes the blob
+                os.link(file_path, blob_path)
+                deduplicated = False
+            except FileExistsError:
+                if os.path.getsize(blob_path) != size:
+                    logger.error(f"Blob {blob_path} does not match its digest size; keeping a plain copy")
+                    return False
+                temp_link = os.path.join(os.path.dirname(file_path), f".blob-{uuid.uuid4().hex}.part")
+                os.link(blob_path, temp_link)
+                os.replace(temp_link, file_path)
+                # Never touch the shared inode's metadata: other users' copies
+                # (and their ETags, thumbnails and checksums) hang off it
+                deduplicated = True
+            self._record(drive.id, digest, size, os.stat(blob_path).st_nlink - 1)
+            return deduplicated
+        except OSError as e:
+            # Hardlinks unsupported or the blob store is unwritable; the plain file stays
+            logger.warning(f"Could not deduplicate {file_path}: {str(e)}")
+            return False
+
+    def _record(self, drive_id: int, digest: str, size: int, ref_count: int):
+        with Session(engine) as session:
+            row = session.exec(
+                select(ContentBlob).where(ContentBlob.drive_id == drive_id, ContentBlob.digest == digest)
+            ).first()
+            if row is None:
+                row = ContentBlob(drive_id=drive_id, digest=digest, size=size)
+            row.ref_count = ref_count
+            row.updated_at = datetime.utcnow()
+            session.add(row)
+            session.commit()
+
+    def collect_garbage(self) -> Dict[int, dict]:
+        """Refresh reference counts from link counts and drop unreferenced blobs"""
+        results = {}
+        for drive in storage_service.get_available_drives():
+            try:
+                results[drive.id] = self._collect_drive(drive.id, drive.path)
+            except Exception as e:
+                logger.error(f"Blob garbage collection failed for drive {drive.id}: {str(e)}")
+        return results
+
+    def _collect_drive(self, drive_id: int, drive_path: str) -> dict:
+        with Session(engine) as session:
+            rows = {
+                row.digest: row
+                for row in session.exec(select(ContentBlob).where(ContentBlob.drive_id == drive_id)).all()
+            }
+
+            removed: List[str] = []
+            freed_bytes = 0
+            seen = set()
+            for dirpath, dirnames, filenames in os.walk(self._blob_root(drive_path)):
+                for digest in filenames:
+                    blob_path = os.path.join(dirpath, digest)
+                    try:
+                        stat_result = os.stat(blob_path)
+                        if stat_result.st_nlink <= 1:
+                            os.remove(blob_path)
+                            removed.append(digest)
+                            freed_bytes += stat_result.st_size
+                            continue
+                    except OSError:
+                        continue
+                    seen.add(digest)
+                    row = rows.get(digest)
+                    if row is None:
+                        row = ContentBlob(drive_id=drive_id, digest=digest, size=stat_result.st_size)
+                    if row.ref_count != stat_result.st_nlink - 1 or row.id is None:
+                        row.ref_count = stat_result.st_nlink - 1
+                        row.updated_at = datetime.utcnow()
+                        session.add(row)
+
+            stale = [digest for digest in rows if digest not in seen]
+            for i in range(0, len(stale), 500):
+                session.exec(
+                    delete(ContentBlob).where(
+                        ContentBlob.drive_id == drive_id,
+                        ContentBlob.digest.in_(stale[i:i + 500])
+                    )
+                )
+            session.commit()
+
+        if removed:
+            logger.info(f"Removed {len(removed)} unreferenced blobs ({freed_bytes} bytes) from drive {drive_id}")
+        return {"blobs_removed": len(removed), "bytes_freed": freed_bytes}
+
+    def dedup_report(self) -> List[dict]:
+        """Per-drive space saved by sharing blobs between user files"""
+        report = []
+        with Session(engine) as session:
+            for drive in storage_service.get_available_drives():
+                rows = session.exec(
+                    select(ContentBlob).where(ContentBlob.drive_id == drive.id, ContentBlob.ref_count > 0)
+                ).all()
+                unique_bytes = sum(row.size for row in rows)
+                logical_bytes = sum(row.size * row.ref_count for row in rows)
+                report.append({
+                    "drive_id": drive.id,
+                    "drive_name": drive.name,
+                    "blob_count": len(rows),
+                    "linked_files": sum(row.ref_count for row in rows),
+                    "unique_bytes": unique_bytes,
+                    "logical_bytes": logical_bytes,
+                    "saved_bytes": logical_bytes - unique_bytes,
+                })
+        return report
+
+# Global instance
+blob_store = BlobStore(STORAGE_DEDUP_ENABLED)
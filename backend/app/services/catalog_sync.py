@@ -0,0 +1,175 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from sqlmodel import Session, select
+from app.models.database import User, engine
+from app.services.search_index import search_index_service
+from app.services.storage import storage_service
+from app.services.usage import usage_service
+from app.services.photo_index import photo_index_service, is_image_file
+from app.services.change_journal import change_journal_service
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pause between two reconciliation passes over all users; 0 disables the worker
+CATALOG_SYNC_INTERVAL_MINUTES = float(os.getenv("CATALOG_SYNC_INTERVAL_MINUTES", "10"))
+
+_CONTEXTS = (("drive", "drive_path"), ("photos", "photos_path"))
+
+# Beyond this many new or rewritten photos in one sync, queue a full photo scan instead
+_PHOTO_ENQUEUE_LIMIT = 500
+
+class CatalogSyncService:
+    """
+    Keeps every user's file catalog in step with their folders on disk.
+
+    Catalogs that were never built are built once; after that each pass only
+    re-lists folders whose mtime changed since the catalog last saw them, so
+    files dropped onto the NAS over SMB or rsync show up in search and recent
+    files without full rescans. What a sync finds is applied to the derived
+    state too: each folder's byte delta goes to the usage ledger in the same
+    usage_service.changing() step as its rescan, every change is appended to
+    the change journal and new or rewritten photos are queued for metadata
+    extraction. API writes change the files, the ledger and the catalog in
+    one such step as well, so a rescan sees either all of an API write or
+    none of it and never counts its bytes a second time.
+    """
+
+    def __init__(self):
+        self.is_running = False
+        self.sync_thread = None
+        self._wake = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "passes": 0,
+            "last_pass_at": None,
+            "last_pass_seconds": None,
+            "catalogs_built": 0,
+            "dirs_checked": 0,
+            "dirs_rescanned": 0,
+            "added": 0,
+            "updated": 0,
+            "removed": 0,
+            "bytes": 0,
+        }
+
+    def start_background_sync(self):
+        """Start the background reconciliation worker"""
+        if CATALOG_SYNC_INTERVAL_MINUTES <= 0:
+            logger.info("Catalog sync disabled")
+            return
+        if not self.is_running:
+            self.is_running = True
+            self._wake.clear()
+            self.sync_thread = threading.Thread(target=self._run_sync, daemon=True)
+            self.sync_thread.start()
+            logger.info("Catalog sync started")
+
+    def stop_background_sync(self):
+        """Stop the background reconciliation worker"""
+        self.is_running = False
+        self._wake.set()
+        if self.sync_thread:
+            self.sync_thread.join()
+        logger.info("Catalog sync stopped")
+
+    def _run_sync(self):
+        while self.is_running:
+            try:
+                self.sync_all()
+            except Exception as e:
+                logger.error(f"Catalog sync pass failed: {str(e)}")
+            self._wake.wait(CATALOG_SYNC_INTERVAL_MINUTES * 60)
+
+    def sync_all(self):
+        """One reconciliation pass over every user's catalog"""
+        started = datetime.now()
+        with Session(engine) as session:
+            users = session.exec(select(User.storage_id, User.storage_drive_id)).all()
+
+        for storage_id, drive_id in users:
+            if not self.is_running:
+                break
+            try:
+                self.sync_user(storage_id, drive_id)
+            except Exception as e:
+                logger.error(f"Catalog sync failed for user {storage_id}: {str(e)}")
+
+        with self._stats_lock:
+            self._stats["passes"] += 1
+            self._stats["last_pass_at"] = started.isoformat()
+            self._stats["last_pass_seconds"] = round((datetime.now() - started).total_seconds(), 3)
+
+    def sync_user(self, storage_id: str, drive_id=None):
+        paths = storage_service.get_user_paths(storage_id, drive_id)
+        user_path = paths["user_path"]
+        for context, path_key in _CONTEXTS:
+            base_path = paths[path_key]
+            if not os.path.isdir(base_path):
+                continue
+            if not search_index_service.is_built(user_path, context):
+                search_index_service.ensure_built(user_path, context, base_path)
+                # Nothing was synced before the build; bring the ledger level with the new catalog
+                usage_service.recompute_user_usage(storage_id, drive_id)
+                with self._stats_lock:
+                    self._stats["catalogs_built"] += 1
+                continue
+
+            result = search_index_service.reconcile(
+                user_path, context, base_path, step=partial(self._ledger_step, storage_id, context)
+            )
+            self._apply(storage_id, context, base_path, result)
+
+    def sync_directories(self, storage_id: str, context: str, user_path: str, base_path: str, rel_dirs):
+        """Apply changes in specific folders, e.g. ones reported by the drive watcher"""
+        result = search_index_service.refresh_directories(
+            user_path, context, base_path, rel_dirs, step=partial(self._ledger_step, storage_id, context)
+        )
+        self._apply(storage_id, context, base_path, result)
+        return result
+
+    @contextmanager
+    def _ledger_step(self, storage_id: str, context: str):
+        """Rescan of one folder; its byte delta is applied before the ledger lock is released"""
+        with usage_service.changing(storage_id):
+            folder = {"bytes": 0}
+            yield folder
+            usage_service.record_change(storage_id, context, folder["bytes"])
+
+    def _apply(self, storage_id: str, context: str, base_path: str, result: dict):
+        change_journal_service.record_many(storage_id, [
+            {"context": context, "action": action, "path": rel_path, "is_directory": is_dir, "size": size}
+            for action, rel_path, is_dir, size in result["changes"]
+        ])
+
+        if context == "photos":
+            images = [
+                rel_path for action, rel_path, is_dir, _ in result["changes"]
+                if action != "delete" and not is_dir and is_image_file(rel_path)
+            ]
+            if len(images) > _PHOTO_ENQUEUE_LIMIT:
+                photo_index_service.enqueue_scan(storage_id, base_path)
+            else:
+                for rel_path in images:
+                    photo_index_service.enqueue_file(storage_id, base_path, rel_path)
+
+        with self._stats_lock:
+            for key in ("dirs_checked", "dirs_rescanned", "added", "updated", "removed", "bytes"):
+                self._stats[key] += result[key]
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "running": self.is_running,
+                "interval_minutes": CATALOG_SYNC_INTERVAL_MINUTES,
+                **self._stats
+            }
+
+# Global instance
+catalog_sync_service = CatalogSyncService()
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import base64
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, delete, update, func
+from app.models.database import ChangeSequence, FileChange, engine
+from app.services.events import event_bus
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Changes older than this are pruned; clients holding older cursors must resync
+CHANGE_JOURNAL_RETENTION_DAYS = int(os.getenv("CHANGE_JOURNAL_RETENTION_DAYS", "30"))
+
+CHANGE_ACTIONS = ("create", "modify", "delete", "trash", "restore")
+
+_PRUNE_BATCH_SIZE = 5000
+
+def encode_change_cursor(seq: int) -> str:
+    """Opaque cursor; it carries its issue time so expired cursors can be detected"""
+    payload = json.dumps({"seq": seq, "at": int(time.time())}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_change_cursor(cursor: str) -> Tuple[int, int]:
+    """Returns (sequence number, issue time); raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return int(payload["seq"]), int(payload["at"])
+    except Exception:
+        raise ValueError("malformed cursor")
+
+class ChangeJournalService:
+    """
+    Append-only journal of file changes per user, for delta sync.
+
+    Every change gets a per-user sequence number, and a cursor is simply the
+    last number a client has seen. Numbers come from the user's
+    ChangeSequence row, bumped in the same transaction that inserts the
+    changes: the row lock makes concurrent appends for a user commit in
+    sequence order, so a reader can never see a number while a lower one is
+    still uncommitted (as autoincrement ids allow) and skip past it for
+    good. The API write paths, the trash purge and the
+    catalog sync (changes made outside the API) all append to it. Each
+    append publishes a "changes" event, which wakes long-poll requests and
+    tells event stream clients to fetch the new entries.
+    """
+
+    def record(
+        self,
+        storage_id: str,
+        context: str,
+        action: str,
+        path: str,
+        is_directory: bool = False,
+        size: Optional[int] = None,
+        trash_id: Optional[str] = None
+    ):
+        self.record_many(storage_id, [{
+            "context": context,
+            "action": action,
+            "path": path,
+            "is_directory": is_directory,
+            "size": size,
+            "trash_id": trash_id,
+        }])
+
+    def record_many(self, storage_id: str, changes: Iterable[dict]):
+        """Append changes in one transaction, in order"""
+        rows = [
+            FileChange(storage_id=storage_id, **dict(change, path=change["path"].replace(os.sep, '/').strip('/')))
+            for change in changes
+        ]
+        if not rows:
+            return
+        while True:
+            with Session(engine) as session:
+                try:
+                    latest_seq = self._allocate(session, storage_id, len(rows))
+                    for offset, row in enumerate(rows):
+                        row.seq = latest_seq - len(rows) + 1 + offset
+                    session.add_all(rows)
+                    session.commit()
+                    break
+                except IntegrityError:
+                    # A concurrent first append created the user's counter; use it
+                    session.rollback()
+        event_bus.publish(storage_id, "changes", {"seq": latest_seq, "count": len(rows)})
+
+    def _allocate(self, session: Session, storage_id: str, count: int) -> int:
+        """Reserve count sequence numbers for a user; returns the highest one"""
+        # The update takes the row lock and holds it until the caller commits
+        session.exec(
+            update(ChangeSequence)
+            .where(ChangeSequence.storage_id == storage_id)
+            .values(last_seq=ChangeSequence.last_seq + count)
+        )
+        counter = session.get(ChangeSequence, storage_id, populate_existing=True)
+        if counter is not None:
+            return counter.last_seq
+
+        # First append since the counter was introduced: continue after the journal's own numbers
+        latest = session.exec(
+            select(func.max(FileChange.seq)).where(FileChange.storage_id == storage_id)
+        ).one() or 0
+        session.add(ChangeSequence(storage_id=storage_id, last_seq=latest + count))
+        session.flush()
+        return latest + count
+
+    def latest_seq(self, storage_id: str) -> int:
+        with Session(engine) as session:
+            counter = session.get(ChangeSequence, storage_id)
+            if counter is not None:
+                return counter.last_seq
+            latest = session.exec(
+                select(func.max(FileChange.seq)).where(FileChange.storage_id == storage_id)
+            ).one()
+        return latest or 0
+
+    def is_expired(self, issued_at: int) -> bool:
+        """Whether changes after a cursor issued at this time may already be pruned"""
+        return issued_at < time.time() - CHANGE_JOURNAL_RETENTION_DAYS * 86400
+
+    def list_changes(self, storage_id: str, after_seq: int, limit: int) -> Tuple[List[FileChange], bool]:
+        """Changes after a sequence number, oldest first; returns (page, has_more)"""
+        with Session(engine) as session:
+            rows = session.exec(
+                select(FileChange)
+                .where(FileChange.storage_id == storage_id, FileChange.seq > after_seq)
+                .order_by(FileChange.seq)
+                .limit(limit + 1)
+            ).all()
+        return rows[:limit], len(rows) > limit
+
+    def to_response(self, change: FileChange) -> dict:
+        response = {
+            "seq": change.seq,
+            "action": change.action,
+            "context": change.context,
+            "path": change.path,
+            "is_directory": change.is_directory,
+            "at": change.created_at.isoformat(),
+        }
+        # Keep batches compact: optional fields only when set
+        if change.size is not None:
+            response["size"] = change.size
+        if change.trash_id is not None:
+            response["trash_id"] = change.trash_id
+        return response
+
+    def prune(self) -> int:
+        """Drop changes past the retention period"""
+        cutoff = datetime.utcnow() - timedelta(days=CHANGE_JOURNAL_RETENTION_DAYS)
+        removed = 0
+        with Session(engine) as session:
+            while True:
+                ids = session.exec(
+                    select(FileChange.id).where(FileChange.created_at < cutoff).limit(_PRUNE_BATCH_SIZE)
+                ).all()
+                if not ids:
+                    break
+                session.exec(delete(FileChange).where(FileChange.id.in_(ids)))
+                session.commit()
+                removed += len(ids)
+        if removed:
+            logger.info(f"Pruned {removed} change journal entries")
+        return removed
+
+# Global instance
+change_journal_service = ChangeJournalService()
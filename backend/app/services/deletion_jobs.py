@@ -0,0 +1,277 @@
+import os
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.models.database import TrashItem
+from app.services.fs_ops import RateLimiter
+from app.services.trash import trash_catalog_service, trash_dir_for
+from app.services.usage import usage_service
+from app.services.events import event_bus
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Threads that unlink files; shared by all running jobs
+DELETE_WORKERS = int(os.getenv("DELETE_WORKERS", "4"))
+# Jobs that walk their trees at the same time
+DELETE_JOB_CONCURRENCY = int(os.getenv("DELETE_JOB_CONCURRENCY", "2"))
+# Ceiling on unlink/rmdir calls per second across all jobs; 0 disables the limit
+DELETE_MAX_IOPS = float(os.getenv("DELETE_MAX_IOPS", "500"))
+# Finished jobs stay queryable for this long
+DELETE_JOB_RETENTION_MINUTES = int(os.getenv("DELETE_JOB_RETENTION_MINUTES", "60"))
+
+# Items of accepted jobs are parked here until their bytes are gone
+PURGING_DIR = ".purging"
+
+_UNLINK_BATCH_SIZE = 256
+
+class DeletionJobNotFoundError(Exception):
+    """Raised when a deletion job does not exist or belongs to another user"""
+
+class DeletionJobService:
+    """
+    Permanently deletes trash items in the background.
+
+    Accepting a job is cheap: each item is renamed into .trash/.purging/<job_id>,
+    its catalog row is dropped and its bytes are credited back to the user's
+    quota. A coordinator thread then walks the parked trees and hands batches
+    of files to a shared pool of unlink workers; every unlink and rmdir goes
+    through a global IOPS limiter so a large purge cannot saturate the disk.
+    Status changes and (throttled) progress are published as "job" events.
+    Trees parked by jobs that a restart interrupted are already credited, so
+    they are swept for every user at startup rather than left on disk.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # Parked trees owned by unfinished jobs, so no two jobs delete the same tree
+        self._claimed_dirs = set()
+        self._coordinators: Optional[ThreadPoolExecutor] = None
+        self._workers: Optional[ThreadPoolExecutor] = None
+        self._iops_limiter = RateLimiter(DELETE_MAX_IOPS)
+
+    def _get_executors(self):
+        with self._lock:
+            if self._coordinators is None:
+                self._coordinators = ThreadPoolExecutor(
+                    max_workers=max(1, DELETE_JOB_CONCURRENCY),
+                    thread_name_prefix="delete-job"
+                )
+                self._workers = ThreadPoolExecutor(
+                    max_workers=max(1, DELETE_WORKERS),
+                    thread_name_prefix="delete-worker"
+                )
+            return self._coordinators, self._workers
+
+    def shutdown(self):
+        with self._lock:
+            coordinators, workers = self._coordinators, self._workers
+            self._coordinators = self._workers = None
+        if coordinators is not None:
+            coordinators.shutdown(wait=False, cancel_futures=True)
+            workers.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, storage_id: str, user_path: str, items: List[TrashItem]) -> dict:
+        """Detach items from the trash, credit their bytes and queue the deletion"""
+        job_id = uuid.uuid4().hex
+        trash_dir = trash_dir_for(user_path)
+        job_dir = os.path.join(trash_dir, PURGING_DIR, job_id)
+        with self._lock:
+            self._claimed_dirs.add(job_dir)
+        os.makedirs(job_dir, exist_ok=True)
+
+        accepted = []
+        accepted_bytes = 0
+        # Renames are cheap; a ledger recompute sees either all of them credited or none
+        with usage_service.changing(storage_id):
+            for item in items:
+                source = os.path.join(trash_dir, item.trash_id)
+                try:
+                    if os.path.lexists(source):
+                        os.rename(source, os.path.join(job_dir, item.trash_id))
+                except OSError as e:
+                    logger.error(f"Failed to detach trash item {item.trash_id} for user {storage_id}: {str(e)}")
+                    continue
+                accepted.append(item)
+                accepted_bytes += item.size
+            usage_service.record_change(storage_id, "trash", -accepted_bytes)
+
+        trash_catalog_service.remove_items(storage_id, [item.trash_id for item in accepted])
+        trash_catalog_service.journal_deleted(storage_id, accepted)
+
+        job = self._start_job(
+            storage_id, job_id, len(accepted), accepted_bytes,
+            [job_dir] + self._stale_job_dirs(trash_dir)
+        )
+        return self._public(job)
+
+    def sweep_stale_jobs(self):
+        """Queue the parked trees of every user's interrupted jobs for deletion"""
+        from app.services.storage import storage_service
+
+        swept = 0
+        for drive in storage_service.get_available_drives():
+            users_path = Path(drive.path) / "users"
+            if not users_path.exists():
+                continue
+            for user_dir in users_path.iterdir():
+                if not user_dir.is_dir():
+                    continue
+                stale_dirs = self._stale_job_dirs(trash_dir_for(str(user_dir)))
+                if stale_dirs:
+                    self._start_job(user_dir.name, uuid.uuid4().hex, 0, 0, stale_dirs)
+                    swept += len(stale_dirs)
+
+        if swept:
+            logger.info(f"Resuming deletion of {swept} trees left by interrupted jobs")
+
+    def _start_job(self, storage_id: str, job_id: str, item_count: int, freed_bytes: int, roots: List[str]) -> dict:
+        job = {
+            "job_id": job_id,
+            "storage_id": storage_id,
+            "status": "queued",
+            "item_count": item_count,
+            "freed_bytes": freed_bytes,
+            "deleted_files": 0,
+            "deleted_dirs": 0,
+            "errors": 0,
+            "created_at": datetime.now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._prune_finished()
+            self._jobs[job_id] = job
+            self._claimed_dirs.update(roots)
+
+        coordinators, _ = self._get_executors()
+        coordinators.submit(self._run_job, job, roots)
+        self._publish(job)
+        return job
+
+    def get_job(self, storage_id: str, job_id: str) -> dict:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["storage_id"] != storage_id:
+                raise DeletionJobNotFoundError()
+            return self._public(job)
+
+    def list_jobs(self, storage_id: str) -> List[dict]:
+        with self._lock:
+            self._prune_finished()
+            jobs = [job for job in self._jobs.values() if job["storage_id"] == storage_id]
+            return [self._public(job) for job in sorted(jobs, key=lambda job: job["created_at"], reverse=True)]
+
+    def _public(self, job: dict) -> dict:
+        return {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in job.items()
+            if key != "storage_id"
+        }
+
+    def _publish(self, job: dict, progress_only: bool = False):
+        # Counters change per unlinked file; skip the snapshot when nobody listens
+        if progress_only and not event_bus.subscriber_count(job["storage_id"]):
+            return
+        with self._lock:
+            data = dict(self._public(job), kind="delete")
+        event_bus.publish_progress(
+            job["storage_id"], "job", f"delete:{job['job_id']}", data, final=not progress_only
+        )
+
+    def _prune_finished(self):
+        cutoff = datetime.now() - timedelta(minutes=DELETE_JOB_RETENTION_MINUTES)
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]:
+            del self._jobs[job_id]
+
+    def _stale_job_dirs(self, trash_dir: str) -> List[str]:
+        """Parked trees left behind by jobs that did not finish (e.g. a restart)"""
+        purging_dir = os.path.join(trash_dir, PURGING_DIR)
+        try:
+            names = os.listdir(purging_dir)
+        except OSError:
+            return []
+        with self._lock:
+            return [
+                os.path.join(purging_dir, name)
+                for name in names
+                if os.path.join(purging_dir, name) not in self._claimed_dirs
+            ]
+
+    def _run_job(self, job: dict, roots: List[str]):
+        with self._lock:
+            job["status"] = "running"
+            job["started_at"] = datetime.now()
+        self._publish(job)
+
+        try:
+            for root in roots:
+                self._delete_tree(job, root)
+            status = "completed" if not job["errors"] else "completed_with_errors"
+        except Exception as e:
+            logger.error(f"Deletion job {job['job_id']} failed: {str(e)}")
+            status = "failed"
+
+        with self._lock:
+            job["status"] = status
+            job["finished_at"] = datetime.now()
+            self._claimed_dirs.difference_update(roots)
+        self._publish(job)
+
+    def _delete_tree(self, job: dict, root: str):
+        """Unlink files in parallel, then remove directories deepest first"""
+        _, workers = self._get_executors()
+        directories = []
+        futures = []
+
+        for dirpath, dirnames, filenames in os.walk(root, onerror=lambda e: self._count(job, "errors")):
+            directories.append(dirpath)
+            # Symlinks to directories are unlinked, never followed
+            links = [name for name in dirnames if os.path.islink(os.path.join(dirpath, name))]
+            dirnames[:] = [name for name in dirnames if name not in links]
+            paths = [os.path.join(dirpath, name) for name in filenames + links]
+            for i in range(0, len(paths), _UNLINK_BATCH_SIZE):
+                futures.append(workers.submit(self._unlink_batch, job, paths[i:i + _UNLINK_BATCH_SIZE]))
+
+        wait(futures)
+
+        for dirpath in reversed(directories):
+            self._iops_limiter.acquire()
+            try:
+                os.rmdir(dirpath)
+                self._count(job, "deleted_dirs")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to remove directory {dirpath}: {str(e)}")
+                self._count(job, "errors")
+
+    def _unlink_batch(self, job: dict, paths: List[str]):
+        for path in paths:
+            self._iops_limiter.acquire()
+            try:
+                os.unlink(path)
+                self._count(job, "deleted_files")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to delete {path}: {str(e)}")
+                self._count(job, "errors")
+
+    def _count(self, job: dict, counter: str):
+        with self._lock:
+            job[counter] += 1
+        self._publish(job, progress_only=True)
+
+# Global instance
+deletion_job_service = DeletionJobService()
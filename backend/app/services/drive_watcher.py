@@ -0,0 +1,395 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import struct
+import logging
+import selectors
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlmodel import Session, select
+from app.models.database import User, engine
+from app.services.catalog_sync import catalog_sync_service
+from app.services.storage import storage_service
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Watch active drives for changes made outside the API (off by default)
+DRIVE_WATCHER_ENABLED = os.getenv("DRIVE_WATCHER_ENABLED", "false").lower() in ("1", "true", "yes")
+# A folder is synced once it has been quiet for this long
+DRIVE_WATCHER_BATCH_SECONDS = float(os.getenv("DRIVE_WATCHER_BATCH_SECONDS", "2"))
+# Polling interval for drives inotify cannot cover, and for picking up added or removed drives
+DRIVE_WATCHER_POLL_SECONDS = float(os.getenv("DRIVE_WATCHER_POLL_SECONDS", "300"))
+
+# inotify(7) constants
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_CHANGE_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_WATCH_MASK = _CHANGE_MASK | _IN_DELETE_SELF | _IN_ONLYDIR | _IN_DONT_FOLLOW
+_EVENT_HEADER = struct.Struct("iIII")
+
+_CONTEXTS = ("drive", "photos")
+
+# A folder that keeps changing is still synced at least this often
+_MAX_BATCH_FACTOR = 10
+
+class _Inotify:
+    """Minimal inotify binding over libc via ctypes"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.fd = fd
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class DriveWatcherService:
+    """
+    Watches the user trees of every active drive for changes made outside
+    the API (files dropped onto the disks, migrate_storage.py, SMB shares).
+
+    inotify is not recursive, so every visible folder under
+    <drive>/users/<user>/{drive,photos} gets its own watch. Events only mark
+    their folder dirty; once a folder has been quiet for
+    DRIVE_WATCHER_BATCH_SECONDS the dirty folders of each user are re-listed
+    in one go through the catalog sync, which updates the file catalog, the
+    usage ledger and the photo metadata queue. Drives inotify cannot cover
+    (no inotify, or the watch limit was hit) fall back to periodic mtime
+    reconciliation, and so does everything after an event queue overflow.
+    """
+
+    def __init__(self):
+        self.is_running = False
+        self.watch_thread = None
+        self._wake = threading.Event()
+        self._inotify: Optional[_Inotify] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        # Watch descriptor -> folder, and drive id -> root, per mode
+        self._watches: Dict[int, str] = {}
+        self._watched_drives: Dict[int, str] = {}
+        self._polled_drives: Dict[int, str] = {}
+        # (drive id, user, context) -> dirty folders and when they were first/last touched
+        self._pending: Dict[Tuple[int, str, str], dict] = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "events": 0,
+            "batches": 0,
+            "dirs_synced": 0,
+            "overflows": 0,
+            "last_poll_at": None,
+        }
+
+    def start_background_watcher(self):
+        """Start watching the active drives"""
+        if not DRIVE_WATCHER_ENABLED:
+            return
+        if not self.is_running:
+            try:
+                self._inotify = _Inotify()
+                self._selector = selectors.DefaultSelector()
+                self._selector.register(self._inotify.fd, selectors.EVENT_READ)
+            except (OSError, AttributeError, TypeError) as e:
+                # Not Linux, or inotify unavailable: every drive is polled
+                logger.warning(f"inotify unavailable, drive watcher will poll: {str(e)}")
+                self._inotify = None
+                self._selector = None
+            self.is_running = True
+            self._wake.clear()
+            self.watch_thread = threading.Thread(target=self._run_watcher, daemon=True)
+            self.watch_thread.start()
+            logger.info("Drive watcher started")
+
+    def stop_background_watcher(self):
+        """Stop watching and release the inotify descriptor"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        self._wake.set()
+        if self.watch_thread:
+            self.watch_thread.join()
+        if self._selector is not None:
+            self._selector.close()
+        if self._inotify is not None:
+            self._inotify.close()
+        self._inotify = self._selector = None
+        self._watches.clear()
+        self._watched_drives.clear()
+        self._polled_drives.clear()
+        logger.info("Drive watcher stopped")
+
+    def _run_watcher(self):
+        next_poll = 0.0
+        # Changes made while nothing was watching are caught by one full reconciliation
+        resync_all = True
+        while self.is_running:
+            if resync_all or time.monotonic() >= next_poll:
+                if self._refresh_drives():
+                    resync_all = True
+                self._poll(resync_all)
+                resync_all = False
+                next_poll = time.monotonic() + DRIVE_WATCHER_POLL_SECONDS
+
+            if self._selector is not None:
+                if self._selector.select(timeout=1.0):
+                    # Dropped events leave no trace of what changed
+                    resync_all = self._handle_events(self._inotify.read_events())
+            else:
+                self._wake.wait(1.0)
+
+            self._flush_due()
+
+    # Drives
+
+    def _refresh_drives(self) -> bool:
+        """Follow drives being added or retired; returns True if any drive is new"""
+        try:
+            active = {drive.id: drive.path for drive in storage_service.get_available_drives()}
+        except Exception as e:
+            logger.error(f"Drive watcher could not list drives: {str(e)}")
+            return False
+
+        for drive_id in list(self._watched_drives):
+            if active.get(drive_id) != self._watched_drives[drive_id]:
+                self._unwatch_drive(drive_id)
+        for drive_id in list(self._polled_drives):
+            if active.get(drive_id) != self._polled_drives[drive_id]:
+                del self._polled_drives[drive_id]
+
+        added = False
+        for drive_id, drive_path in active.items():
+            if drive_id in self._watched_drives or drive_id in self._polled_drives:
+                continue
+            added = True
+            if self._inotify is None:
+                self._polled_drives[drive_id] = drive_path
+                continue
+            self._watched_drives[drive_id] = drive_path
+            try:
+                self._add_tree(drive_id, drive_path, drive_path)
+                logger.info(f"Watching drive {drive_id} with {self._watch_count(drive_path)} inotify watches")
+            except OSError as e:
+                # Usually fs.inotify.max_user_watches; this drive is polled instead
+                logger.warning(f"Cannot watch drive {drive_id} ({str(e)}); falling back to polling")
+                self._unwatch_drive(drive_id)
+                self._polled_drives[drive_id] = drive_path
+        return added
+
+    def _unwatch_drive(self, drive_id: int):
+        drive_path = self._watched_drives.pop(drive_id, None)
+        if drive_path is None:
+            return
+        for wd, path in list(self._watches.items()):
+            if self._is_within(path, drive_path):
+                self._inotify.rm_watch(wd)
+                del self._watches[wd]
+
+    def _watch_count(self, drive_path: str) -> int:
+        return sum(1 for path in self._watches.values() if self._is_within(path, drive_path))
+
+    def _is_within(self, path: str, root: str) -> bool:
+        return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+    def _should_watch(self, drive_path: str, path: str) -> bool:
+        """The drive root, users/, each user folder, and the visible part of their contexts"""
+        parts = [] if path == drive_path else os.path.relpath(path, drive_path).split(os.sep)
+        if any(part.startswith('.') for part in parts):
+            return False
+        if len(parts) >= 1 and parts[0] != "users":
+            return False
+        return len(parts) < 3 or parts[2] in _CONTEXTS
+
+    def _add_tree(self, drive_id: int, drive_path: str, start_path: str):
+        stack = [start_path]
+        while stack:
+            current = stack.pop()
+            if not self._should_watch(drive_path, current):
+                continue
+            try:
+                # Re-adding a watched folder returns its existing descriptor, which also follows renames
+                self._watches[self._inotify.add_watch(current)] = current
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+
+    # Events
+
+    def _drive_of(self, path: str) -> Optional[Tuple[int, str]]:
+        for drive_id, drive_path in self._watched_drives.items():
+            if self._is_within(path, drive_path):
+                return drive_id, drive_path
+        return None
+
+    def _handle_events(self, events: List[Tuple[int, int, str]]) -> bool:
+        """Mark folders dirty; returns True if the kernel queue overflowed"""
+        overflowed = False
+        for wd, mask, name in events:
+            if mask & _IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            if mask & (_IN_IGNORED | _IN_DELETE_SELF):
+                self._watches.pop(wd, None)
+                continue
+
+            directory = self._watches.get(wd)
+            if directory is None or not name or name.startswith('.') or not mask & _CHANGE_MASK:
+                continue
+            drive = self._drive_of(directory)
+            if drive is None:
+                continue
+            drive_id, drive_path = drive
+            with self._stats_lock:
+                self._stats["events"] += 1
+
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                try:
+                    self._add_tree(drive_id, drive_path, os.path.join(directory, name))
+                except OSError as e:
+                    logger.warning(f"Cannot watch {os.path.join(directory, name)} ({str(e)}); polling drive {drive_id}")
+                    self._unwatch_drive(drive_id)
+                    self._polled_drives[drive_id] = drive_path
+                    continue
+
+            parts = os.path.relpath(directory, drive_path).split(os.sep)
+            if len(parts) < 3 or parts[0] != "users" or parts[2] not in _CONTEXTS:
+                continue
+            self._mark_dirty(drive_id, parts[1], parts[2], '/'.join(parts[3:]))
+
+        if overflowed:
+            logger.warning("inotify event queue overflowed; reconciling all drives")
+            with self._stats_lock:
+                self._stats["overflows"] += 1
+        return overflowed
+
+    def _mark_dirty(self, drive_id: int, storage_id: str, context: str, rel_dir: str):
+        now = time.monotonic()
+        batch = self._pending.get((drive_id, storage_id, context))
+        if batch is None:
+            batch = self._pending[(drive_id, storage_id, context)] = {"dirs": set(), "first": now}
+        batch["dirs"].add(rel_dir)
+        batch["last"] = now
+
+    def _flush_due(self):
+        now = time.monotonic()
+        due = [
+            key for key, batch in self._pending.items()
+            if now - batch["last"] >= DRIVE_WATCHER_BATCH_SECONDS
+            or now - batch["first"] >= DRIVE_WATCHER_BATCH_SECONDS * _MAX_BATCH_FACTOR
+        ]
+        if not due:
+            return
+
+        user_drives = self._user_drives()
+        for key in due:
+            drive_id, storage_id, context = key
+            rel_dirs = self._pending.pop(key)["dirs"]
+            # Leftovers of a migration away from this drive are not the user's live tree
+            if user_drives.get(storage_id) != drive_id:
+                continue
+            try:
+                paths = storage_service.get_user_paths(storage_id, drive_id)
+                catalog_sync_service.sync_directories(
+                    storage_id, context, paths["user_path"], paths[f"{context}_path"], rel_dirs
+                )
+            except Exception as e:
+                logger.error(f"Drive watcher failed to sync {context} for user {storage_id}: {str(e)}")
+                continue
+            with self._stats_lock:
+                self._stats["batches"] += 1
+                self._stats["dirs_synced"] += len(rel_dirs)
+
+    # Polling
+
+    def _user_drives(self) -> Dict[str, Optional[int]]:
+        """Drive each user currently lives on"""
+        default_drive = storage_service.get_default_drive()
+        with Session(engine) as session:
+            rows = session.exec(select(User.storage_id, User.storage_drive_id)).all()
+        return {
+            storage_id: drive_id if drive_id is not None else (default_drive.id if default_drive else None)
+            for storage_id, drive_id in rows
+        }
+
+    def _poll(self, all_drives: bool):
+        """mtime reconciliation for polled drives (or every drive after lost events)"""
+        drive_ids: Set[int] = set(self._polled_drives)
+        if all_drives:
+            drive_ids |= set(self._watched_drives)
+        if not drive_ids:
+            return
+
+        for storage_id, drive_id in self._user_drives().items():
+            if not self.is_running:
+                return
+            if drive_id not in drive_ids:
+                continue
+            try:
+                catalog_sync_service.sync_user(storage_id, drive_id)
+            except Exception as e:
+                logger.error(f"Drive watcher poll failed for user {storage_id}: {str(e)}")
+        with self._stats_lock:
+            self._stats["last_poll_at"] = datetime.now().isoformat()
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {
+            "enabled": DRIVE_WATCHER_ENABLED,
+            "running": self.is_running,
+            "inotify": self._inotify is not None,
+            "watches": len(self._watches),
+            "watched_drives": sorted(self._watched_drives),
+            "polled_drives": sorted(self._polled_drives),
+            "pending_batches": len(self._pending),
+            **stats
+        }
+
+# Global instance
+drive_watcher_service = DriveWatcherService()
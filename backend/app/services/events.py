@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connection; a client that falls further behind gets a "lagged" event
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv("EVENT_STREAM_QUEUE_SIZE", "64"))
+# Idle streams send a comment line this often to keep proxies from closing them
+EVENT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("EVENT_STREAM_HEARTBEAT_SECONDS", "20"))
+# Open event streams allowed per user
+EVENT_STREAM_MAX_PER_USER = int(os.getenv("EVENT_STREAM_MAX_PER_USER", "8"))
+# Progress of one job or upload is published at most this often
+EVENT_PROGRESS_INTERVAL_SECONDS = float(os.getenv("EVENT_PROGRESS_INTERVAL_SECONDS", "0.5"))
+
+class TooManySubscribersError(Exception):
+    """Raised when a user already has the maximum number of open streams"""
+
+class EventSubscription:
+    """One listener's bounded queue, owned by the event loop it was created on"""
+
+    __slots__ = ("loop", "queue")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_STREAM_QUEUE_SIZE)
+
+    def _deliver(self, event: dict):
+        # Runs on the subscriber's loop
+        if self.queue.full():
+            # Drop the backlog rather than grow; the client refetches state instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = {"type": "lagged", "data": {}}
+        self.queue.put_nowait(event)
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """Next event, or None if nothing arrived within timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def wait_for(self, event_type: str, timeout: float) -> bool:
+        """Wait until an event of this type (or a lag notice) arrives"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            event = await self.next(remaining)
+            if event is None:
+                return False
+            if event["type"] in (event_type, "lagged"):
+                return True
+
+class EventBus:
+    """
+    In-process publish/subscribe of per-user events.
+
+    Publishers may run on any thread (worker pools, background services);
+    delivery is handed to each subscriber's event loop, and every subscriber
+    holds at most EVENT_STREAM_QUEUE_SIZE events, so a slow or idle
+    connection costs a bounded amount of memory. Progress events are
+    throttled per job at the source.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[EventSubscription]] = {}
+        self._last_progress: Dict[str, float] = {}
+
+    @contextmanager
+    def subscribe(self, storage_id: str, limit: Optional[int] = None):
+        subscription = EventSubscription(asyncio.get_running_loop())
+        with self._lock:
+            subscribers = self._subscribers.setdefault(storage_id, set())
+            if limit is not None and len(subscribers) >= limit:
+                if not subscribers:
+                    del self._subscribers[storage_id]
+                raise TooManySubscribersError()
+            subscribers.add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(storage_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[storage_id]
+
+    def subscriber_count(self, storage_id: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(storage_id, ()))
+
+    def publish(self, storage_id: str, event_type: str, data: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(storage_id, ()))
+        event = {"type": event_type, "data": data}
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # Loop already closed; the subscription is going away
+                pass
+
+    def publish_progress(self, storage_id: str, event_type: str, key: str, data: dict, final: bool = False):
+        """Publish a progress update unless one for the same key went out very recently"""
+        now = time.monotonic()
+        with self._lock:
+            if final:
+                self._last_progress.pop(key, None)
+            else:
+                if now - self._last_progress.get(key, 0.0) < EVENT_PROGRESS_INTERVAL_SECONDS:
+                    return
+                self._last_progress[key] = now
+        self.publish(storage_id, event_type, data)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._subscribers),
+                "subscriptions": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "queue_size": EVENT_STREAM_QUEUE_SIZE,
+            }
+
+def format_sse(event: dict) -> str:
+    """Serialize an event for a text/event-stream response"""
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], separators=(',', ':'))}\n\n"
+
+# Global instance
+event_bus = EventBus()
@@ -0,0 +1,374 @@
+import os
+import uuid
+import logging
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote
+from fastapi import Request, status
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# max-age sent for content-addressed URLs (?v=<version> matching the file); 0 disables immutable caching
+FILE_CACHE_IMMUTABLE_MAX_AGE = int(os.getenv("FILE_CACHE_IMMUTABLE_MAX_AGE", "31536000"))
+
+# Read size used when streaming file bodies
+FILE_STREAM_CHUNK_SIZE = 256 * 1024
+
+# How file bodies are sent:
+#   "stream"                - read in Python and stream through the event loop (default)
+#   "zerocopy-if-supported" - ASGI zero-copy send (os.sendfile in the server) when the
+#                             server offers it, otherwise large reads on the threadpool;
+#                             uvicorn does not offer it, see /admin/metrics/file-delivery
+#   "x-accel-redirect"      - hand the transfer to nginx (see FILE_DELIVERY_ACCEL_MAP)
+#   "x-sendfile"            - hand the transfer to Apache mod_xsendfile / lighttpd
+FILE_DELIVERY_MODE = os.getenv("FILE_DELIVERY_MODE", "stream").strip().lower()
+
+# Earlier name of "zerocopy-if-supported", kept so existing configs keep working
+_DELIVERY_MODE_ALIASES = {"sendfile": "zerocopy-if-supported"}
+if FILE_DELIVERY_MODE in _DELIVERY_MODE_ALIASES:
+    logger.warning(
+        f"FILE_DELIVERY_MODE={FILE_DELIVERY_MODE} is deprecated, "
+        f"use {_DELIVERY_MODE_ALIASES[FILE_DELIVERY_MODE]}"
+    )
+    FILE_DELIVERY_MODE = _DELIVERY_MODE_ALIASES[FILE_DELIVERY_MODE]
+
+# Files smaller than this are always streamed; offloading only pays off for large bodies
+FILE_DELIVERY_MIN_BYTES = int(os.getenv("FILE_DELIVERY_MIN_BYTES", str(1024 * 1024)))
+
+# Comma-separated "<filesystem root>=<nginx internal location>" pairs, e.g.
+# "/mnt/disk1=/_protected/disk1,/mnt/disk2=/_protected/disk2"
+FILE_DELIVERY_ACCEL_MAP = os.getenv("FILE_DELIVERY_ACCEL_MAP", "")
+
+# Read size used by the zero-copy fallback when the server has no zero-copy support
+SENDFILE_FALLBACK_CHUNK_SIZE = 1024 * 1024
+
+# A response body is a list of literal byte strings and inclusive file ranges
+Segment = Union[bytes, Tuple[int, int]]
+
+def _parse_accel_map(value: str) -> List[Tuple[str, str]]:
+    mappings = []
+    for pair in value.split(","):
+        root, sep, location = pair.partition("=")
+        if sep and root.strip() and location.strip():
+            mappings.append((os.path.normpath(root.strip()), location.strip().rstrip("/")))
+    # Longest root first so nested drives map to the most specific location
+    return sorted(mappings, key=lambda mapping: len(mapping[0]), reverse=True)
+
+_accel_mappings = _parse_accel_map(FILE_DELIVERY_ACCEL_MAP)
+
+# Large bodies by the path that actually sent them
+_stats_lock = threading.Lock()
+_delivery_counts = {"zerocopy": 0, "threadpool": 0, "stream": 0, "offloaded": 0}
+
+def _count_delivery(path: str):
+    with _stats_lock:
+        first = _delivery_counts[path] == 0
+        _delivery_counts[path] += 1
+    if first and path in ("zerocopy", "threadpool"):
+        if path == "zerocopy":
+            logger.info("File delivery: server offers ASGI zero-copy send, large bodies use os.sendfile")
+        else:
+            logger.info("File delivery: server has no ASGI zero-copy send, large bodies use threadpool reads")
+
+def get_delivery_stats() -> dict:
+    """Configured mode and how many large bodies each path has sent"""
+    with _stats_lock:
+        return {
+            "mode": FILE_DELIVERY_MODE,
+            "min_bytes": FILE_DELIVERY_MIN_BYTES,
+            "sent": dict(_delivery_counts),
+        }
+
+class RangeNotSatisfiableError(Exception):
+    """Raised when none of the requested byte ranges overlap the file"""
+
+def file_version(stat_result: os.stat_result) -> str:
+    """Strong validator derived from inode, size and mtime"""
+    return f"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{file_version(stat_result)}"'
+
+def content_disposition(disposition: str, filename: Optional[str]) -> str:
+    if not filename:
+        return disposition
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+def _etag_matches(header_value: str, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match"""
+    if header_value.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def _not_modified_since(header_value: str, stat_result: os.stat_result) -> bool:
+    try:
+        since = parsedate_to_datetime(header_value)
+    except (TypeError, ValueError):
+        return False
+    return int(stat_result.st_mtime) <= since.timestamp()
+
+def parse_range_header(header_value: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a bytes Range header into sorted, merged inclusive (start, end) pairs.
+    Returns None when the header should be ignored and raises
+    RangeNotSatisfiableError when no range overlaps the file.
+    """
+    unit, _, range_set = header_value.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+
+    ranges = []
+    for part in range_set.split(","):
+        start_text, sep, end_text = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_text == "":
+                # Suffix range: last N bytes
+                suffix_length = int(end_text)
+                if suffix_length <= 0:
+                    continue
+                start, end = max(0, file_size - suffix_length), file_size - 1
+            else:
+                start = int(start_text)
+                end = int(end_text) if end_text else file_size - 1
+                if end_text and end < start:
+                    return None
+                end = min(end, file_size - 1)
+        except ValueError:
+            return None
+
+        if start < file_size and start <= end:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiableError()
+
+    # Merge overlapping/adjacent ranges so clients can't amplify reads
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(FILE_STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _read_segments(path: str, segments: List[Segment]) -> Iterator[bytes]:
+    for segment in segments:
+        if isinstance(segment, bytes):
+            yield segment
+        else:
+            yield from _read_range(path, *segment)
+
+class SendfileResponse(Response):
+    """
+    Sends file ranges with the ASGI "http.response.zerocopysend" extension,
+    which lets the server call os.sendfile on the socket. Servers without the
+    extension get large threadpool reads instead of per-chunk generator steps.
+    """
+
+    def __init__(self, path: str, segments: List[Segment], status_code: int, headers: Dict[str, str], media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.segments = segments
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zero_copy = "http.response.zerocopysend" in scope.get("extensions", {})
+        _count_delivery("zerocopy" if zero_copy else "threadpool")
+        file = await run_in_threadpool(open, self.path, "rb")
+        try:
+            for segment in self.segments:
+                if isinstance(segment, bytes):
+                    await send({"type": "http.response.body", "body": segment, "more_body": True})
+                    continue
+
+                start, end = segment
+                if zero_copy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True
+                    })
+                    continue
+
+                await run_in_threadpool(file.seek, start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await run_in_threadpool(file.read, min(SENDFILE_FALLBACK_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            await run_in_threadpool(file.close)
+
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def _offload_headers(path: str, mode: str) -> Optional[Dict[str, str]]:
+    """Headers that make the front proxy send the file itself, or None if not configured"""
+    if mode == "x-sendfile":
+        return {"X-Sendfile": os.path.abspath(path)}
+
+    if mode == "x-accel-redirect":
+        normalized_path = os.path.normpath(os.path.abspath(path))
+        for root, location in _accel_mappings:
+            if normalized_path.startswith(root + os.sep):
+                relative_path = os.path.relpath(normalized_path, root).replace(os.sep, "/")
+                return {"X-Accel-Redirect": f"{location}/{quote(relative_path)}"}
+
+    return None
+
+def build_file_response(
+    request: Request,
+    path: str,
+    media_type: str,
+    disposition: str = "inline",
+    filename: Optional[str] = None,
+    headers: Optional[dict] = None,
+    delivery_mode: Optional[str] = None,
+    cache_version: Optional[str] = None
+) -> Response:
+    """
+    Serve a file with strong ETags, Last-Modified, conditional GET (304)
+    and single or multi-part byte ranges (206 / 416). Large bodies are sent
+    according to FILE_DELIVERY_MODE unless delivery_mode overrides it.
+    cache_version is the ?v= value that marks the URL immutable; it defaults
+    to the served file's own version (derived files pass their source's).
+    """
+    delivery_mode = (delivery_mode or FILE_DELIVERY_MODE).lower()
+    delivery_mode = _DELIVERY_MODE_ALIASES.get(delivery_mode, delivery_mode)
+    stat_result = os.stat(path)
+    file_size = stat_result.st_size
+    etag = make_etag(stat_result)
+
+    # URLs that carry the current version can be cached forever by the browser
+    cache_version = cache_version or file_version(stat_result)
+    if FILE_CACHE_IMMUTABLE_MAX_AGE > 0 and request.query_params.get("v") == cache_version:
+        cache_control = f"private, max-age={FILE_CACHE_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = "private, no-cache"
+
+    response_headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(disposition, filename),
+    }
+
+    # Conditional GET: If-None-Match takes precedence over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if (if_none_match and _etag_matches(if_none_match, etag)) or \
+            (not if_none_match and if_modified_since and _not_modified_since(if_modified_since, stat_result)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={
+            key: value for key, value in response_headers.items()
+            if key in ("ETag", "Last-Modified", "Cache-Control")
+        })
+
+    # The proxy serves the file itself (including ranges) once we hand it over
+    if delivery_mode in ("x-accel-redirect", "x-sendfile") and file_size >= FILE_DELIVERY_MIN_BYTES:
+        offload_headers = _offload_headers(path, delivery_mode)
+        if offload_headers:
+            _count_delivery("offloaded")
+            return Response(
+                status_code=status.HTTP_200_OK,
+                media_type=media_type,
+                headers={
+                    **{key: value for key, value in response_headers.items() if key != "Accept-Ranges"},
+                    **offload_headers
+                }
+            )
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header and file_size > 0:
+        # If-Range: only honour the range if the client's copy is still current
+        if_range = request.headers.get("if-range")
+        if not if_range or if_range.strip() == etag or \
+                (not if_range.strip().startswith(('"', 'W/')) and _not_modified_since(if_range, stat_result)):
+            try:
+                ranges = parse_range_header(range_header, file_size)
+            except RangeNotSatisfiableError:
+                return Response(
+                    status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    headers={**response_headers, "Content-Range": f"bytes */{file_size}"}
+                )
+
+    status_code = status.HTTP_206_PARTIAL_CONTENT
+    if not ranges:
+        status_code = status.HTTP_200_OK
+        segments: List[Segment] = [(0, file_size - 1)] if file_size > 0 else []
+        content_length = file_size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        segments = [(start, end)]
+        content_length = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        segments = []
+        content_length = 0
+        for start, end in ranges:
+            part_header = (
+                f"--{boundary}\r\n"
+                f"Content-Type: {media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            segments.extend([part_header, (start, end), b"\r\n"])
+            content_length += len(part_header) + (end - start + 1) + 2
+        closing = f"--{boundary}--\r\n".encode("latin-1")
+        segments.append(closing)
+        content_length += len(closing)
+        media_type = f"multipart/byteranges; boundary={boundary}"
+
+    response_headers["Content-Length"] = str(content_length)
+
+    if delivery_mode == "zerocopy-if-supported" and file_size >= FILE_DELIVERY_MIN_BYTES:
+        return SendfileResponse(
+            path,
+            segments,
+            status_code=status_code,
+            headers=response_headers,
+            media_type=media_type
+        )
+
+    if file_size >= FILE_DELIVERY_MIN_BYTES:
+        _count_delivery("stream")
+    return StreamingResponse(
+        _read_segments(path, segments),
+        status_code=status_code,
+        media_type=media_type,
+        headers=response_headers
+    )
@@ -0,0 +1,133 @@
+import os
+import time
+import shutil
+import asyncio
+import threading
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Concurrent operations allowed per kind. Each kind has its own cap so a bulk
+# delete or a tree scan can never occupy the workers interactive requests need.
+FS_OPS_LIMITS = {
+    "metadata": int(os.getenv("FS_OPS_METADATA_LIMIT", "16")),  # listings, stats, index lookups, mkdir
+    "write": int(os.getenv("FS_OPS_WRITE_LIMIT", "8")),  # upload writes, moves, renames
+    "scan": int(os.getenv("FS_OPS_SCAN_LIMIT", "2")),  # whole-tree walks (index builds, unindexed recent files, sizes)
+    "delete": int(os.getenv("FS_OPS_DELETE_LIMIT", "2")),  # unlink / rmtree
+}
+
+# Upload bytes are buffered up to this size before each executor write
+FS_WRITE_BUFFER_BYTES = int(os.getenv("FS_WRITE_BUFFER_BYTES", str(1024 * 1024)))
+
+class RateLimiter:
+    """Paces acquire() calls to `rate` units per second across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, units: float = 1):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval * units
+        if slot > now:
+            time.sleep(slot - now)
+
+class FileSystemOperations:
+    """
+    Runs blocking filesystem calls on a dedicated thread pool so async route
+    handlers never stall the event loop. Per-kind semaphores bound how many
+    calls of each kind are in flight; the pool is sized to the sum of the
+    limits, so every kind always has threads available.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = {kind: max(1, limit) for kind, limit in limits.items()}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats = {
+            kind: {"running": 0, "waiting": 0, "completed": 0, "failed": 0}
+            for kind in self.limits
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=sum(self.limits.values()),
+                thread_name_prefix="fs-ops"
+            )
+        return self._executor
+
+    def _semaphore(self, kind: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Semaphores belong to the loop that first waits on them
+            self._loop = loop
+            self._semaphores = {k: asyncio.Semaphore(limit) for k, limit in self.limits.items()}
+        return self._semaphores[kind]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def run(self, kind: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool under the limit for `kind`"""
+        if kind not in self.limits:
+            raise ValueError(f"Unknown filesystem operation kind: {kind}")
+
+        stats = self._stats[kind]
+        stats["waiting"] += 1
+        async with self._semaphore(kind):
+            stats["waiting"] -= 1
+            stats["running"] += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._get_executor(),
+                    functools.partial(fn, *args, **kwargs)
+                )
+            except Exception:
+                stats["failed"] += 1
+                raise
+            finally:
+                stats["running"] -= 1
+                stats["completed"] += 1
+
+    # Common operations
+
+    async def makedirs(self, path: str):
+        await self.run("metadata", os.makedirs, path, exist_ok=True)
+
+    async def copy_fileobj(self, source, destination_path: str, hasher=None):
+        """Copy a file object to a new file, feeding every block to hasher if given"""
+        await self.run("write", _copy_fileobj, source, destination_path, hasher)
+
+    def get_stats(self) -> dict:
+        return {
+            kind: {"limit": self.limits[kind], **counters}
+            for kind, counters in self._stats.items()
+        }
+
+def _copy_fileobj(source, destination_path: str, hasher=None):
+    with open(destination_path, "wb") as buffer:
+        if hasher is None:
+            shutil.copyfileobj(source, buffer, FS_WRITE_BUFFER_BYTES)
+            return
+        for block in iter(lambda: source.read(FS_WRITE_BUFFER_BYTES), b""):
+            hasher.update(block)
+            buffer.write(block)
+
+# Global instance
+fs_ops = FileSystemOperations(FS_OPS_LIMITS)
@@ -0,0 +1,306 @@
+import os
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlmodel import Session, select, delete
+from app.models.database import FileChecksum, engine
+from app.services.blobs import new_content_hasher
+from app.services.fs_ops import RateLimiter
+from app.services.search_index import SEARCH_INDEX_DIR
+from app.services.storage import storage_service
+from app.services.thumbnails import THUMBNAIL_CACHE_DIR
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Read budget of the scrubber per drive; 0 disables scrubbing
+SCRUB_MB_PER_SECOND = float(os.getenv("SCRUB_MB_PER_SECOND", "10"))
+# Pause between two full passes over a drive
+SCRUB_INTERVAL_HOURS = float(os.getenv("SCRUB_INTERVAL_HOURS", "24"))
+
+CHECKSUM_ALGORITHM = "blake2b-256"
+
+# Scratch areas whose files are not user content yet (or any more), and
+# caches that are rewritten all the time and would be re-baselined every pass
+_SKIPPED_DIRS = {".uploads", ".purging", THUMBNAIL_CACHE_DIR, SEARCH_INDEX_DIR}
+
+_READ_BYTES = 1024 * 1024
+
+def digest_header_value(hex_digest: str) -> str:
+    """Digest header value for a hex digest"""
+    return f"{CHECKSUM_ALGORITHM}={base64.b64encode(bytes.fromhex(hex_digest)).decode('ascii')}"
+
+class IntegrityService:
+    """
+    Content checksums for stored files, plus a background scrubber.
+
+    Uploads record the digest computed while they streamed. Rows are keyed by
+    (drive, inode) so they follow a file through renames, moves and the
+    trash. The scrubber walks every drive at a per-drive MB/s budget: files
+    whose size and mtime still match their row are re-hashed and compared
+    (a different digest means the bytes changed underneath us), files that
+    were legitimately rewritten or predate checksums get a new baseline, and
+    rows whose file was not seen during a full pass are dropped. Hashing
+    runs with no transaction open; each result is written in its own short
+    one so the scrubber never holds the database write lock while reading.
+    """
+
+    def __init__(self):
+        self.is_running = False
+        self.scrub_thread = None
+        self._wake = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._drive_stats: Dict[int, dict] = {}
+
+    # Checksums
+
+    def record(self, path: str, hex_digest: str):
+        """Store the digest of a file that was just written"""
+        drive = storage_service.get_drive_for_path(path)
+        if drive is None:
+            return
+        stat_result = os.stat(path)
+        with Session(engine) as session:
+            self._upsert(session, drive.id, drive.path, path, stat_result, hex_digest)
+            session.commit()
+
+    def _upsert(self, session: Session, drive_id: int, drive_path: str, path: str, stat_result, hex_digest: str):
+        row = session.exec(
+            select(FileChecksum).where(FileChecksum.drive_id == drive_id, FileChecksum.inode == stat_result.st_ino)
+        ).first()
+        if row is None:
+            row = FileChecksum(drive_id=drive_id, inode=stat_result.st_ino, path="", size=0, mtime=0, digest="")
+        row.path = os.path.relpath(path, drive_path).replace(os.sep, '/')
+        row.size = stat_result.st_size
+        row.mtime = stat_result.st_mtime
+        row.digest = hex_digest
+        row.status = "ok"
+        row.observed_digest = None
+        row.verified_at = datetime.utcnow()
+        session.add(row)
+
+    def get_digest(self, path: str, stat_result: Optional[os.stat_result] = None) -> Optional[str]:
+        """Recorded digest of a file, if it is still current"""
+        drive = storage_service.get_drive_for_path(path)
+        if drive is None:
+            return None
+        stat_result = stat_result or os.stat(path)
+        with Session(engine) as session:
+            row = session.exec(
+                select(FileChecksum).where(FileChecksum.drive_id == drive.id, FileChecksum.inode == stat_result.st_ino)
+            ).first()
+        if row is None or row.status != "ok" or row.size != stat_result.st_size or abs(row.mtime - stat_result.st_mtime) >= 1e-6:
+            return None
+        return row.digest
+
+    def list_mismatches(self, limit: int = 100, offset: int = 0) -> List[dict]:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(FileChecksum)
+                .where(FileChecksum.status == "mismatch")
+                .order_by(FileChecksum.verified_at.desc())
+                .offset(offset)
+                .limit(limit)
+            ).all()
+        return [
+            {
+                "id": row.id,
+                "drive_id": row.drive_id,
+                "path": row.path,
+                "size": row.size,
+                "expected_digest": row.digest,
+                "observed_digest": row.observed_digest,
+                "detected_at": row.verified_at.isoformat(),
+            }
+            for row in rows
+        ]
+
+    # Scrubber
+
+    def start_background_scrubber(self):
+        """Start the background scrubber"""
+        if SCRUB_MB_PER_SECOND <= 0:
+            logger.info("Integrity scrubber disabled")
+            return
+        if not self.is_running:
+            self.is_running = True
+            self._wake.clear()
+            self.scrub_thread = threading.Thread(target=self._run_scrubber, daemon=True)
+            self.scrub_thread.start()
+            logger.info("Integrity scrubber started")
+
+    def stop_background_scrubber(self):
+        """Stop the background scrubber"""
+        self.is_running = False
+        self._wake.set()
+        if self.scrub_thread:
+            self.scrub_thread.join()
+        logger.info("Integrity scrubber stopped")
+
+    def _run_scrubber(self):
+        while self.is_running:
+            drives = storage_service.get_available_drives()
+            if drives:
+                # One worker per drive, each with its own read budget
+                with ThreadPoolExecutor(max_workers=len(drives), thread_name_prefix="scrub") as executor:
+                    for drive in drives:
+                        executor.submit(self._scrub_drive_safely, drive.id, drive.path)
+            self._wake.wait(SCRUB_INTERVAL_HOURS * 3600)
+
+    def _scrub_drive_safely(self, drive_id: int, drive_path: str):
+        try:
+            self.scrub_drive(drive_id, drive_path)
+        except Exception as e:
+            logger.error(f"Integrity scrub failed for drive {drive_id}: {str(e)}")
+
+    def scrub_drive(self, drive_id: int, drive_path: str) -> dict:
+        """One full verification pass over a drive"""
+        limiter = RateLimiter(SCRUB_MB_PER_SECOND * 1024 * 1024)
+        pass_started = datetime.utcnow()
+        stats = {
+            "status": "running",
+            "started_at": pass_started.isoformat(),
+            "finished_at": None,
+            "files_verified": 0,
+            "files_baselined": 0,
+            "mismatches": 0,
+            "bytes_read": 0,
+        }
+        with self._stats_lock:
+            self._drive_stats[drive_id] = stats
+
+        users_root = os.path.join(drive_path, "users")
+        completed = True
+        for dirpath, dirnames, filenames in os.walk(users_root):
+            dirnames[:] = [d for d in dirnames if d not in _SKIPPED_DIRS]
+            for filename in filenames:
+                if not self.is_running:
+                    completed = False
+                    break
+                self._scrub_file(drive_id, drive_path, os.path.join(dirpath, filename), limiter, stats, pass_started)
+            if not completed:
+                break
+
+        if completed:
+            # Anything not touched during a full pass no longer exists
+            with Session(engine) as session:
+                session.exec(
+                    delete(FileChecksum).where(
+                        FileChecksum.drive_id == drive_id,
+                        FileChecksum.verified_at < pass_started
+                    )
+                )
+                session.commit()
+
+        with self._stats_lock:
+            stats["status"] = "completed" if completed else "interrupted"
+            stats["finished_at"] = datetime.utcnow().isoformat()
+        return stats
+
+    def _scrub_file(
+        self,
+        drive_id: int,
+        drive_path: str,
+        path: str,
+        limiter: RateLimiter,
+        stats: dict,
+        pass_started: datetime
+    ):
+        try:
+            stat_result = os.lstat(path)
+        except OSError:
+            return
+        if not os.path.isfile(path) or os.path.islink(path):
+            return
+
+        with Session(engine) as session:
+            row = session.exec(
+                select(FileChecksum).where(FileChecksum.drive_id == drive_id, FileChecksum.inode == stat_result.st_ino)
+            ).first()
+        unchanged = row is not None and row.size == stat_result.st_size and abs(row.mtime - stat_result.st_mtime) < 1e-6
+        if unchanged and row.verified_at >= pass_started:
+            # Another hardlink to the same content, already checked this pass
+            return
+        if unchanged and row.status == "mismatch":
+            # Already reported; keep it listed without re-reading
+            self._mark(row.id, status="mismatch")
+            return
+
+        try:
+            hex_digest = self._hash_throttled(path, limiter, stats)
+        except OSError as e:
+            # Read errors are what failing media looks like; report them too
+            logger.error(f"Could not read {path} for scrubbing: {str(e)}")
+            if row is not None:
+                with self._stats_lock:
+                    stats["mismatches"] += 1
+                self._mark(row.id, status="mismatch", observed_digest=None)
+            return
+        if hex_digest is None:
+            return
+
+        with self._stats_lock:
+            if not unchanged:
+                stats["files_baselined"] += 1
+            elif hex_digest == row.digest:
+                stats["files_verified"] += 1
+            else:
+                stats["mismatches"] += 1
+
+        if unchanged and hex_digest != row.digest:
+            logger.error(f"Checksum mismatch on drive {drive_id}: {row.path}")
+            self._mark(
+                row.id,
+                status="mismatch",
+                observed_digest=hex_digest,
+                path=os.path.relpath(path, drive_path).replace(os.sep, '/')
+            )
+            return
+
+        with Session(engine) as session:
+            self._upsert(session, drive_id, drive_path, path, stat_result, hex_digest)
+            session.commit()
+
+    def _mark(self, row_id: int, **fields):
+        """Update one checksum row in its own short transaction"""
+        with Session(engine) as session:
+            row = session.get(FileChecksum, row_id)
+            if row is None:
+                return
+            for name, value in fields.items():
+                setattr(row, name, value)
+            row.verified_at = datetime.utcnow()
+            session.add(row)
+            session.commit()
+
+    def _hash_throttled(self, path: str, limiter: RateLimiter, stats: dict) -> Optional[str]:
+        """Hash a file within the read budget; None if the scrubber is stopping"""
+        hasher = new_content_hasher()
+        with open(path, "rb") as f:
+            while True:
+                if not self.is_running:
+                    return None
+                block = f.read(_READ_BYTES)
+                if not block:
+                    break
+                limiter.acquire(len(block))
+                hasher.update(block)
+                with self._stats_lock:
+                    stats["bytes_read"] += len(block)
+        return hasher.hexdigest()
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "running": self.is_running,
+                "mb_per_second_per_drive": SCRUB_MB_PER_SECOND,
+                "drives": {drive_id: dict(stats) for drive_id, stats in self._drive_stats.items()},
+            }
+
+# Global instance
+integrity_service = IntegrityService()
@@ -0,0 +1,261 @@
+import os
+import queue
+import logging
+import mimetypes
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from PIL import Image
+from PIL.ExifTags import TAGS
+from sqlmodel import Session, select, delete
+from app.models.database import PhotoMetadata, engine
+
+logger = logging.getLogger(__name__)
+
+# Keep IN (...) lists well below SQLite's bound parameter limit
+_LOOKUP_BATCH_SIZE = 500
+
+# Metadata keys exposed on photo listings
+PHOTO_METADATA_FIELDS = ("date_taken", "camera_make", "camera_model", "location")
+
+def extract_photo_metadata(file_path):
+    """Extract metadata from photo files including EXIF data"""
+    try:
+        # Default metadata
+        metadata = {
+            "date_taken": None,
+            "camera_make": None,
+            "camera_model": None,
+            "location": None
+        }
+
+        # Check if it's an image file
+        try:
+            with Image.open(file_path) as image:
+                # Extract EXIF data
+                exif_data = image.getexif()
+
+                if exif_data:
+                    # Get date taken
+                    for tag_id, value in exif_data.items():
+                        tag = TAGS.get(tag_id, tag_id)
+
+                        if tag == "DateTime":
+                            try:
+                                # Parse EXIF date format: "YYYY:MM:DD HH:MM:SS"
+                                date_taken = datetime.strptime(str(value), "%Y:%m:%d %H:%M:%S")
+                                metadata["date_taken"] = date_taken.isoformat()
+                            except (ValueError, TypeError):
+                                pass
+                        elif tag == "Make":
+                            metadata["camera_make"] = str(value).strip()
+                        elif tag == "Model":
+                            metadata["camera_model"] = str(value).strip()
+                        elif tag == "GPSInfo":
+                            # GPS data extraction could be added here
+                            pass
+
+        except Exception:
+            # Not an image file or can't read EXIF data
+            pass
+
+        return metadata
+    except Exception:
+        return {
+            "date_taken": None,
+            "camera_make": None,
+            "camera_model": None,
+            "location": None
+        }
+
+def is_image_file(filename: str) -> bool:
+    mime_type = mimetypes.guess_type(filename)[0]
+    return bool(mime_type and mime_type.startswith('image/'))
+
+class PhotoIndexService:
+    """
+    Photo metadata index keyed by (user, path, size, mtime).
+
+    Listings only read the table; files that are missing or stale are queued
+    for a background worker, which is the only place images are opened.
+    """
+
+    def __init__(self):
+        self.is_running = False
+        self.worker_thread = None
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._scanned_users = set()
+
+    def start_background_indexer(self):
+        """Start the background indexing worker"""
+        if not self.is_running:
+            self.is_running = True
+            self.worker_thread = threading.Thread(target=self._run_worker, daemon=True)
+            self.worker_thread.start()
+            logger.info("Photo indexer started")
+
+    def stop_background_indexer(self):
+        """Stop the background indexing worker"""
+        self.is_running = False
+        if self.worker_thread:
+            self._queue.put(None)
+            self.worker_thread.join()
+        logger.info("Photo indexer stopped")
+
+    def _enqueue(self, job: tuple):
+        with self._pending_lock:
+            if job in self._pending:
+                return
+            self._pending.add(job)
+        self._queue.put(job)
+
+    def enqueue_file(self, storage_id: str, photos_path: str, rel_path: str):
+        """Queue a single photo for (re)indexing"""
+        self._enqueue(("file", storage_id, photos_path, rel_path))
+
+    def enqueue_scan(self, storage_id: str, photos_path: str):
+        """Queue a full pass over a user's photos tree"""
+        self._enqueue(("scan", storage_id, photos_path))
+
+    def ensure_user_scanned(self, storage_id: str, photos_path: str):
+        """Queue a full pass the first time a user's photos are listed by this process"""
+        if storage_id not in self._scanned_users:
+            self._scanned_users.add(storage_id)
+            self.enqueue_scan(storage_id, photos_path)
+
+    def _run_worker(self):
+        while self.is_running:
+            job = self._queue.get()
+            if job is None:
+                break
+            with self._pending_lock:
+                self._pending.discard(job)
+            try:
+                if job[0] == "file":
+                    self.index_file(*job[1:])
+                else:
+                    self.scan_user(*job[1:])
+            except Exception as e:
+                logger.error(f"Photo indexing failed for {job[1:]}: {str(e)}")
+
+    def lookup(self, storage_id: str, rel_paths: Iterable[str]) -> Dict[str, PhotoMetadata]:
+        """Fetch index rows for the given relative paths (no image I/O)"""
+        rel_paths = list(rel_paths)
+        rows = {}
+        with Session(engine) as session:
+            for i in range(0, len(rel_paths), _LOOKUP_BATCH_SIZE):
+                batch = rel_paths[i:i + _LOOKUP_BATCH_SIZE]
+                statement = select(PhotoMetadata).where(
+                    PhotoMetadata.storage_id == storage_id,
+                    PhotoMetadata.path.in_(batch)
+                )
+                for row in session.exec(statement).all():
+                    rows[row.path] = row
+        return rows
+
+    def get_listing_metadata(
+        self,
+        storage_id: str,
+        photos_path: str,
+        files: List[tuple]
+    ) -> Dict[str, dict]:
+        """
+        Resolve metadata for (rel_path, size, mtime) tuples from the index.
+        Stale or missing entries fall back to empty metadata and are queued.
+        """
+        rows = self.lookup(storage_id, [rel_path for rel_path, _, _ in files])
+        results = {}
+        for rel_path, size, mtime in files:
+            row = rows.get(rel_path)
+            if row is not None and row.size == size and abs(row.mtime - mtime) < 1e-6:
+                results[rel_path] = {field: getattr(row, field) for field in PHOTO_METADATA_FIELDS}
+            else:
+                results[rel_path] = {field: None for field in PHOTO_METADATA_FIELDS}
+                self.enqueue_file(storage_id, photos_path, rel_path)
+        return results
+
+    def index_file(self, storage_id: str, photos_path: str, rel_path: str):
+        """Extract metadata for one photo and upsert its index row"""
+        full_path = os.path.join(photos_path, *rel_path.split('/'))
+        try:
+            stat_result = os.stat(full_path)
+        except OSError:
+            self.remove(storage_id, rel_path)
+            return
+
+        metadata = extract_photo_metadata(full_path)
+        with Session(engine) as session:
+            row = session.exec(
+                select(PhotoMetadata).where(
+                    PhotoMetadata.storage_id == storage_id,
+                    PhotoMetadata.path == rel_path
+                )
+            ).first()
+            if row is None:
+                row = PhotoMetadata(storage_id=storage_id, path=rel_path, size=0, mtime=0)
+            row.size = stat_result.st_size
+            row.mtime = stat_result.st_mtime
+            for field in PHOTO_METADATA_FIELDS:
+                setattr(row, field, metadata.get(field))
+            row.indexed_at = datetime.utcnow()
+            session.add(row)
+            session.commit()
+
+    def scan_user(self, storage_id: str, photos_path: str):
+        """Index new or changed photos in a user's tree and drop rows for removed files"""
+        with Session(engine) as session:
+            existing = {
+                row.path: (row.size, row.mtime)
+                for row in session.exec(
+                    select(PhotoMetadata).where(PhotoMetadata.storage_id == storage_id)
+                ).all()
+            }
+
+        seen = set()
+        indexed = 0
+        for root, dirs, files in os.walk(photos_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for file_name in files:
+                if file_name.startswith('.') or not is_image_file(file_name):
+                    continue
+                full_path = os.path.join(root, file_name)
+                rel_path = os.path.relpath(full_path, photos_path).replace(os.sep, '/')
+                seen.add(rel_path)
+                try:
+                    stat_result = os.stat(full_path)
+                except OSError:
+                    continue
+                known = existing.get(rel_path)
+                if known is None or known[0] != stat_result.st_size or abs(known[1] - stat_result.st_mtime) >= 1e-6:
+                    self.index_file(storage_id, photos_path, rel_path)
+                    indexed += 1
+
+        removed = [rel_path for rel_path in existing if rel_path not in seen]
+        for i in range(0, len(removed), _LOOKUP_BATCH_SIZE):
+            with Session(engine) as session:
+                session.exec(
+                    delete(PhotoMetadata).where(
+                        PhotoMetadata.storage_id == storage_id,
+                        PhotoMetadata.path.in_(removed[i:i + _LOOKUP_BATCH_SIZE])
+                    )
+                )
+                session.commit()
+
+        if indexed or removed:
+            logger.info(f"Photo index for {storage_id}: {indexed} indexed, {len(removed)} removed")
+
+    def remove(self, storage_id: str, rel_path: str):
+        """Drop the index row for a file, or for everything under a folder"""
+        with Session(engine) as session:
+            session.exec(
+                delete(PhotoMetadata).where(
+                    PhotoMetadata.storage_id == storage_id,
+                    (PhotoMetadata.path == rel_path) | PhotoMetadata.path.startswith(rel_path + '/', autoescape=True)
+                )
+            )
+            session.commit()
+
+# Global instance
+photo_index_service = PhotoIndexService()
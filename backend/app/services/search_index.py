@@ -0,0 +1,703 @@
+import os
+import heapq
+import sqlite3
+import logging
+import mimetypes
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Index database location under each user's storage root
+SEARCH_INDEX_DIR = ".search"
+SEARCH_INDEX_FILE = "index.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    context TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    mime_type TEXT,
+    category TEXT,
+    UNIQUE (context, path)
+);
+CREATE INDEX IF NOT EXISTS entries_recent ON entries (context, is_dir, mtime);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+    name, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO names (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO names (names, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+    INSERT INTO names (names, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO names (rowid, name) VALUES (new.id, new.name);
+END;
+"""
+
+# Catalogs created before the parent column existed
+_PARENT_INDEX = "CREATE INDEX IF NOT EXISTS entries_parent ON entries (context, parent)"
+
+def _sqlite_has_trigram() -> bool:
+    """FTS5's trigram tokenizer needs SQLite 3.34+; older builds fall back to LIKE"""
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(a, tokenize='trigram')")
+        conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+HAS_TRIGRAM_FTS = _sqlite_has_trigram()
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def get_file_category(mime_type, filename):
+    """Helper function to categorize files by type"""
+    if not mime_type and not filename:
+        return 'other'
+
+    extension = filename.split('.').pop().lower() if filename and '.' in filename else ''
+
+    # Images
+    if mime_type and mime_type.startswith('image/'):
+        return 'image'
+
+    # Videos
+    if (mime_type and mime_type.startswith('video/')) or extension in ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'mkv']:
+        return 'video'
+
+    # Audio
+    if (mime_type and mime_type.startswith('audio/')) or extension in ['mp3', 'wav', 'flac', 'aac', 'ogg', 'wma']:
+        return 'audio'
+
+    # PDFs
+    if mime_type == 'application/pdf' or extension == 'pdf':
+        return 'pdf'
+
+    # Office Documents
+    if extension in ['doc', 'docx'] or (mime_type and 'wordprocessingml' in mime_type):
+        return 'document'
+    if extension in ['xls', 'xlsx'] or (mime_type and 'spreadsheetml' in mime_type):
+        return 'spreadsheet'
+    if extension in ['ppt', 'pptx'] or (mime_type and 'presentationml' in mime_type):
+        return 'presentation'
+
+    # Text files
+    if (mime_type and mime_type.startswith('text/')) or extension in ['txt', 'md', 'json', 'xml', 'csv']:
+        return 'text'
+
+    # Archives
+    if extension in ['zip', 'rar', '7z', 'tar', 'gz']:
+        return 'archive'
+
+    return 'other'
+
+def _parent_of(rel_path: str) -> str:
+    return rel_path.rsplit('/', 1)[0] if '/' in rel_path else ''
+
+def _entry_row(context: str, rel_path: str, name: str, is_dir: bool, stat_result: os.stat_result) -> tuple:
+    parent = _parent_of(rel_path)
+    if is_dir:
+        return (context, rel_path, parent, name, 1, 0, stat_result.st_mtime, None, None)
+    mime_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return (
+        context, rel_path, parent, name, 0, stat_result.st_size, stat_result.st_mtime,
+        mime_type, get_file_category(mime_type, name)
+    )
+
+def _walk_entries(context: str, base_path: str, start_path: str) -> Iterator[tuple]:
+    """Yield index rows for everything below start_path, skipping hidden entries"""
+    stack = [start_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        stat_result = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    rel_path = os.path.relpath(entry.path, base_path).replace(os.sep, '/')
+                    yield _entry_row(context, rel_path, entry.name, is_dir, stat_result)
+                    if is_dir:
+                        stack.append(entry.path)
+        except OSError:
+            continue
+
+def _iter_files(base_path: str) -> Iterator[Tuple[float, str, os.stat_result]]:
+    """Yield (mtime, path, stat) for every visible file below base_path, one stat each"""
+    stack = [base_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        stat_result = entry.stat()
+                    except OSError:
+                        continue
+                    yield stat_result.st_mtime, entry.path, stat_result
+        except OSError:
+            continue
+
+_INSERT_SQL = (
+    "INSERT OR REPLACE INTO entries (context, path, parent, name, is_dir, size, mtime, mime_type, category) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+class SearchIndexService:
+    """
+    Persistent per-user file catalog stored as a SQLite database under the
+    user's storage root. Names are matched through an FTS5 trigram index, so
+    substring search no longer walks the tree.
+
+    The API write paths keep the catalog current; reconcile() picks up changes
+    made behind the API's back (e.g. files copied in over SMB) by comparing
+    directory mtimes with the catalog and only re-listing the directories
+    whose mtime moved.
+    """
+
+    def __init__(self):
+        # Serializes rebuilds per user so concurrent first searches don't walk twice
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._build_locks_guard = threading.Lock()
+        # Catalogs whose schema was created and migrated in this process
+        self._initialized: set = set()
+
+    def _index_path(self, user_path: str) -> str:
+        return os.path.join(user_path, SEARCH_INDEX_DIR, SEARCH_INDEX_FILE)
+
+    @contextmanager
+    def _connect(self, user_path: str):
+        index_path = self._index_path(user_path)
+        if not os.path.exists(index_path):
+            # New, or deleted since it was set up (e.g. .search removed by hand)
+            self._initialized.discard(index_path)
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        conn = sqlite3.connect(index_path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if index_path not in self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                if HAS_TRIGRAM_FTS:
+                    conn.executescript(_FTS_SCHEMA)
+                self._migrate(conn)
+                conn.commit()
+                self._initialized.add(index_path)
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _migrate(self, conn: sqlite3.Connection):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        if "parent" not in columns:
+            conn.execute("ALTER TABLE entries ADD COLUMN parent TEXT NOT NULL DEFAULT ''")
+            # Existing rows have no parent yet; rebuild on next use
+            conn.execute("DELETE FROM meta WHERE key LIKE 'built:%'")
+        conn.execute(_PARENT_INDEX)
+
+    def _build_lock(self, user_path: str) -> threading.Lock:
+        with self._build_locks_guard:
+            lock = self._build_locks.get(user_path)
+            if lock is None:
+                lock = self._build_locks[user_path] = threading.Lock()
+            return lock
+
+    def _is_built(self, conn: sqlite3.Connection, context: str) -> bool:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (f"built:{context}",)).fetchone()
+        return row is not None
+
+    def is_built(self, user_path: str, context: str) -> bool:
+        if not os.path.exists(self._index_path(user_path)):
+            return False
+        with self._connect(user_path) as conn:
+            return self._is_built(conn, context)
+
+    def rebuild(self, user_path: str, context: str, base_path: str) -> int:
+        """Re-index a whole context from disk; returns the number of entries"""
+        with self._build_lock(user_path):
+            return self._rebuild(user_path, context, base_path)
+
+    def _rebuild(self, user_path: str, context: str, base_path: str) -> int:
+        # Caller holds the user's build lock
+        with self._connect(user_path) as conn:
+            conn.execute("DELETE FROM entries WHERE context = ?", (context,))
+            # Taken before the walk so changes made during it are reconciled later
+            try:
+                root_mtime = os.stat(base_path).st_mtime
+            except OSError:
+                root_mtime = None
+            count = 0
+            batch = []
+            for row in _walk_entries(context, base_path, base_path):
+                batch.append(row)
+                if len(batch) >= 1000:
+                    conn.executemany(_INSERT_SQL, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany(_INSERT_SQL, batch)
+                count += len(batch)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, datetime('now'))",
+                (f"built:{context}",)
+            )
+            if root_mtime is not None:
+                self._record_dir_mtime(conn, context, "", root_mtime)
+        logger.info(f"Search index rebuilt for {user_path} ({context}): {count} entries")
+        return count
+
+    def ensure_built(self, user_path: str, context: str, base_path: str):
+        if self.is_built(user_path, context):
+            return
+        with self._build_lock(user_path):
+            # Re-check under the lock: a concurrent caller may have just built it
+            if not self.is_built(user_path, context):
+                self._rebuild(user_path, context, base_path)
+
+    def cataloged_bytes(self, user_path: str, context: str) -> Optional[int]:
+        """Total size of the files in a context's catalog; None if it was never built"""
+        if not os.path.exists(self._index_path(user_path)):
+            return None
+        with self._connect(user_path) as conn:
+            if not self._is_built(conn, context):
+                return None
+            return conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE context = ? AND is_dir = 0", (context,)
+            ).fetchone()[0]
+
+    def add_path(self, user_path: str, context: str, base_path: str, rel_path: str):
+        """Index a new file, or a folder and everything below it"""
+        rel_path = rel_path.replace(os.sep, '/').strip('/')
+        full_path = os.path.join(base_path, *rel_path.split('/'))
+        try:
+            stat_result = os.stat(full_path)
+        except OSError:
+            return
+
+        name = os.path.basename(full_path)
+        if any(part.startswith('.') for part in rel_path.split('/')):
+            return
+        is_dir = os.path.isdir(full_path)
+
+        with self._connect(user_path) as conn:
+            # Unbuilt indexes pick the change up when they are first built
+            if not self._is_built(conn, context):
+                return
+            # Parent folders the catalog does not know yet (e.g. nested create-folder
+            # paths, or folders copied in out of band): index the first one whole
+            parts = rel_path.split('/')
+            for depth in range(1, len(parts)):
+                ancestor = '/'.join(parts[:depth])
+                if conn.execute(
+                    "SELECT 1 FROM entries WHERE context = ? AND path = ?", (context, ancestor)
+                ).fetchone():
+                    continue
+                ancestor_path = os.path.join(base_path, *parts[:depth])
+                try:
+                    ancestor_stat = os.stat(ancestor_path)
+                except OSError:
+                    return
+                conn.execute(_INSERT_SQL, _entry_row(context, ancestor, parts[depth - 1], True, ancestor_stat))
+                conn.executemany(_INSERT_SQL, _walk_entries(context, base_path, ancestor_path))
+                return
+            conn.execute(_INSERT_SQL, _entry_row(context, rel_path, name, is_dir, stat_result))
+            if is_dir:
+                conn.executemany(_INSERT_SQL, _walk_entries(context, base_path, full_path))
+
+    def remove_path(self, user_path: str, context: str, rel_path: str):
+        """Drop a file, or a folder and everything below it, from the index"""
+        rel_path = rel_path.replace(os.sep, '/').strip('/')
+        if not os.path.exists(self._index_path(user_path)):
+            return
+        with self._connect(user_path) as conn:
+            self._delete_subtree(conn, context, rel_path)
+
+    def _recorded_dir_mtime(self, conn: sqlite3.Connection, context: str, rel_dir: str) -> Optional[float]:
+        if rel_dir == "":
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (f"root_mtime:{context}",)).fetchone()
+            return float(row[0]) if row else None
+        row = conn.execute(
+            "SELECT mtime FROM entries WHERE context = ? AND path = ? AND is_dir = 1",
+            (context, rel_dir)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _record_dir_mtime(self, conn: sqlite3.Connection, context: str, rel_dir: str, mtime: float):
+        if rel_dir == "":
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (f"root_mtime:{context}", repr(mtime))
+            )
+        else:
+            conn.execute("UPDATE entries SET mtime = ? WHERE context = ? AND path = ?", (mtime, context, rel_dir))
+
+    def _delete_subtree(self, conn: sqlite3.Connection, context: str, rel_path: str) -> int:
+        """Drop an entry and everything below it; returns the bytes it accounted for"""
+        where = "context = ? AND (path = ? OR path LIKE ? ESCAPE '\\')"
+        params = (context, rel_path, _escape_like(rel_path) + "/%")
+        (size,) = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM entries WHERE {where}", params).fetchone()
+        conn.execute(f"DELETE FROM entries WHERE {where}", params)
+        return size
+
+    def _track_added(self, rows: Iterable[tuple], stats: dict) -> Iterator[tuple]:
+        for row in rows:
+            stats["added"] += 1
+            if row[4]:
+                stats["changes"].append(("create", row[1], True, None))
+            else:
+                stats["bytes"] += row[5]
+                stats["changes"].append(("create", row[1], False, row[5]))
+            yield row
+
+    def _rescan_directory(
+        self,
+        conn: sqlite3.Connection,
+        context: str,
+        base_path: str,
+        rel_dir: str,
+        full_dir: str,
+        stats: dict
+    ) -> List[str]:
+        """
+        Bring one directory's direct children in line with disk. New folders
+        are indexed whole; returns the folders that were already known, which
+        still need their own mtime check.
+        """
+        known = {
+            name: (is_dir, size, mtime)
+            for name, is_dir, size, mtime in conn.execute(
+                "SELECT name, is_dir, size, mtime FROM entries WHERE context = ? AND parent = ?",
+                (context, rel_dir)
+            )
+        }
+        known_dirs = []
+        seen = set()
+        with os.scandir(full_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    stat_result = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                seen.add(entry.name)
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                row = known.get(entry.name)
+
+                if row is not None and bool(row[0]) == is_dir:
+                    if is_dir:
+                        # Its mtime is only recorded once its own children are reconciled
+                        known_dirs.append(rel_path)
+                    elif row[1] != stat_result.st_size or abs(row[2] - stat_result.st_mtime) >= 1e-6:
+                        conn.execute(
+                            "UPDATE entries SET size = ?, mtime = ? WHERE context = ? AND path = ?",
+                            (stat_result.st_size, stat_result.st_mtime, context, rel_path)
+                        )
+                        stats["updated"] += 1
+                        stats["bytes"] += stat_result.st_size - row[1]
+                        stats["changes"].append(("modify", rel_path, False, stat_result.st_size))
+                    continue
+
+                if row is not None:
+                    # Replaced by an entry of the other kind
+                    stats["bytes"] -= self._delete_subtree(conn, context, rel_path)
+                    stats["changes"].append(("delete", rel_path, bool(row[0]), None))
+                new_row = _entry_row(context, rel_path, entry.name, is_dir, stat_result)
+                conn.executemany(_INSERT_SQL, self._track_added([new_row], stats))
+                if is_dir:
+                    conn.executemany(
+                        _INSERT_SQL, self._track_added(_walk_entries(context, base_path, entry.path), stats)
+                    )
+
+        for name, (was_dir, _, _) in known.items():
+            if name not in seen:
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                stats["bytes"] -= self._delete_subtree(conn, context, rel_path)
+                stats["changes"].append(("delete", rel_path, bool(was_dir), None))
+                stats["removed"] += 1
+        return known_dirs
+
+    def _new_sync_stats(self) -> dict:
+        return {
+            "dirs_checked": 0,
+            "dirs_rescanned": 0,
+            "added": 0,
+            "updated": 0,
+            "removed": 0,
+            # Net size change, and (action, path, is_dir, size) for every change found
+            "bytes": 0,
+            "changes": [],
+        }
+
+    def _rescan_step(
+        self,
+        conn: sqlite3.Connection,
+        context: str,
+        base_path: str,
+        rel_dir: str,
+        full_dir: str,
+        dir_mtime: float,
+        stats: dict,
+        step: Optional[Callable[[], ContextManager[dict]]]
+    ) -> List[str]:
+        """
+        Rescan one folder and commit it. step, if given, is entered before the
+        folder is touched and receives the folder's net byte change as
+        "bytes" before it exits, so the caller can apply it atomically with
+        the rescan. Raises OSError (with nothing changed) if the folder
+        cannot be listed.
+        """
+        with step() if step is not None else nullcontext({}) as folder:
+            bytes_before, changes_before = stats["bytes"], len(stats["changes"])
+            try:
+                known_dirs = self._rescan_directory(conn, context, base_path, rel_dir, full_dir, stats)
+            except OSError:
+                conn.rollback()
+                stats["bytes"] = bytes_before
+                del stats["changes"][changes_before:]
+                raise
+            self._record_dir_mtime(conn, context, rel_dir, dir_mtime)
+            # Keep write locks short so API updates are not held up
+            conn.commit()
+            stats["dirs_rescanned"] += 1
+            folder["bytes"] = stats["bytes"] - bytes_before
+        return known_dirs
+
+    def reconcile(
+        self,
+        user_path: str,
+        context: str,
+        base_path: str,
+        step: Optional[Callable[[], ContextManager[dict]]] = None
+    ) -> dict:
+        """
+        Sync a built catalog with changes made outside the API. Every folder
+        is stat'ed, but only folders whose mtime differs from the catalog are
+        re-listed. A file rewritten in place does not move its folder's mtime,
+        so such edits are picked up by the next rebuild or upload instead.
+        step wraps each folder's rescan (see _rescan_step).
+        """
+        stats = self._new_sync_stats()
+        if not self.is_built(user_path, context):
+            return stats
+
+        with self._build_lock(user_path):
+            with self._connect(user_path) as conn:
+                if not self._is_built(conn, context):
+                    return stats
+                stack = [""]
+                while stack:
+                    rel_dir = stack.pop()
+                    full_dir = os.path.join(base_path, *rel_dir.split('/')) if rel_dir else base_path
+                    try:
+                        dir_mtime = os.stat(full_dir).st_mtime
+                    except OSError:
+                        # Gone; its parent's rescan drops it
+                        continue
+                    stats["dirs_checked"] += 1
+
+                    recorded = self._recorded_dir_mtime(conn, context, rel_dir)
+                    if recorded is not None and abs(recorded - dir_mtime) < 1e-6:
+                        stack.extend(
+                            path for (path,) in conn.execute(
+                                "SELECT path FROM entries WHERE context = ? AND parent = ? AND is_dir = 1",
+                                (context, rel_dir)
+                            )
+                        )
+                        continue
+
+                    try:
+                        stack.extend(self._rescan_step(
+                            conn, context, base_path, rel_dir, full_dir, dir_mtime, stats, step
+                        ))
+                    except OSError as e:
+                        logger.warning(f"Could not reconcile {full_dir}: {str(e)}")
+        return stats
+
+    def refresh_directories(
+        self,
+        user_path: str,
+        context: str,
+        base_path: str,
+        rel_dirs: Iterable[str],
+        step: Optional[Callable[[], ContextManager[dict]]] = None
+    ) -> dict:
+        """
+        Re-list specific folders that are known to have changed (e.g. reported
+        by a filesystem watcher), regardless of their mtime. Folders the
+        catalog has never seen are left to their parent's refresh. step wraps
+        each folder's rescan (see _rescan_step).
+        """
+        stats = self._new_sync_stats()
+        if not self.is_built(user_path, context):
+            return stats
+
+        with self._build_lock(user_path):
+            with self._connect(user_path) as conn:
+                if not self._is_built(conn, context):
+                    return stats
+                # Parents first, so folders they add are known by the time their children come up
+                for rel_dir in sorted(set(rel_dirs), key=lambda path: (path.count('/'), path)):
+                    full_dir = os.path.join(base_path, *rel_dir.split('/')) if rel_dir else base_path
+                    if rel_dir and self._recorded_dir_mtime(conn, context, rel_dir) is None:
+                        continue
+                    try:
+                        dir_mtime = os.stat(full_dir).st_mtime
+                        stats["dirs_checked"] += 1
+                        self._rescan_step(conn, context, base_path, rel_dir, full_dir, dir_mtime, stats, step)
+                    except OSError:
+                        continue
+        return stats
+
+    def recent_files(
+        self,
+        user_path: str,
+        context: str,
+        base_path: str,
+        limit: int
+    ) -> List[Tuple[str, os.stat_result]]:
+        """
+        Most recently modified files as (relative path, stat) pairs. Uses the
+        mtime index when it has been built, otherwise a single scandir pass
+        keeping only the top `limit` entries.
+        """
+        if limit <= 0:
+            return []
+
+        if self.is_built(user_path, context):
+            results = []
+            with self._connect(user_path) as conn:
+                cursor = conn.execute(
+                    "SELECT path FROM entries WHERE context = ? AND is_dir = 0 ORDER BY mtime DESC",
+                    (context,)
+                )
+                # Stat only the rows we return; rows for files removed behind our back are skipped
+                for (rel_path,) in cursor:
+                    try:
+                        stat_result = os.stat(os.path.join(base_path, *rel_path.split('/')))
+                    except OSError:
+                        continue
+                    results.append((rel_path, stat_result))
+                    if len(results) >= limit:
+                        break
+            return results
+
+        top = heapq.nlargest(limit, _iter_files(base_path), key=lambda item: item[0])
+        return [
+            (os.path.relpath(path, base_path).replace(os.sep, '/'), stat_result)
+            for _, path, stat_result in top
+        ]
+
+    def search(
+        self,
+        user_path: str,
+        context: str,
+        base_path: str,
+        query: str,
+        file_type: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0
+    ) -> Tuple[List[dict], Dict[str, int]]:
+        """
+        Ranked, paginated name search. Folders come first, then prefix matches,
+        then FTS relevance and name. Returns (page, counts).
+        """
+        self.ensure_built(user_path, context, base_path)
+
+        query_lower = query.strip().lower()
+        conditions = ["e.context = ?"]
+        params: list = [context]
+
+        if HAS_TRIGRAM_FTS and len(query_lower) >= 3:
+            source = "entries e JOIN names ON names.rowid = e.id"
+            conditions.append("names MATCH ?")
+            params.append('"' + query_lower.replace('"', '""') + '"')
+            relevance = "bm25(names),"
+        else:
+            # Trigrams need at least three characters
+            source = "entries e"
+            conditions.append("lower(e.name) LIKE ? ESCAPE '\\'")
+            params.append("%" + _escape_like(query_lower) + "%")
+            relevance = ""
+
+        if file_type:
+            conditions.append("(e.is_dir = 1 OR e.category = ?)")
+            params.append(file_type.lower())
+
+        where = " AND ".join(conditions)
+        prefix = _escape_like(query_lower) + "%"
+
+        with self._connect(user_path) as conn:
+            total_count, folder_count = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(e.is_dir), 0) FROM {source} WHERE {where}",
+                params
+            ).fetchone()
+
+            rows = conn.execute(
+                f"""
+                SELECT e.path, e.name, e.is_dir, e.size, e.mtime, e.mime_type, e.category
+                FROM {source}
+                WHERE {where}
+                ORDER BY e.is_dir DESC,
+                         (lower(e.name) LIKE ? ESCAPE '\\') DESC,
+                         {relevance}
+                         lower(e.name)
+                LIMIT ? OFFSET ?
+                """,
+                params + [prefix, limit, offset]
+            ).fetchall()
+
+        results = []
+        for path, name, is_dir, size, mtime, mime_type, category in rows:
+            result = {
+                "name": name,
+                "path": path,
+                "type": "folder" if is_dir else "file",
+                "is_directory": bool(is_dir),
+                "size": size,
+                "modified_timestamp": mtime,
+                "match_type": "name"
+            }
+            if not is_dir:
+                result["mimeType"] = mime_type
+                result["category"] = category
+            results.append(result)
+
+        counts = {
+            "total_count": total_count,
+            "folder_count": folder_count,
+            "file_count": total_count - folder_count
+        }
+        return results, counts
+
+# Global instance
+search_index_service = SearchIndexService()
@@ -1,9 +1,12 @@
 import os
 import shutil
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Mapping, Tuple
+from types import MappingProxyType
+from dataclasses import dataclass, field
 import uuid
 import re
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
 from sqlmodel import Session, select
@@ -14,16 +17,56 @@ load_dotenv()
 # Get NAS storage path from environment (fallback for legacy support)
 NAS_STORAGE_PATH = os.getenv("NAS_STORAGE_PATH", "./nas_storage")
 
+@dataclass(frozen=True)
+class DriveRegistrySnapshot:
+    """Immutable view of the storagedrive table; replaced wholesale on every change"""
+    drives: Tuple[StorageDrive, ...] = ()
+    by_id: Mapping[int, StorageDrive] = field(default_factory=lambda: MappingProxyType({}))
+    active: Tuple[StorageDrive, ...] = ()
+    default: Optional[StorageDrive] = None
+    loaded: bool = False
+
 class MultiDriveStorageService:
     def __init__(self):
         self.legacy_base_path = Path(NAS_STORAGE_PATH)
         self._initialized = False
+        # Readers just grab the current reference; only refreshes take the lock
+        self._registry = DriveRegistrySnapshot()
+        self._registry_lock = threading.Lock()
     
     def _ensure_initialized(self):
         """Ensure the service is initialized (called on first use)"""
         if not self._initialized:
             self._initialize_default_drive()
             self._initialized = True
+            self.refresh_drive_registry()
+    
+    def refresh_drive_registry(self) -> DriveRegistrySnapshot:
+        """Reload drives from the database and publish a new snapshot"""
+        with self._registry_lock:
+            try:
+                with Session(engine) as session:
+                    drives = tuple(session.exec(select(StorageDrive).order_by(StorageDrive.id)).all())
+            except Exception:
+                # Tables may not exist yet; keep serving the previous snapshot
+                return self._registry
+            
+            active = tuple(drive for drive in drives if drive.status == DriveStatus.ACTIVE)
+            self._registry = DriveRegistrySnapshot(
+                drives=drives,
+                by_id=MappingProxyType({drive.id: drive for drive in drives}),
+                active=active,
+                default=next((drive for drive in active if drive.is_default), None),
+                loaded=True
+            )
+            return self._registry
+    
+    def _get_registry(self) -> DriveRegistrySnapshot:
+        self._ensure_initialized()
+        registry = self._registry
+        if not registry.loaded:
+            registry = self.refresh_drive_registry()
+        return registry
     
     def _initialize_default_drive(self):
         """Initialize default drive if none exists"""
@@ -53,27 +96,26 @@ class MultiDriveStorageService:
     
     def get_available_drives(self) -> List[StorageDrive]:
         """Get all active storage drives"""
-        self._ensure_initialized()
-        with Session(engine) as session:
-            statement = select(StorageDrive).where(StorageDrive.status == DriveStatus.ACTIVE)
-            return list(session.exec(statement).all())
+        return list(self._get_registry().active)
     
     def get_default_drive(self) -> Optional[StorageDrive]:
         """Get the default storage drive"""
-        self._ensure_initialized()
-        with Session(engine) as session:
-            statement = select(StorageDrive).where(
-                StorageDrive.is_default == True,
-                StorageDrive.status == DriveStatus.ACTIVE
-            )
-            return session.exec(statement).first()
+        return self._get_registry().default
     
     def get_drive_by_id(self, drive_id: int) -> Optional[StorageDrive]:
         """Get a drive by ID"""
-        self._ensure_initialized()
-        with Session(engine) as session:
-            statement = select(StorageDrive).where(StorageDrive.id == drive_id)
-            return session.exec(statement).first()
+        return self._get_registry().by_id.get(drive_id)
+    
+    def get_drive_for_path(self, path: str) -> Optional[StorageDrive]:
+        """Get the drive whose root contains path (longest matching root wins)"""
+        target = os.path.normcase(os.path.abspath(path))
+        best = None
+        best_length = -1
+        for drive in self._get_registry().drives:
+            root = os.path.normcase(os.path.abspath(drive.path))
+            if (target == root or target.startswith(root.rstrip(os.sep) + os.sep)) and len(root) > best_length:
+                best, best_length = drive, len(root)
+        return best
     
     def get_drive_usage(self, drive_id: int) -> Dict:
         """Get usage statistics for a drive"""
@@ -282,7 +324,9 @@ class DriveManagementService:
             session.add(new_drive)
             session.commit()
             session.refresh(new_drive)
-            return new_drive
+        
+        storage_service.refresh_drive_registry()
+        return new_drive
     
     def update_drive(self, drive_id: int, name: Optional[str] = None, 
                      capacity_gb: Optional[float] = None, description: Optional[str] = None,
@@ -306,7 +350,9 @@ class DriveManagementService:
             session.add(drive)
             session.commit()
             session.refresh(drive)
-            return drive
+        
+        storage_service.refresh_drive_registry()
+        return drive
     
     def set_default_drive(self, drive_id: int) -> bool:
         """Set a drive as the default drive"""
@@ -319,13 +365,15 @@ class DriveManagementService:
             
             # Set new default
             target_drive = session.get(StorageDrive, drive_id)
-            if target_drive and target_drive.status == DriveStatus.ACTIVE:
-                target_drive.is_default = True
-                session.add(target_drive)
-                session.commit()
-                return True
+            if not target_drive or target_drive.status != DriveStatus.ACTIVE:
+                return False
             
-            return False
+            target_drive.is_default = True
+            session.add(target_drive)
+            session.commit()
+        
+        storage_service.refresh_drive_registry()
+        return True
     
     def remove_drive(self, drive_id: int, force: bool = False) -> bool:
         """Remove a storage drive (requires force=True if it has users)"""
@@ -350,7 +398,9 @@ class DriveManagementService:
                 session.delete(drive)
             
             session.commit()
-            return True
+        
+        storage_service.refresh_drive_registry()
+        return True
 
 # Create service instances
 storage_service = MultiDriveStorageService()
@@ -0,0 +1,208 @@
+import os
+import asyncio
+import hashlib
+import logging
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from app.services.fs_ops import fs_ops
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each named thumbnail size
+THUMBNAIL_SIZES = {
+    "small": 256,
+    "medium": 512,
+    "large": 1024,
+}
+
+# Output format name -> (Pillow format, MIME type, file extension)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+# Sizes generated right after an upload so the first grid render is a cache hit
+THUMBNAIL_PREGENERATE_SIZES = [
+    size.strip() for size in os.getenv("THUMBNAIL_PREGENERATE_SIZES", "small,medium").split(",")
+    if size.strip() in THUMBNAIL_SIZES
+]
+
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) // 2)))))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+
+# Cache directory name under each user's storage root
+THUMBNAIL_CACHE_DIR = ".thumbnails"
+
+def render_thumbnail(source_path: str, target_path: str, max_edge: int, image_format: str, quality: int):
+    """Render one thumbnail; runs inside the process pool"""
+    with Image.open(source_path) as image:
+        # JPEG fast path: let the decoder downscale by 1/2, 1/4 or 1/8 while reading
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        if image_format == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+        # reducing_gap makes thumbnail() use Image.reduce() before the final resample
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+        temp_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            image.save(temp_path, image_format, quality=quality)
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+class ThumbnailService:
+    """Generates thumbnails in a process pool and caches them on disk per user"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Submissions run on fs_ops threads, so the in-flight table is locked;
+        # reentrant because a render that is already done calls back inline
+        self._in_flight_lock = threading.RLock()
+        self._in_flight: Dict[str, Future] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        return self._executor
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _source_dir(self, user_path: str, context: str, rel_path: str) -> str:
+        digest = hashlib.sha1(f"{context}/{rel_path}".encode("utf-8")).hexdigest()
+        return os.path.join(user_path, THUMBNAIL_CACHE_DIR, digest[:2], digest)
+
+    def cache_path(
+        self,
+        user_path: str,
+        context: str,
+        rel_path: str,
+        source_stat: os.stat_result,
+        size: str,
+        image_format: str
+    ) -> str:
+        """Cache file for a source; the name changes whenever the source's size or mtime does"""
+        extension = THUMBNAIL_FORMATS[image_format][2]
+        filename = f"{size}-{source_stat.st_size:x}-{source_stat.st_mtime_ns:x}.{extension}"
+        return os.path.join(self._source_dir(user_path, context, rel_path), filename)
+
+    def _submit(
+        self,
+        user_path: str,
+        context: str,
+        rel_path: str,
+        source_path: str,
+        size: str,
+        image_format: str
+    ) -> Tuple[str, Optional[Future]]:
+        source_stat = os.stat(source_path)
+        target_path = self.cache_path(user_path, context, rel_path, source_stat, size, image_format)
+        if os.path.exists(target_path):
+            return target_path, None
+
+        with self._in_flight_lock:
+            future = self._in_flight.get(target_path)
+            if future is None:
+                future = self._start_render(target_path, source_path, source_stat, size, image_format)
+        return target_path, future
+
+    def _start_render(
+        self,
+        target_path: str,
+        source_path: str,
+        source_stat: os.stat_result,
+        size: str,
+        image_format: str
+    ) -> Future:
+        source_dir = os.path.dirname(target_path)
+        os.makedirs(source_dir, exist_ok=True)
+
+        # Drop variants rendered from an older version of the source
+        current_version = f"-{source_stat.st_size:x}-{source_stat.st_mtime_ns:x}."
+        for name in os.listdir(source_dir):
+            if current_version not in name and not name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(source_dir, name))
+                except OSError:
+                    pass
+
+        future = self._get_executor().submit(
+            render_thumbnail,
+            source_path,
+            target_path,
+            THUMBNAIL_SIZES[size],
+            THUMBNAIL_FORMATS[image_format][0],
+            THUMBNAIL_QUALITY
+        )
+        self._in_flight[target_path] = future
+        future.add_done_callback(lambda _: self._forget(target_path))
+        return future
+
+    def _forget(self, target_path: str):
+        with self._in_flight_lock:
+            self._in_flight.pop(target_path, None)
+
+    async def get_thumbnail(
+        self,
+        user_path: str,
+        context: str,
+        rel_path: str,
+        source_path: str,
+        size: str,
+        image_format: str
+    ) -> str:
+        """Return the cached thumbnail path, rendering it off the event loop if needed"""
+        target_path, future = await fs_ops.run(
+            "metadata", self._submit, user_path, context, rel_path, source_path, size, image_format
+        )
+        if future is not None:
+            await asyncio.wrap_future(future)
+        return target_path
+
+    def pregenerate(self, user_path: str, context: str, rel_path: str, source_path: str):
+        """Queue the default thumbnail sizes for a new upload without waiting"""
+        for size in THUMBNAIL_PREGENERATE_SIZES:
+            try:
+                _, future = self._submit(user_path, context, rel_path, source_path, size, "webp")
+                if future is not None:
+                    future.add_done_callback(self._log_failure)
+            except Exception as e:
+                logger.error(f"Failed to queue thumbnail for {rel_path}: {str(e)}")
+
+    def _log_failure(self, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Thumbnail generation failed: {future.exception()}")
+
+    def remove_thumbnails(self, user_path: str, context: str, rel_path: str):
+        """Delete every cached size of a source file"""
+        shutil.rmtree(self._source_dir(user_path, context, rel_path), ignore_errors=True)
+
+    def remove_folder_thumbnails(self, user_path: str, context: str, rel_dir: str, folder_path: str):
+        """
+        Delete cached thumbnails of every file that was under rel_dir.
+        The cache is keyed by a hash of each file's path, so the folder's
+        files are listed from folder_path, where the folder is now (e.g. in trash).
+        """
+        for dirpath, dirnames, filenames in os.walk(folder_path):
+            rel_parent = os.path.relpath(dirpath, folder_path)
+            for filename in filenames:
+                rel_path = filename if rel_parent == "." else os.path.join(rel_parent, filename)
+                rel_path = f"{rel_dir}/{rel_path}".replace(os.sep, '/')
+                shutil.rmtree(self._source_dir(user_path, context, rel_path), ignore_errors=True)
+
+# Global instance
+thumbnail_service = ThumbnailService()
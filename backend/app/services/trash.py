@@ -0,0 +1,340 @@
+import os
+import json
+import shutil
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlmodel import Session, select, delete, update, or_
+from app.models.database import TrashItem, User, engine
+from app.services.usage import usage_service
+from app.services.change_journal import change_journal_service
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Days an item stays in the trash before it is purged
+TRASH_RETENTION_DAYS = int(os.getenv("TRASH_RETENTION_DAYS", "30"))
+
+_DELETE_BATCH_SIZE = 500
+
+# Pending rows younger than this may still be mid-move and are left alone by recovery
+_PENDING_GRACE = timedelta(minutes=10)
+
+# An item that fails to purge is retried after 1, 2, 4, ... minutes, at most once a day
+_PURGE_RETRY_BASE = timedelta(minutes=1)
+_PURGE_RETRY_MAX = timedelta(days=1)
+
+def trash_dir_for(user_path: str) -> str:
+    return os.path.join(user_path, '.trash')
+
+class TrashCatalogService:
+    """
+    Database catalog of trashed items.
+
+    The bytes stay in <user>/.trash/<trash_id>; everything needed to list,
+    restore or expire an item lives in the trashitem table, so none of those
+    paths touch the trash folder. Legacy <trash_id>.meta sidecar files are
+    imported into the table once per user.
+
+    Trashing writes the row first as pending, moves the bytes, then
+    confirms the row, so a crash in between never leaves bytes in .trash
+    that no row accounts for. Pending rows are hidden from every lookup;
+    recover_pending settles the ones a crash left behind.
+    """
+
+    def __init__(self):
+        self._imported_users = set()
+
+    def add_item(
+        self,
+        storage_id: str,
+        trash_id: str,
+        context: str,
+        original_path: str,
+        original_name: str,
+        is_directory: bool,
+        size: int,
+        deleted_at: Optional[datetime] = None,
+        pending: bool = False
+    ) -> TrashItem:
+        deleted_at = deleted_at or datetime.now()
+        item = TrashItem(
+            storage_id=storage_id,
+            trash_id=trash_id,
+            context=context,
+            original_path=original_path,
+            original_name=original_name,
+            is_directory=is_directory,
+            size=size,
+            deleted_at=deleted_at,
+            expires_at=deleted_at + timedelta(days=TRASH_RETENTION_DAYS),
+            pending=pending
+        )
+        with Session(engine) as session:
+            session.add(item)
+            session.commit()
+            session.refresh(item)
+        return item
+
+    def confirm_item(self, storage_id: str, trash_id: str):
+        """Mark a pending item as fully moved into .trash"""
+        with Session(engine) as session:
+            session.exec(
+                update(TrashItem)
+                .where(TrashItem.storage_id == storage_id, TrashItem.trash_id == trash_id)
+                .values(pending=False)
+            )
+            session.commit()
+
+    def get_item(self, storage_id: str, trash_id: str) -> Optional[TrashItem]:
+        with Session(engine) as session:
+            return session.exec(
+                select(TrashItem).where(
+                    TrashItem.storage_id == storage_id,
+                    TrashItem.trash_id == trash_id,
+                    TrashItem.pending == False
+                )
+            ).first()
+
+    def list_items(self, storage_id: str, context: str) -> List[TrashItem]:
+        """Items of one context, most recently deleted first"""
+        with Session(engine) as session:
+            return session.exec(
+                select(TrashItem)
+                .where(
+                    TrashItem.storage_id == storage_id,
+                    TrashItem.context == context,
+                    TrashItem.pending == False
+                )
+                .order_by(TrashItem.deleted_at.desc())
+            ).all()
+
+    def expired_items(
+        self,
+        storage_id: Optional[str] = None,
+        now: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[TrashItem]:
+        """Items whose expiry has passed and that are not backing off after a failed purge, soonest first"""
+        now = now or datetime.now()
+        statement = select(TrashItem).where(
+            TrashItem.expires_at <= now,
+            TrashItem.pending == False,
+            or_(TrashItem.next_attempt_at == None, TrashItem.next_attempt_at <= now)
+        )
+        if storage_id is not None:
+            statement = statement.where(TrashItem.storage_id == storage_id)
+        statement = statement.order_by(TrashItem.expires_at)
+        if limit is not None:
+            statement = statement.limit(limit)
+        with Session(engine) as session:
+            return session.exec(statement).all()
+
+    def next_expiry(self) -> Optional[datetime]:
+        """When the next item becomes purgeable across all users (two index lookups)"""
+        with Session(engine) as session:
+            next_new = session.exec(
+                select(TrashItem.expires_at)
+                .where(TrashItem.pending == False, TrashItem.next_attempt_at == None)
+                .order_by(TrashItem.expires_at)
+                .limit(1)
+            ).first()
+            next_retry = session.exec(
+                select(TrashItem.next_attempt_at)
+                .where(TrashItem.pending == False, TrashItem.next_attempt_at != None)
+                .order_by(TrashItem.next_attempt_at)
+                .limit(1)
+            ).first()
+        candidates = [when for when in (next_new, next_retry) if when is not None]
+        return min(candidates) if candidates else None
+
+    def record_purge_failure(self, items: List[TrashItem]):
+        """Back off items that could not be purged so they stop blocking the rest"""
+        now = datetime.now()
+        with Session(engine) as session:
+            for item in items:
+                attempts = item.purge_attempts + 1
+                delay = min(_PURGE_RETRY_MAX, _PURGE_RETRY_BASE * (2 ** min(attempts - 1, 20)))
+                session.exec(
+                    update(TrashItem)
+                    .where(TrashItem.storage_id == item.storage_id, TrashItem.trash_id == item.trash_id)
+                    .values(purge_attempts=attempts, next_attempt_at=now + delay)
+                )
+            session.commit()
+
+    def remove_items(self, storage_id: str, trash_ids: List[str]):
+        for i in range(0, len(trash_ids), _DELETE_BATCH_SIZE):
+            with Session(engine) as session:
+                session.exec(
+                    delete(TrashItem).where(
+                        TrashItem.storage_id == storage_id,
+                        TrashItem.trash_id.in_(trash_ids[i:i + _DELETE_BATCH_SIZE])
+                    )
+                )
+                session.commit()
+
+    def remove_item(self, storage_id: str, trash_id: str):
+        self.remove_items(storage_id, [trash_id])
+
+    def recover_pending(self) -> int:
+        """
+        Settle items left pending by a crash between writing the row and
+        moving the bytes: confirm those whose bytes reached .trash and drop
+        the rest. The ledger and journal steps that followed the move may
+        not have run either, so affected users get a usage recompute.
+        """
+        from app.services.storage import storage_service
+
+        with Session(engine) as session:
+            stale = session.exec(
+                select(TrashItem).where(
+                    TrashItem.pending == True,
+                    TrashItem.deleted_at < datetime.now() - _PENDING_GRACE
+                )
+            ).all()
+            drive_ids = dict(session.exec(
+                select(User.storage_id, User.storage_drive_id)
+                .where(User.storage_id.in_({item.storage_id for item in stale}))
+            ).all()) if stale else {}
+
+        recovered_users = set()
+        for item in stale:
+            try:
+                user_path = storage_service.get_user_paths(item.storage_id, drive_ids.get(item.storage_id))['user_path']
+                if os.path.lexists(os.path.join(trash_dir_for(user_path), item.trash_id)):
+                    self.confirm_item(item.storage_id, item.trash_id)
+                else:
+                    self.remove_item(item.storage_id, item.trash_id)
+                recovered_users.add(item.storage_id)
+            except Exception as e:
+                logger.error(f"Failed to recover pending trash item {item.trash_id} for user {item.storage_id}: {str(e)}")
+
+        for storage_id in recovered_users:
+            try:
+                usage_service.recompute_user_usage(storage_id, drive_ids.get(storage_id))
+            except Exception as e:
+                logger.error(f"Failed to recompute usage for user {storage_id}: {str(e)}")
+
+        if stale:
+            logger.info(f"Recovered {len(stale)} pending trash items")
+        return len(stale)
+
+    def purge_items(self, storage_id: str, user_path: str, items: List[TrashItem]) -> Tuple[int, int]:
+        """Delete items from disk, the catalog and the usage ledger; returns (count, bytes)"""
+        trash_dir = trash_dir_for(user_path)
+        purged = []
+        failed = []
+        purged_bytes = 0
+        for item in items:
+            item_path = os.path.join(trash_dir, item.trash_id)
+            # One item at a time, so a ledger recompute never sees the bytes gone but not yet credited
+            with usage_service.changing(storage_id):
+                try:
+                    if os.path.isdir(item_path) and not os.path.islink(item_path):
+                        shutil.rmtree(item_path)
+                    elif os.path.lexists(item_path):
+                        os.remove(item_path)
+                except OSError as e:
+                    logger.error(f"Failed to delete trash item {item.trash_id} for user {storage_id}: {str(e)}")
+                    failed.append(item)
+                    continue
+                usage_service.record_change(storage_id, "trash", -item.size)
+            purged.append(item)
+            purged_bytes += item.size
+
+        if failed:
+            self.record_purge_failure(failed)
+
+        self.remove_items(storage_id, [item.trash_id for item in purged])
+        self.journal_deleted(storage_id, purged)
+        return len(purged), purged_bytes
+
+    def journal_deleted(self, storage_id: str, items: List[TrashItem]):
+        """Append permanently deleted items to the change journal"""
+        change_journal_service.record_many(storage_id, [
+            {
+                "context": item.context,
+                "action": "delete",
+                "path": item.original_path,
+                "is_directory": item.is_directory,
+                "trash_id": item.trash_id,
+            }
+            for item in items
+            # Orphaned trash bytes were never visible to clients
+            if item.context
+        ])
+
+    def to_response(self, item: TrashItem, now: Optional[datetime] = None) -> dict:
+        days_in_trash = ((now or datetime.now()) - item.deleted_at).days
+        return {
+            "trash_id": item.trash_id,
+            "original_name": item.original_name,
+            "original_path": item.original_path,
+            "context": item.context,
+            "is_directory": item.is_directory,
+            "size": item.size,
+            "deleted_at": item.deleted_at.isoformat(),
+            "days_in_trash": days_in_trash,
+            "expires_in_days": max(0, TRASH_RETENTION_DAYS - days_in_trash)
+        }
+
+    def import_meta_files(self, storage_id: str, user_path: str) -> int:
+        """Move legacy .meta sidecar files of one user into the catalog; returns rows added"""
+        trash_dir = trash_dir_for(user_path)
+        try:
+            names = os.listdir(trash_dir)
+        except OSError:
+            return 0
+
+        imported = 0
+        for name in names:
+            if not name.endswith('.meta'):
+                continue
+            metadata_file = os.path.join(trash_dir, name)
+            trash_id = name[:-len('.meta')]
+
+            if not os.path.lexists(os.path.join(trash_dir, trash_id)):
+                # The item itself is gone; the sidecar is just litter
+                os.remove(metadata_file)
+                continue
+
+            try:
+                with open(metadata_file, 'r') as f:
+                    metadata = json.load(f)
+                if self.get_item(storage_id, trash_id) is None:
+                    self.add_item(
+                        storage_id,
+                        trash_id,
+                        context=metadata['context'],
+                        original_path=metadata['original_path'],
+                        original_name=metadata['original_name'],
+                        is_directory=bool(metadata.get('is_directory', False)),
+                        size=int(metadata.get('size', 0)),
+                        deleted_at=datetime.fromisoformat(metadata['deleted_at'])
+                    )
+                    imported += 1
+            except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+                # Leave invalid sidecars in place for inspection
+                logger.warning(f"Skipping invalid trash metadata {metadata_file}: {str(e)}")
+                continue
+
+            os.remove(metadata_file)
+
+        if imported:
+            logger.info(f"Imported {imported} trash items for user {storage_id}")
+        return imported
+
+    def ensure_user_imported(self, storage_id: str, user_path: str):
+        """Import legacy .meta files the first time a user's trash is touched by this process"""
+        if storage_id in self._imported_users:
+            return
+        try:
+            self.import_meta_files(storage_id, user_path)
+            self._imported_users.add(storage_id)
+        except Exception as e:
+            logger.error(f"Failed to import trash metadata for user {storage_id}: {str(e)}")
+
+# Global instance
+trash_catalog_service = TrashCatalogService()
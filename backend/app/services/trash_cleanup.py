@@ -1,28 +1,68 @@
-import asyncio
+import os
 import schedule
-import time
 import threading
-import os
-import json
-import shutil
-from datetime import datetime, timedelta
-from app.models.database import get_session, User
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlmodel import Session, select
+from app.models.database import engine, TrashItem, User
 from app.services.storage import storage_service
+from app.services.trash import trash_catalog_service
+from app.services.fs_ops import RateLimiter
+from app.services.uploads import upload_service
+from app.services.blobs import blob_store
+from app.services.change_journal import change_journal_service
+from dotenv import load_dotenv
 import logging
 
+load_dotenv()
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Due items fetched from the catalog per pass
+TRASH_PURGE_BATCH_SIZE = int(os.getenv("TRASH_PURGE_BATCH_SIZE", "200"))
+# Ceiling on deleted items per second across all drives; 0 disables the limit
+TRASH_PURGE_MAX_ITEMS_PER_SECOND = float(os.getenv("TRASH_PURGE_MAX_ITEMS_PER_SECOND", "20"))
+# Drives purged at the same time; each drive is purged by one worker
+TRASH_PURGE_DRIVE_WORKERS = int(os.getenv("TRASH_PURGE_DRIVE_WORKERS", "4"))
+# Longest sleep between catalog checks when nothing is due
+TRASH_PURGE_POLL_SECONDS = float(os.getenv("TRASH_PURGE_POLL_SECONDS", "60"))
+
 class TrashCleanupService:
+    """
+    Purges trash items as they expire.
+
+    Works off the expires_at index of the trash catalog instead of crawling
+    every user's .trash folder: each pass fetches the items that are due,
+    groups them by drive and deletes each drive's share on its own worker,
+    under a global items-per-second ceiling. When nothing is due the loop
+    sleeps until the next expiry (or the poll interval, whichever is sooner).
+    Items that fail to purge back off exponentially, so a few stuck items
+    neither fill every batch nor make the loop spin.
+    """
+
     def __init__(self):
         self.is_running = False
         self.cleanup_thread = None
+        self._wake = threading.Event()
+        self._rate_limiter = RateLimiter(TRASH_PURGE_MAX_ITEMS_PER_SECOND)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "purged_items": 0,
+            "purged_bytes": 0,
+            "failed_items": 0,
+            "last_pass_at": None,
+            "next_expiry_at": None,
+        }
 
     def start_background_cleanup(self):
         """Start the background cleanup service"""
         if not self.is_running:
             self.is_running = True
+            self._wake.clear()
             self.cleanup_thread = threading.Thread(target=self._run_scheduler, daemon=True)
             self.cleanup_thread.start()
             logger.info("Trash cleanup service started")
@@ -30,84 +70,142 @@ class TrashCleanupService:
     def stop_background_cleanup(self):
         """Stop the background cleanup service"""
         self.is_running = False
+        self._wake.set()
         if self.cleanup_thread:
             self.cleanup_thread.join()
         logger.info("Trash cleanup service stopped")
 
     def _run_scheduler(self):
-        """Run the scheduler in a separate thread"""
-        # Schedule cleanup to run daily at 2 AM
-        schedule.every().day.at("02:00").do(self._cleanup_all_users_trash)
+        """Run the purge loop in a separate thread"""
+        # Drop resumable upload sessions that clients abandoned
+        schedule.every().hour.do(upload_service.cleanup_all_expired_sessions)
         
-        # Also run immediately on startup for testing
-        self._cleanup_all_users_trash()
-        
-        while self.is_running:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        # Drop deduplicated blobs that no user file links to any more
+        if blob_store.enabled:
+            schedule.every().hour.do(blob_store.collect_garbage)
 
-    def _cleanup_all_users_trash(self):
-        """Cleanup trash for all users"""
-        logger.info("Starting automatic trash cleanup for all users")
-        
+        # Drop change journal entries past their retention
+        schedule.every().hour.do(change_journal_service.prune)
+
+        # Settle trash rows a crash left half-written, now and from time to time
+        self._recover_pending()
+        schedule.every().hour.do(self._recover_pending)
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, TRASH_PURGE_DRIVE_WORKERS),
+            thread_name_prefix="trash-purge"
+        ) as executor:
+            while self.is_running:
+                schedule.run_pending()
+                try:
+                    purged = self._purge_due_items(executor)
+                except Exception as e:
+                    logger.error(f"Trash purge pass failed: {str(e)}")
+                    purged = 0
+
+                # A fully purged batch means more is probably due; go again right away
+                if purged >= TRASH_PURGE_BATCH_SIZE:
+                    continue
+                self._wake.wait(self._seconds_until_next_expiry())
+                self._wake.clear()
+
+    def _recover_pending(self):
+        try:
+            trash_catalog_service.recover_pending()
+        except Exception as e:
+            logger.error(f"Failed to recover pending trash items: {str(e)}")
+
+    def _seconds_until_next_expiry(self) -> float:
         try:
-            # Get all users from database
-            with next(get_session()) as session:
-                users = session.query(User).all()
-                
-                for user in users:
-                    try:
-                        self._cleanup_user_trash(user.storage_id)
-                    except Exception as e:
-                        logger.error(f"Failed to cleanup trash for user {user.storage_id}: {str(e)}")
-                        
+            next_expiry = trash_catalog_service.next_expiry()
         except Exception as e:
-            logger.error(f"Failed to get users for trash cleanup: {str(e)}")
+            logger.error(f"Failed to read next trash expiry: {str(e)}")
+            next_expiry = None
+
+        with self._stats_lock:
+            self._stats["next_expiry_at"] = next_expiry.isoformat() if next_expiry else None
+
+        if next_expiry is None:
+            return TRASH_PURGE_POLL_SECONDS
+        remaining = (next_expiry - datetime.now()).total_seconds()
+        return min(TRASH_PURGE_POLL_SECONDS, max(1.0, remaining))
+
+    def _drive_ids_for(self, storage_ids: List[str]) -> Dict[str, Optional[int]]:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(User.storage_id, User.storage_drive_id).where(User.storage_id.in_(storage_ids))
+            ).all()
+        return {storage_id: drive_id for storage_id, drive_id in rows}
+
+    def _purge_due_items(self, executor: ThreadPoolExecutor) -> int:
+        """Delete one batch of expired items; returns how many were deleted"""
+        due = trash_catalog_service.expired_items(limit=TRASH_PURGE_BATCH_SIZE)
+        with self._stats_lock:
+            self._stats["last_pass_at"] = datetime.now().isoformat()
+        if not due:
+            return 0
+
+        drive_ids = self._drive_ids_for(list({item.storage_id for item in due}))
+        by_drive: Dict[Optional[int], List[TrashItem]] = defaultdict(list)
+        for item in due:
+            by_drive[drive_ids.get(item.storage_id)].append(item)
+
+        futures = [
+            executor.submit(self._purge_drive_items, drive_id, items)
+            for drive_id, items in by_drive.items()
+        ]
+        return sum(future.result() for future in futures)
+
+    def _purge_drive_items(self, drive_id: Optional[int], items: List[TrashItem]) -> int:
+        """Delete expired items that live on one drive, one at a time"""
+        user_paths = {}
+        purged = 0
+        for item in items:
+            if not self.is_running:
+                break
+            try:
+                if item.storage_id not in user_paths:
+                    user_paths[item.storage_id] = storage_service.get_user_paths(item.storage_id, drive_id)['user_path']
+                self._rate_limiter.acquire()
+                deleted_count, deleted_bytes = trash_catalog_service.purge_items(
+                    item.storage_id, user_paths[item.storage_id], [item]
+                )
+            except Exception as e:
+                logger.error(f"Failed to purge trash item {item.trash_id} for user {item.storage_id}: {str(e)}")
+                deleted_count, deleted_bytes = 0, 0
+                try:
+                    trash_catalog_service.record_purge_failure([item])
+                except Exception as e:
+                    logger.error(f"Failed to back off trash item {item.trash_id}: {str(e)}")
+
+            with self._stats_lock:
+                if deleted_count:
+                    self._stats["purged_items"] += deleted_count
+                    self._stats["purged_bytes"] += deleted_bytes
+                else:
+                    self._stats["failed_items"] += 1
+            purged += deleted_count
+        return purged
 
     def _cleanup_user_trash(self, storage_id):
         """Cleanup trash for a specific user"""
         try:
             # Get user storage path
-            user_storage_path = storage_service.get_user_paths(storage_id)
-            trash_dir = os.path.join(user_storage_path['user_path'], '.trash')
-            
-            if not os.path.exists(trash_dir):
+            drive_id = self._drive_ids_for([storage_id]).get(storage_id)
+            user_storage_path = storage_service.get_user_paths(storage_id, drive_id)
+            trash_catalog_service.ensure_user_imported(storage_id, user_storage_path['user_path'])
+
+            expired = trash_catalog_service.expired_items(storage_id)
+            if not expired:
                 return
-            
-            deleted_count = 0
-            cutoff_date = datetime.now() - timedelta(days=30)
-            
-            for item in os.listdir(trash_dir):
-                if item.endswith('.meta'):
-                    continue
-                    
-                item_path = os.path.join(trash_dir, item)
-                metadata_file = f"{item_path}.meta"
-                
-                if os.path.exists(metadata_file):
-                    try:
-                        with open(metadata_file, 'r') as f:
-                            metadata = json.load(f)
-                        
-                        deleted_at = datetime.fromisoformat(metadata['deleted_at'])
-                        
-                        if deleted_at < cutoff_date:
-                            # Delete the item and its metadata
-                            if os.path.isfile(item_path):
-                                os.remove(item_path)
-                            elif os.path.isdir(item_path):
-                                shutil.rmtree(item_path)
-                            
-                            os.remove(metadata_file)
-                            deleted_count += 1
-                            
-                    except (json.JSONDecodeError, KeyError, ValueError):
-                        # Skip items with invalid metadata
-                        continue
-            
+
+            deleted_count, _ = trash_catalog_service.purge_items(
+                storage_id, user_storage_path['user_path'], expired
+            )
+
             if deleted_count > 0:
                 logger.info(f"Cleaned up {deleted_count} items for user {storage_id}")
-                
+
         except Exception as e:
             logger.error(f"Failed to cleanup trash for user {storage_id}: {str(e)}")
 
@@ -115,5 +213,14 @@ class TrashCleanupService:
         """Manually trigger cleanup for a specific user"""
         self._cleanup_user_trash(storage_id)
 
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "running": self.is_running,
+                "max_items_per_second": TRASH_PURGE_MAX_ITEMS_PER_SECOND,
+                "drive_workers": TRASH_PURGE_DRIVE_WORKERS,
+                **self._stats
+            }
+
 # Global instance
 trash_cleanup_service = TrashCleanupService()
@@ -0,0 +1,521 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from app.services.fs_ops import fs_ops, FS_WRITE_BUFFER_BYTES
+from app.services.blobs import blob_store, new_content_hasher, hash_file
+from app.services.integrity import integrity_service
+from app.services.usage import usage_service
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Resumable upload sessions with no activity for this long are discarded
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+# Session directory name under each user's storage root
+UPLOAD_SESSIONS_DIR = ".uploads"
+
+_SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+class QuotaExceededError(Exception):
+    """Raised when an upload would take the user over their storage quota"""
+
+class UploadSessionNotFoundError(Exception):
+    """Raised when a resumable upload session does not exist or has expired"""
+
+class UploadOffsetMismatchError(Exception):
+    """Raised when a chunk does not start at the session's current offset"""
+    def __init__(self, expected_offset: int):
+        super().__init__(f"Expected offset {expected_offset}")
+        self.expected_offset = expected_offset
+
+class UploadIncompleteError(Exception):
+    """Raised when finalizing a session that has not received all bytes"""
+
+def _write_hashed(buffer, hasher, data: bytes):
+    hasher.update(data)
+    buffer.write(data)
+
+class UploadService:
+    """Writes upload bodies straight into the user's storage directory"""
+
+    def __init__(self):
+        # One lock per session so chunks for different sessions are written in parallel
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        # Quota held by direct (non-session) uploads still being written, per user
+        self._request_reserved: Dict[str, int] = {}
+
+    def temp_file_path(self, target_dir: str) -> str:
+        """Hidden temp file in the destination directory so the final rename is atomic"""
+        return os.path.join(target_dir, f".upload-{uuid.uuid4().hex}.part")
+
+    def _claim_name(self, temp_path: str, target_file_path: str) -> bool:
+        """Move temp_path to target_file_path only if nothing exists there yet"""
+        try:
+            # link() fails if the name is taken, so concurrent uploads cannot both claim it
+            os.link(temp_path, target_file_path)
+        except FileExistsError:
+            return False
+        except OSError:
+            # Filesystems without hard links: reserve the name exclusively, then rename over it
+            try:
+                fd = os.open(target_file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+            os.close(fd)
+            os.replace(temp_path, target_file_path)
+            return True
+        os.unlink(temp_path)
+        return True
+
+    def reserve_request(
+        self,
+        storage_id: str,
+        size: int,
+        quota_bytes: int,
+        drive_id: Optional[int] = None
+    ) -> bool:
+        """
+        Hold size bytes of quota under "uploads" for a direct upload while it
+        is written; False if that does not fit. Give it back through
+        release_request, or hand it to commit_file to swap it for the file.
+        """
+        with usage_service.changing(storage_id):
+            if not usage_service.reserve(storage_id, "uploads", size, quota_bytes, drive_id):
+                return False
+            self._request_reserved[storage_id] = self._request_reserved.get(storage_id, 0) + size
+        return True
+
+    def release_request(self, storage_id: str, size: int):
+        """Give back quota held by reserve_request"""
+        if not size:
+            return
+
+        with usage_service.changing(storage_id):
+            usage_service.record_change(storage_id, "uploads", -size)
+            remaining = self._request_reserved.get(storage_id, 0) - size
+            if remaining > 0:
+                self._request_reserved[storage_id] = remaining
+            else:
+                self._request_reserved.pop(storage_id, None)
+
+    def commit_file(
+        self,
+        temp_path: str,
+        target_dir: str,
+        filename: str,
+        storage_id: Optional[str] = None,
+        context: Optional[str] = None,
+        on_commit: Optional[Callable[[str], None]] = None,
+        reserved: int = 0
+    ) -> Tuple[str, str]:
+        """
+        Atomically move a completed temp file to its final, non-clashing name.
+        With storage_id, its bytes are added to context in the usage ledger,
+        the reserved bytes (see reserve_request) are given back and on_commit
+        (e.g. cataloging it) runs with the final path, all in one
+        usage_service.changing() step, so neither a recompute nor a catalog
+        rescan can count the file a second time.
+        """
+        if storage_id is not None:
+            size = os.path.getsize(temp_path)
+            with usage_service.changing(storage_id):
+                committed = self.commit_file(temp_path, target_dir, filename)
+                self.release_request(storage_id, reserved)
+                usage_service.record_change(storage_id, context, size)
+                self._run_on_commit(on_commit, committed[0])
+            return committed
+
+        name, ext = os.path.splitext(filename)
+        candidate = filename
+        counter = 0
+        while not self._claim_name(temp_path, os.path.join(target_dir, candidate)):
+            counter += 1
+            candidate = f"{name}({counter}){ext}"
+        return os.path.join(target_dir, candidate), candidate
+
+    def _run_on_commit(self, on_commit: Optional[Callable[[str], None]], file_path: str):
+        if on_commit is None:
+            return
+        try:
+            on_commit(file_path)
+        except Exception as e:
+            # The file is in place and counted; the next catalog sync picks it up
+            logger.warning(f"Post-commit step failed for {file_path}: {str(e)}")
+
+    def store_content(self, file_path: str, digest: str, size: int):
+        """Deduplicate a finished upload (if enabled) and record its checksum"""
+        blob_store.adopt(file_path, digest, size)
+        integrity_service.record(file_path, digest)
+
+    async def write_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        target_dir: str,
+        filename: str,
+        storage_id: str,
+        context: str,
+        quota_bytes: int,
+        drive_id: Optional[int] = None,
+        expected_size: int = 0,
+        on_commit: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, str, int, str]:
+        """
+        Write an async byte stream to target_dir/filename via temp-then-rename,
+        hashing it on the way. Quota is reserved before bytes are written:
+        expected_size up front, then whatever arrives beyond it in write-buffer
+        steps, so concurrent uploads cannot spend the same headroom. Raises
+        QuotaExceededError as soon as a reservation does not fit. On commit the
+        reservation becomes the file's bytes in context and on_commit runs (see
+        commit_file); on failure it is given back. Returns
+        (final path, final filename, bytes written, hex digest).
+        """
+        if not await fs_ops.run("metadata", self.reserve_request, storage_id, expected_size, quota_bytes, drive_id):
+            raise QuotaExceededError()
+        reserved = expected_size
+
+        temp_path = self.temp_file_path(target_dir)
+        hasher = new_content_hasher()
+        written = 0
+
+        try:
+            await fs_ops.makedirs(target_dir)
+            buffer = await fs_ops.run("write", open, temp_path, "wb")
+            try:
+                pending = bytearray()
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    written += len(chunk)
+                    if written > reserved:
+                        reserved += await self._grow_reservation(
+                            storage_id, written - reserved, quota_bytes, drive_id
+                        )
+                    pending += chunk
+                    if len(pending) >= FS_WRITE_BUFFER_BYTES:
+                        await fs_ops.run("write", _write_hashed, buffer, hasher, bytes(pending))
+                        pending.clear()
+                if pending:
+                    await fs_ops.run("write", _write_hashed, buffer, hasher, bytes(pending))
+            finally:
+                await fs_ops.run("write", buffer.close)
+
+            target_file_path, filename = await fs_ops.run(
+                "write", self.commit_file, temp_path, target_dir, filename, storage_id, context, on_commit, reserved
+            )
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            await fs_ops.run("metadata", self.release_request, storage_id, reserved)
+            raise
+
+        digest = hasher.hexdigest()
+        await fs_ops.run("write", self.store_content, target_file_path, digest, written)
+        return target_file_path, filename, written, digest
+
+    async def _grow_reservation(
+        self,
+        storage_id: str,
+        shortfall: int,
+        quota_bytes: int,
+        drive_id: Optional[int]
+    ) -> int:
+        """Reserve at least shortfall more bytes, a write buffer ahead when that still fits"""
+        for size in (max(shortfall, FS_WRITE_BUFFER_BYTES), shortfall):
+            if await fs_ops.run("metadata", self.reserve_request, storage_id, size, quota_bytes, drive_id):
+                return size
+        raise QuotaExceededError()
+
+    # Resumable upload sessions
+
+    def _session_dir(self, user_path: str, upload_id: str) -> str:
+        if not _SESSION_ID_PATTERN.match(upload_id or ""):
+            raise UploadSessionNotFoundError()
+        return os.path.join(user_path, UPLOAD_SESSIONS_DIR, upload_id)
+
+    def _session_lock(self, upload_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(upload_id)
+        if lock is None:
+            lock = self._session_locks[upload_id] = asyncio.Lock()
+        return lock
+
+    def _with_progress(self, session: dict, session_dir: str) -> dict:
+        data_path = os.path.join(session_dir, "data.part")
+        stat_result = os.stat(data_path)
+        last_activity = datetime.fromtimestamp(stat_result.st_mtime)
+        return {
+            **session,
+            "offset": stat_result.st_size,
+            "expires_at": (last_activity + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)).isoformat()
+        }
+
+    def _release_reservation(self, session_dir: str) -> Optional[dict]:
+        """
+        Take ownership of a session's quota reservation and give it back.
+
+        Removing session.json is the claim: only one of cancel, expiry and
+        finalize can succeed, so a reservation is never released twice.
+        Returns the session, or None if another caller got there first.
+        """
+        session_file = os.path.join(session_dir, "session.json")
+        try:
+            with open(session_file, "r") as f:
+                session = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not session.get("reserved"):
+            try:
+                os.remove(session_file)
+            except OSError:
+                return None
+            return session
+
+        with usage_service.changing(session["storage_id"]):
+            try:
+                os.remove(session_file)
+            except OSError:
+                return None
+            usage_service.record_change(session["storage_id"], "uploads", -session["reserved"])
+        return session
+
+    def reserved_bytes(self, user_path: str, storage_id: Optional[str] = None) -> int:
+        """Quota held by a user's open sessions and direct uploads, for recomputing the ledger"""
+        reserved = self._request_reserved.get(storage_id, 0) if storage_id else 0
+        sessions_root = os.path.join(user_path, UPLOAD_SESSIONS_DIR)
+        if not os.path.isdir(sessions_root):
+            return reserved
+
+        cutoff = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+        for entry in os.scandir(sessions_root):
+            try:
+                if os.path.getmtime(os.path.join(entry.path, "data.part")) < cutoff:
+                    continue
+                with open(os.path.join(entry.path, "session.json"), "r") as f:
+                    reserved += json.load(f).get("reserved", 0)
+            except (OSError, json.JSONDecodeError):
+                pass
+        return reserved
+
+    def create_session(
+        self,
+        user_path: str,
+        storage_id: str,
+        context: str,
+        path: str,
+        filename: str,
+        size: int,
+        quota_bytes: int,
+        drive_id: Optional[int] = None
+    ) -> dict:
+        """
+        Create a resumable upload session stored under the user's storage root.
+        The declared size is reserved in the usage ledger until the session is
+        finalized, cancelled or expires; raises QuotaExceededError if it does not fit.
+        """
+        self.cleanup_expired_sessions(user_path)
+
+        with usage_service.changing(storage_id):
+            return self._create_session(user_path, storage_id, context, path, filename, size, quota_bytes, drive_id)
+
+    def _create_session(
+        self,
+        user_path: str,
+        storage_id: str,
+        context: str,
+        path: str,
+        filename: str,
+        size: int,
+        quota_bytes: int,
+        drive_id: Optional[int]
+    ) -> dict:
+        if not usage_service.reserve(storage_id, "uploads", size, quota_bytes, drive_id):
+            raise QuotaExceededError()
+
+        upload_id = uuid.uuid4().hex
+        session_dir = self._session_dir(user_path, upload_id)
+        session = {
+            "upload_id": upload_id,
+            "storage_id": storage_id,
+            "context": context,
+            "path": path,
+            "filename": filename,
+            "size": size,
+            "reserved": size,
+            "created_at": datetime.now().isoformat()
+        }
+        try:
+            os.makedirs(session_dir, exist_ok=True)
+            open(os.path.join(session_dir, "data.part"), "wb").close()
+            with open(os.path.join(session_dir, "session.json"), "w") as f:
+                json.dump(session, f)
+        except BaseException:
+            usage_service.record_change(storage_id, "uploads", -size)
+            shutil.rmtree(session_dir, ignore_errors=True)
+            raise
+
+        return self._with_progress(session, session_dir)
+
+    def get_session(self, user_path: str, upload_id: str) -> dict:
+        """Load a session along with its current offset; expired sessions are not found"""
+        session_dir = self._session_dir(user_path, upload_id)
+        try:
+            with open(os.path.join(session_dir, "session.json"), "r") as f:
+                session = json.load(f)
+            session = self._with_progress(session, session_dir)
+        except (OSError, json.JSONDecodeError, KeyError):
+            raise UploadSessionNotFoundError()
+        # The hourly sweep may not have removed it yet
+        if datetime.fromisoformat(session["expires_at"]) < datetime.now():
+            raise UploadSessionNotFoundError()
+        return session
+
+    async def append_chunk(
+        self,
+        user_path: str,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes]
+    ) -> int:
+        """Append a chunk that starts at offset; returns the new offset"""
+        async with self._session_lock(upload_id):
+            session = await fs_ops.run("metadata", self.get_session, user_path, upload_id)
+            if offset != session["offset"]:
+                raise UploadOffsetMismatchError(session["offset"])
+
+            data_path = os.path.join(self._session_dir(user_path, upload_id), "data.part")
+            remaining = session["size"] - offset
+            written = 0
+
+            buffer = await fs_ops.run("write", open, data_path, "ab")
+            pending = bytearray()
+            try:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if written + len(pending) + len(chunk) > remaining:
+                        raise QuotaExceededError()
+                    pending += chunk
+                    if len(pending) >= FS_WRITE_BUFFER_BYTES:
+                        await fs_ops.run("write", buffer.write, bytes(pending))
+                        written += len(pending)
+                        pending.clear()
+            finally:
+                # Keep whatever arrived intact so the client can resume from it
+                if pending:
+                    await fs_ops.run("write", buffer.write, bytes(pending))
+                    written += len(pending)
+                await fs_ops.run("write", buffer.close)
+
+            return offset + written
+
+    async def finalize_session(
+        self,
+        user_path: str,
+        storage_id: str,
+        upload_id: str,
+        target_dir: str,
+        on_hash_progress: Optional[Callable[[int], None]] = None,
+        on_commit: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, str, int, str]:
+        """
+        Move a completed upload into place, running on_commit with its path in
+        the same ledger step (see commit_file); returns (path, filename, size,
+        hex digest).
+        """
+        async with self._session_lock(upload_id):
+            session = await fs_ops.run("metadata", self.get_session, user_path, upload_id)
+            if session["offset"] != session["size"]:
+                raise UploadIncompleteError()
+
+            session_dir = self._session_dir(user_path, upload_id)
+            await fs_ops.makedirs(target_dir)
+            target_file_path, filename = await fs_ops.run(
+                "write", self._commit_session, storage_id, session, session_dir, target_dir, on_commit
+            )
+            await fs_ops.run("delete", shutil.rmtree, session_dir, ignore_errors=True)
+
+            # Chunks arrive across requests, so the content is hashed once at the end
+            digest = await fs_ops.run("scan", hash_file, target_file_path, on_hash_progress)
+            await fs_ops.run("write", self.store_content, target_file_path, digest, session["size"])
+
+        self._session_locks.pop(upload_id, None)
+        return target_file_path, filename, session["size"], digest
+
+    def _commit_session(
+        self,
+        storage_id: str,
+        session: dict,
+        session_dir: str,
+        target_dir: str,
+        on_commit: Optional[Callable[[str], None]]
+    ) -> Tuple[str, str]:
+        """Move a session's data into place, replacing its reservation with the file's own bytes"""
+        with usage_service.changing(storage_id):
+            committed = self.commit_file(os.path.join(session_dir, "data.part"), target_dir, session["filename"])
+            self._release_reservation(session_dir)
+            usage_service.record_change(storage_id, session["context"], session["size"])
+            self._run_on_commit(on_commit, committed[0])
+        return committed
+
+    def delete_session(self, user_path: str, upload_id: str):
+        """Cancel a session and discard the bytes received so far"""
+        session_dir = self._session_dir(user_path, upload_id)
+        if not os.path.isdir(session_dir):
+            raise UploadSessionNotFoundError()
+        self._release_reservation(session_dir)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        self._session_locks.pop(upload_id, None)
+
+    def cleanup_expired_sessions(self, user_path: str) -> int:
+        """Remove a user's sessions that have been idle longer than the TTL"""
+        sessions_root = os.path.join(user_path, UPLOAD_SESSIONS_DIR)
+        if not os.path.isdir(sessions_root):
+            return 0
+
+        cutoff = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+        removed = 0
+        for entry in os.scandir(sessions_root):
+            if not entry.is_dir():
+                continue
+            try:
+                last_activity = os.path.getmtime(os.path.join(entry.path, "data.part"))
+            except OSError:
+                last_activity = entry.stat().st_mtime
+            if last_activity < cutoff:
+                self._release_reservation(entry.path)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                self._session_locks.pop(entry.name, None)
+                removed += 1
+        return removed
+
+    def cleanup_all_expired_sessions(self):
+        """Sweep expired sessions for every user on every active drive"""
+        from app.services.storage import storage_service
+
+        removed = 0
+        for drive in storage_service.get_available_drives():
+            users_path = Path(drive.path) / "users"
+            if not users_path.exists():
+                continue
+            for user_dir in users_path.iterdir():
+                if user_dir.is_dir():
+                    try:
+                        removed += self.cleanup_expired_sessions(str(user_dir))
+                    except Exception as e:
+                        logger.error(f"Failed to cleanup upload sessions in {user_dir}: {str(e)}")
+
+        if removed > 0:
+            logger.info(f"Removed {removed} expired upload sessions")
+
+# Global instance
+upload_service = UploadService()
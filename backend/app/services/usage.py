@@ -0,0 +1,248 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, update
+from app.models.database import StorageUsage, engine
+from app.services.storage import storage_service
+
+# Contexts tracked by the ledger; the sum of all of them is the user's quota usage.
+# "uploads" holds the declared size of open resumable upload sessions.
+USAGE_CONTEXTS = ("drive", "photos", "trash", "uploads")
+
+# Trees parked under .trash by deletion jobs; their bytes were credited when the job was accepted
+_PURGING_DIR = ".purging"
+
+# Temp files of uploads and dedup links still being written; counted once they are renamed into place
+_IN_FLIGHT_FILE = re.compile(r"^\.(upload|blob)-[0-9a-f]{32}\.part$")
+
+# Walks that see a concurrent write are retried this often before writes are held off
+_RECOMPUTE_ATTEMPTS = 3
+
+class StorageUsageService:
+    """Per-user storage usage ledger kept in the database.
+
+    Write paths (upload, trash, restore, purge) apply byte deltas so quota checks
+    never have to walk the user's tree. The ledger is seeded from disk the first
+    time a user is looked up and can be recomputed on demand.
+
+    A write path changes the files and applies its delta inside changing(), and a
+    recompute only stores its walk if no such change completed while it ran, so
+    the ledger never holds a change both from the walk and from the delta.
+
+    Changes made outside the API reach the ledger as deltas from the catalog
+    sync. A recompute therefore takes the visible files of drive and photos
+    from the catalog rather than from its walk (only hidden files, which the
+    catalog skips, come from the walk): an external change the catalog has
+    not seen yet is then counted once, when the sync applies it.
+    """
+
+    def __init__(self):
+        self._locks_guard = threading.Lock()
+        self._locks: Dict[str, threading.RLock] = {}
+        self._versions: Dict[str, int] = {}
+
+    def _change_lock(self, storage_id: str) -> threading.RLock:
+        with self._locks_guard:
+            lock = self._locks.get(storage_id)
+            if lock is None:
+                lock = self._locks[storage_id] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def changing(self, storage_id: str):
+        """Hold while changing a user's files on disk and applying the matching ledger delta"""
+        with self._change_lock(storage_id):
+            try:
+                yield
+            finally:
+                self._versions[storage_id] = self._versions.get(storage_id, 0) + 1
+
+    def _context_paths(self, storage_id: str, drive_id: Optional[int] = None) -> Dict[str, str]:
+        paths = storage_service.get_user_paths(storage_id, drive_id)
+        return {
+            "drive": paths["drive_path"],
+            "photos": paths["photos_path"],
+            "trash": os.path.join(paths["user_path"], ".trash"),
+        }
+
+    def _directory_size(self, path: str, exclude: tuple = ()) -> Tuple[int, int]:
+        """(visible, hidden) bytes of all files below path, skipping the named top-level folders"""
+        visible = hidden = 0
+        for dirpath, dirnames, filenames in os.walk(path):
+            if dirpath == path:
+                dirnames[:] = [name for name in dirnames if name not in exclude]
+                in_hidden_dir = False
+            else:
+                in_hidden_dir = any(part.startswith('.') for part in os.path.relpath(dirpath, path).split(os.sep))
+            for filename in filenames:
+                if _IN_FLIGHT_FILE.match(filename):
+                    continue
+                try:
+                    size = os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                if in_hidden_dir or filename.startswith('.'):
+                    hidden += size
+                else:
+                    visible += size
+        return visible, hidden
+
+    def _measure(
+        self,
+        storage_id: str,
+        drive_id: Optional[int],
+        contexts: Iterable[str]
+    ) -> Dict[str, Tuple[int, int]]:
+        """(visible, hidden) bytes per context, from disk"""
+        from app.services.uploads import upload_service
+
+        paths = self._context_paths(storage_id, drive_id)
+        measured = {}
+        for context in contexts:
+            if context == "uploads":
+                measured[context] = (upload_service.reserved_bytes(
+                    storage_service.get_user_paths(storage_id, drive_id)["user_path"], storage_id
+                ), 0)
+            else:
+                measured[context] = self._directory_size(paths[context], (_PURGING_DIR,) if context == "trash" else ())
+        return measured
+
+    def _settle(self, storage_id: str, drive_id: Optional[int], measured: Dict[str, Tuple[int, int]]) -> Dict[str, int]:
+        """Ledger values for a walk; the caller holds the change lock so the catalog cannot move"""
+        from app.services.search_index import search_index_service
+
+        user_path = storage_service.get_user_paths(storage_id, drive_id)["user_path"]
+        usage = {}
+        for context, (visible, hidden) in measured.items():
+            if context in ("drive", "photos"):
+                cataloged = search_index_service.cataloged_bytes(user_path, context)
+                if cataloged is not None:
+                    visible = cataloged
+            usage[context] = visible + hidden
+        return usage
+
+    def _recompute(self, storage_id: str, drive_id: Optional[int], contexts: Iterable[str]) -> Dict[str, int]:
+        lock = self._change_lock(storage_id)
+        for _ in range(_RECOMPUTE_ATTEMPTS):
+            version = self._versions.get(storage_id, 0)
+            measured = self._measure(storage_id, drive_id, contexts)
+            with lock:
+                if self._versions.get(storage_id, 0) == version:
+                    return self._store(storage_id, self._settle(storage_id, drive_id, measured))
+        # Writes keep landing mid-walk; hold them off for one last walk
+        with lock:
+            measured = self._measure(storage_id, drive_id, contexts)
+            return self._store(storage_id, self._settle(storage_id, drive_id, measured))
+
+    def recompute_user_usage(self, storage_id: str, drive_id: Optional[int] = None) -> Dict[str, int]:
+        """Walk the user's storage on disk and overwrite the ledger rows"""
+        return self._recompute(storage_id, drive_id, USAGE_CONTEXTS)
+
+    def _store(self, storage_id: str, usage: Dict[str, int]) -> Dict[str, int]:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(StorageUsage).where(StorageUsage.storage_id == storage_id)
+            ).all()
+            existing = {row.context: row for row in rows}
+
+            for context, used_bytes in usage.items():
+                row = existing.get(context)
+                if row is None:
+                    row = StorageUsage(storage_id=storage_id, context=context)
+                row.used_bytes = used_bytes
+                row.updated_at = datetime.utcnow()
+                session.add(row)
+
+            try:
+                session.commit()
+            except IntegrityError:
+                # A concurrent first lookup seeded the same rows; use what it stored
+                session.rollback()
+                rows = session.exec(
+                    select(StorageUsage).where(StorageUsage.storage_id == storage_id)
+                ).all()
+                return {row.context: max(0, row.used_bytes) for row in rows}
+
+        return usage
+
+    def get_usage_breakdown(self, storage_id: str, drive_id: Optional[int] = None) -> Dict[str, int]:
+        """Get ledger usage per context, seeding the ledger from disk if needed"""
+        with Session(engine) as session:
+            rows = session.exec(
+                select(StorageUsage).where(StorageUsage.storage_id == storage_id)
+            ).all()
+
+        usage = {row.context: max(0, row.used_bytes) for row in rows}
+        if any(context not in usage for context in USAGE_CONTEXTS):
+            try:
+                return self.recompute_user_usage(storage_id, drive_id)
+            except Exception:
+                return {context: usage.get(context, 0) for context in USAGE_CONTEXTS}
+
+        return usage
+
+    def get_user_usage(self, storage_id: str, drive_id: Optional[int] = None) -> int:
+        """Get total bytes used by a user across all contexts"""
+        return sum(self.get_usage_breakdown(storage_id, drive_id).values())
+
+    def reserve(
+        self,
+        storage_id: str,
+        context: str,
+        size_bytes: int,
+        quota_bytes: int,
+        drive_id: Optional[int] = None
+    ) -> bool:
+        """Add bytes to a context unless that takes the user over quota"""
+        if not size_bytes:
+            return True
+
+        # Seed the ledger first so the delta is not dropped
+        self.get_usage_breakdown(storage_id, drive_id)
+        # Add, then check: concurrent reservations can never all fit into the same headroom
+        self.record_change(storage_id, context, size_bytes)
+        if self.get_user_usage(storage_id, drive_id) > quota_bytes:
+            self.record_change(storage_id, context, -size_bytes)
+            return False
+        return True
+
+    def record_change(self, storage_id: str, context: str, delta_bytes: int):
+        """Apply a byte delta to one context of a user's ledger"""
+        if not delta_bytes:
+            return
+
+        # Users that were never seeded are picked up by the next recompute instead
+        with Session(engine) as session:
+            session.exec(
+                update(StorageUsage)
+                .where(StorageUsage.storage_id == storage_id, StorageUsage.context == context)
+                .values(
+                    used_bytes=StorageUsage.used_bytes + int(delta_bytes),
+                    updated_at=datetime.utcnow()
+                )
+            )
+            session.commit()
+
+    def record_transfer(self, storage_id: str, from_context: str, to_context: str, size_bytes: int):
+        """Move bytes between two contexts (e.g. drive -> trash) in one transaction"""
+        if not size_bytes:
+            return
+
+        with Session(engine) as session:
+            for context, delta in ((from_context, -int(size_bytes)), (to_context, int(size_bytes))):
+                session.exec(
+                    update(StorageUsage)
+                    .where(StorageUsage.storage_id == storage_id, StorageUsage.context == context)
+                    .values(
+                        used_bytes=StorageUsage.used_bytes + delta,
+                        updated_at=datetime.utcnow()
+                    )
+                )
+            session.commit()
+
+# Global instance
+usage_service = StorageUsageService()
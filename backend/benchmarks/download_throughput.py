@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Download throughput benchmark
+
+Serves one large file through a local uvicorn server and compares:
+1. Starlette FileResponse (the original /files/download path)
+2. build_file_response in "stream" mode
+3. build_file_response in "sendfile" mode
+
+Proxy offload modes (x-accel-redirect / x-sendfile) need nginx or Apache in
+front of the API and are not measured here.
+
+Requires httpx (pip install httpx) in addition to the backend requirements.
+
+Usage:
+    python benchmarks/download_throughput.py [--size-mb 512] [--rounds 3]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(backend_dir))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse
+
+from app.services.file_delivery import build_file_response
+
+def create_app(file_path: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/fileresponse")
+    async def file_response():
+        return FileResponse(path=file_path, media_type="application/octet-stream")
+
+    @app.get("/stream")
+    async def stream(request: Request):
+        return build_file_response(request, file_path, "application/octet-stream", delivery_mode="stream")
+
+    @app.get("/sendfile")
+    async def sendfile(request: Request):
+        return build_file_response(request, file_path, "application/octet-stream", delivery_mode="sendfile")
+
+    return app
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure(url: str, rounds: int) -> float:
+    """Return the best throughput in MB/s over the given number of rounds"""
+    best = 0.0
+    with httpx.Client(timeout=None) as client:
+        for _ in range(rounds):
+            received = 0
+            started = time.perf_counter()
+            with client.stream("GET", url) as response:
+                response.raise_for_status()
+                for chunk in response.iter_raw(1024 * 1024):
+                    received += len(chunk)
+            elapsed = time.perf_counter() - started
+            best = max(best, received / (1024 * 1024) / elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare download throughput of file delivery modes")
+    parser.add_argument("--size-mb", type=int, default=512, help="Size of the test file in MB")
+    parser.add_argument("--rounds", type=int, default=3, help="Downloads per mode (best is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "payload.bin")
+        print(f"📝 Writing {args.size_mb} MB test file...")
+        with open(file_path, "wb") as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(create_app(file_path), host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        try:
+            print("=" * 50)
+            for mode in ("fileresponse", "stream", "sendfile"):
+                throughput = measure(f"http://127.0.0.1:{port}/{mode}", args.rounds)
+                print(f"{mode:<14} {throughput:10.1f} MB/s")
+            print("=" * 50)
+        finally:
+            server.should_exit = True
+            thread.join()
+
+if __name__ == "__main__":
+    main()
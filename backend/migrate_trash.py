@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+NAS Cloud Trash Catalog Migration Script
+
+Trash metadata used to live in <user>/.trash/<item>.meta sidecar JSON files.
+This script imports those files into the trashitem table for every user and
+removes each sidecar once its row exists. The server also imports a user's
+sidecars lazily the first time their trash is touched; running this script
+once after upgrading does the whole user base up front.
+
+Usage:
+    python migrate_trash.py
+"""
+
+import sys
+from pathlib import Path
+from sqlmodel import Session, select
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent
+sys.path.append(str(backend_dir))
+
+from app.models.database import create_db_and_tables, engine, User
+from app.services.storage import storage_service
+from app.services.trash import trash_catalog_service
+
+def migrate_trash() -> bool:
+    """Import legacy .meta files of all users into the trash catalog"""
+
+    print("🚀 Starting trash catalog migration...")
+    print("=" * 50)
+
+    try:
+        create_db_and_tables()
+    except Exception as e:
+        print(f"❌ Error creating database tables: {e}")
+        return False
+
+    with Session(engine) as session:
+        users = session.exec(select(User)).all()
+
+    print(f"👥 Found {len(users)} users")
+    total_imported = 0
+    failures = 0
+
+    for user in users:
+        try:
+            paths = storage_service.get_user_paths(user.storage_id, user.storage_drive_id)
+            imported = trash_catalog_service.import_meta_files(user.storage_id, paths['user_path'])
+            if imported:
+                print(f"   ✅ {user.email}: imported {imported} trash items")
+            total_imported += imported
+        except Exception as e:
+            failures += 1
+            print(f"   ❌ {user.email}: {e}")
+
+    print(f"\n📊 Imported {total_imported} trash items, {failures} users failed")
+    return failures == 0
+
+if __name__ == "__main__":
+    if not migrate_trash():
+        print("\n❌ Migration finished with errors. Please check the output above.")
+        sys.exit(1)
+    print("\n🎉 Migration completed successfully!")
@@ -0,0 +1,95 @@
+"""
+Change journal: per-user cursors must not skip changes when users share the journal
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+# Isolated database and storage root; must be set before the app modules are imported.
+# Test modules that were imported first may already have set one up; share it then.
+_temp_dir = tempfile.mkdtemp(prefix="nas-change-journal-")
+atexit.register(shutil.rmtree, _temp_dir, ignore_errors=True)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_temp_dir, 'test.db')}")
+os.environ.setdefault("NAS_STORAGE_PATH", os.path.join(_temp_dir, "nas"))
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(backend_dir))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.api.files import router as files_router
+from app.auth.auth import create_access_token
+from app.models.database import User, UserStatus, create_db_and_tables, engine
+from app.services.change_journal import change_journal_service
+
+USERS = {"journala0001": "journal-a@test.local", "journalb0001": "journal-b@test.local"}
+
+class InterleavedUsersCursorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        create_db_and_tables()
+        with Session(engine) as session:
+            for storage_id, email in USERS.items():
+                session.add(User(
+                    email=email,
+                    password_hash="x",
+                    firstname="Journal",
+                    lastname="Test",
+                    storage_id=storage_id,
+                    status=UserStatus.APPROVED,
+                ))
+            session.commit()
+
+        app = FastAPI()
+        app.include_router(files_router, prefix="/api")
+        cls.client = TestClient(app)
+
+    def _get(self, storage_id: str, **params) -> dict:
+        response = self.client.get(
+            "/api/files/changes",
+            params=params,
+            headers={"Authorization": f"Bearer {create_access_token({'sub': USERS[storage_id]})}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_each_cursor_returns_every_change_of_its_user(self):
+        cursors = {storage_id: self._get(storage_id)["cursor"] for storage_id in USERS}
+        written = {storage_id: [] for storage_id in USERS}
+        seen = {storage_id: [] for storage_id in USERS}
+
+        # Alternate writers so global ids and per-user sequence numbers drift apart,
+        # and read in small pages between writes like a syncing client would
+        for index in range(6):
+            for storage_id in USERS:
+                path = f"{storage_id}/file{index}.txt"
+                change_journal_service.record(storage_id, "drive", "create", path, size=index)
+                written[storage_id].append(path)
+
+                page = self._get(storage_id, cursor=cursors[storage_id], limit=1)
+                seen[storage_id].extend(change["path"] for change in page["changes"])
+                cursors[storage_id] = page["cursor"]
+
+        for storage_id in USERS:
+            while True:
+                page = self._get(storage_id, cursor=cursors[storage_id], limit=1)
+                seen[storage_id].extend(change["path"] for change in page["changes"])
+                cursors[storage_id] = page["cursor"]
+                if not page["has_more"]:
+                    break
+            self.assertEqual(seen[storage_id], written[storage_id])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+Trash purge: items that keep failing must not block the rest of the queue
+
+Run from the backend directory:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+# Isolated database and storage root; must be set before the app modules are imported.
+# Test modules that were imported first may already have set one up; share it then.
+_temp_dir = tempfile.mkdtemp(prefix="nas-trash-purge-")
+atexit.register(shutil.rmtree, _temp_dir, ignore_errors=True)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_temp_dir, 'test.db')}")
+os.environ.setdefault("NAS_STORAGE_PATH", os.path.join(_temp_dir, "nas"))
+os.environ["TRASH_PURGE_BATCH_SIZE"] = "2"
+os.environ["TRASH_PURGE_MAX_ITEMS_PER_SECOND"] = "0"
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(backend_dir))
+
+from sqlmodel import Session, select, delete
+
+from app.models.database import TrashItem, User, create_db_and_tables, engine
+from app.services.storage import storage_service
+from app.services.trash import trash_catalog_service, trash_dir_for
+from app.services.trash_cleanup import TrashCleanupService, TRASH_PURGE_BATCH_SIZE
+
+STORAGE_ID = "purgetest0001"
+
+class AlwaysFailingPurgeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        create_db_and_tables()
+        with Session(engine) as session:
+            session.add(User(
+                email="purge@test.local",
+                password_hash="x",
+                firstname="Purge",
+                lastname="Test",
+                storage_id=STORAGE_ID,
+            ))
+            session.commit()
+        cls.user_path = storage_service.get_user_paths(STORAGE_ID)["user_path"]
+
+    def setUp(self):
+        with Session(engine) as session:
+            session.exec(delete(TrashItem))
+            session.commit()
+        shutil.rmtree(trash_dir_for(self.user_path), ignore_errors=True)
+        os.makedirs(trash_dir_for(self.user_path))
+
+        self.service = TrashCleanupService()
+        self.service.is_running = True
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def _add_expired(self, trash_id: str, is_directory: bool, expired_hours_ago: float):
+        item_path = os.path.join(trash_dir_for(self.user_path), trash_id)
+        if is_directory:
+            os.makedirs(item_path)
+        else:
+            with open(item_path, "wb") as f:
+                f.write(b"x" * 10)
+        trash_catalog_service.add_item(
+            STORAGE_ID,
+            trash_id,
+            context="drive",
+            original_path=trash_id,
+            original_name=trash_id,
+            is_directory=is_directory,
+            size=10,
+            deleted_at=datetime.now() - timedelta(days=365, hours=expired_hours_ago)
+        )
+
+    def _items(self) -> dict:
+        with Session(engine) as session:
+            return {item.trash_id: item for item in session.exec(select(TrashItem)).all()}
+
+    def test_stuck_items_back_off_and_do_not_block_others(self):
+        # A full batch of items that can never be deleted, due before everything else
+        stuck = [f"stuck{index}" for index in range(TRASH_PURGE_BATCH_SIZE)]
+        for trash_id in stuck:
+            self._add_expired(trash_id, is_directory=True, expired_hours_ago=10)
+        healthy = [f"healthy{index}" for index in range(3)]
+        for trash_id in healthy:
+            self._add_expired(trash_id, is_directory=False, expired_hours_ago=1)
+
+        with mock.patch("app.services.trash.shutil.rmtree", side_effect=PermissionError("denied")):
+            for _ in range(5):
+                self.service._purge_due_items(self.executor)
+
+            items = self._items()
+            self.assertEqual(sorted(items), sorted(stuck))
+            for trash_id in stuck:
+                self.assertEqual(items[trash_id].purge_attempts, 1)
+                self.assertGreater(items[trash_id].next_attempt_at, datetime.now())
+
+            # Nothing is eligible until the first retry, so the loop must not spin
+            self.assertGreater(self.service._seconds_until_next_expiry(), 30)
+            self.assertEqual(self.service._purge_due_items(self.executor), 0)
+
+            # Once the back-off passes the item is retried, and the next delay doubles
+            with Session(engine) as session:
+                item = session.exec(select(TrashItem).where(TrashItem.trash_id == stuck[0])).one()
+                item.next_attempt_at = datetime.now() - timedelta(seconds=1)
+                session.add(item)
+                session.commit()
+            self.service._purge_due_items(self.executor)
+
+        retried = self._items()[stuck[0]]
+        self.assertEqual(retried.purge_attempts, 2)
+        self.assertGreater(retried.next_attempt_at, datetime.now() + timedelta(seconds=90))
+        self.assertEqual(self.service.get_stats()["purged_items"], len(healthy))
+
+    def test_item_purges_once_the_failure_clears(self):
+        self._add_expired("flaky", is_directory=True, expired_hours_ago=1)
+        with mock.patch("app.services.trash.shutil.rmtree", side_effect=OSError("drive offline")):
+            self.service._purge_due_items(self.executor)
+        self.assertIn("flaky", self._items())
+
+        with Session(engine) as session:
+            item = session.exec(select(TrashItem).where(TrashItem.trash_id == "flaky")).one()
+            item.next_attempt_at = datetime.now() - timedelta(seconds=1)
+            session.add(item)
+            session.commit()
+        self.assertEqual(self.service._purge_due_items(self.executor), 1)
+        self.assertEqual(self._items(), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -758,7 +758,7 @@ const Photos = () => {
                                     <div className="aspect-square relative">
                                       {getFileType(item.mimeType, item.name) === 'image' ? (
                                         <img
-                                          src={filesAPI.getViewUrl(item.name, 'photos')}
+                                          src={filesAPI.getThumbnailUrl(item.name, 'photos', 'medium', item.version)}
                                           alt={item.name}
                                           className="w-full h-full object-cover"
                                           loading="lazy"
@@ -835,7 +835,7 @@ const Photos = () => {
                                         {getFileType(item.mimeType, item.name) === 'image' ? (
                                           <div className="w-12 h-12 rounded overflow-hidden">
                                             <img
-                                              src={filesAPI.getViewUrl(item.name, 'photos')}
+                                              src={filesAPI.getThumbnailUrl(item.name, 'photos', 'small', item.version)}
                                               alt={item.name}
                                               className="w-full h-full object-cover"
                                               loading="lazy"
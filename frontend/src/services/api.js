@@ -59,7 +59,7 @@ export const authAPI = {
 };
 
 export const filesAPI = {
-  listFiles: (path = '', context = 'drive') => api.get('/files/list', { params: { path, context } }),
+  listFiles: (path = '', context = 'drive', options = {}) => api.get('/files/list', { params: { path, context, ...options } }),
   uploadFile: (formData, config = {}) => {
     return api.post('/files/upload', formData, {
       headers: {
@@ -68,6 +68,26 @@ export const filesAPI = {
       ...config
     });
   },
+  uploadFileStream: (file, path = '', context = 'drive', config = {}) => {
+    return api.post('/files/upload/stream', file, {
+      params: { filename: file.name, path, context },
+      headers: {
+        'Content-Type': 'application/octet-stream',
+      },
+      ...config
+    });
+  },
+  createUploadSession: (filename, size, path = '', context = 'drive') => api.post('/files/uploads', { filename, size, path, context }),
+  getUploadOffset: (uploadId) => api.head(`/files/uploads/${uploadId}`),
+  uploadChunk: (uploadId, offset, chunk, config = {}) => api.patch(`/files/uploads/${uploadId}`, chunk, {
+    headers: {
+      'Content-Type': 'application/offset+octet-stream',
+      'Upload-Offset': offset,
+    },
+    ...config
+  }),
+  finalizeUpload: (uploadId) => api.post(`/files/uploads/${uploadId}/finalize`),
+  cancelUpload: (uploadId) => api.delete(`/files/uploads/${uploadId}`),
   createFolder: (name, path = '', context = 'drive') => api.post('/files/create-folder', { name, path, context }),
   getStorageInfo: () => api.get('/files/storage-info'),
   viewFile: (filePath, context = 'drive') => api.get(`/files/view/${filePath}`, { 
@@ -82,8 +102,8 @@ export const filesAPI = {
     params: { context } 
   }),
   getRecentFiles: (limit = 10, context = 'drive') => api.get('/files/recent', { params: { limit, context } }),
-  searchFiles: (query, context = 'drive', fileType = null) => api.get('/files/search', { 
-    params: { query, context, file_type: fileType } 
+  searchFiles: (query, context = 'drive', fileType = null, limit = 100, offset = 0) => api.get('/files/search', { 
+    params: { query, context, file_type: fileType, limit, offset } 
   }),
   
   // Specific context shortcuts
@@ -103,11 +123,25 @@ export const filesAPI = {
     return `/api/files/view/${filePath}?context=${context}&token=${encodeURIComponent(token)}`;
   },
   
+  getThumbnailUrl: (filePath, context = 'photos', size = 'small', version = null) => {
+    const token = localStorage.getItem('access_token');
+    // Passing the file's version lets the browser cache the thumbnail as immutable
+    const versionParam = version ? `&v=${encodeURIComponent(version)}` : '';
+    return `/api/files/thumbnail/${filePath}?context=${context}&size=${size}${versionParam}&token=${encodeURIComponent(token)}`;
+  },
+  
   getDownloadUrl: (filePath, context = 'drive') => {
     const token = localStorage.getItem('access_token');
     // Don't encode the entire path, just the individual path segments if needed
     return `/api/files/download/${filePath}?context=${context}&token=${encodeURIComponent(token)}`;
   },
+  
+  getArchiveUrl: (paths, context = 'drive') => {
+    const token = localStorage.getItem('access_token');
+    // One ZIP for a folder or a multi-selection, streamed by the server
+    const pathParams = paths.map((path) => `paths=${encodeURIComponent(path)}`).join('&');
+    return `/api/files/archive?${pathParams}&context=${context}&token=${encodeURIComponent(token)}`;
+  },
 };
 
 export default api;